@@ -29,7 +29,15 @@ python manage.py collectstatic --no-input
 echo "--- Aplicando migraciones (migrate) ---"
 python manage.py migrate
 
-# 6. Crear Superusuario (tu script)
+# 5b. Reconstruir las tablas precalculadas (marcas y volumen) con las reglas actuales
+echo "--- Reconstruyendo resúmenes (reconstruir_resumenes) ---"
+python manage.py reconstruir_resumenes
+
+# 6. Crear la tabla de caché (solo se usa con CACHE_BACKEND=db; no hace nada si ya existe)
+echo "--- Creando tabla de caché (createcachetable) ---"
+python manage.py createcachetable
+
+# 7. Crear Superusuario (tu script)
 echo "--- Verificando superusuario ---"
 python manage.py shell -c "
 from django.contrib.auth import get_user_model
@@ -61,6 +61,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Carga el perfil junto con el usuario y lo deja en request.perfil
+    "core.middleware.PerfilMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -74,6 +76,9 @@ if DEBUG:
         "django_browser_reload.middleware.BrowserReloadMiddleware",
     )
 
+# Recupera el usuario de la sesión con su PerfilUsuario en la misma consulta
+AUTHENTICATION_BACKENDS = ["core.backends.PerfilModelBackend"]
+
 ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
@@ -104,6 +109,41 @@ if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
         DATABASES['default']['OPTIONS'] = {}
     DATABASES['default']['OPTIONS']['sslmode'] = 'require'
 
+# --- Caché ---
+# Backend configurable desde el entorno: 'db' (por defecto), 'file' o 'locmem'.
+# Con 'db' hay que crear la tabla una vez con: python manage.py createcachetable (lo hace build.sh).
+# Las versiones de caché (core/caching.py) las incrementan los procesos web y el trabajador
+# de tareas: 'locmem' es una caché por proceso, así que solo sirve con un único proceso.
+CACHE_BACKEND = env.str('CACHE_BACKEND', default='db')
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'notegym'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', env.str('CACHE_DIR', default=str(BASE_DIR / '.cache'))),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'notegym_cache'),
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': _CACHE_BACKENDS[CACHE_BACKEND][1],
+        # Las entradas de un atleta se invalidan por versión; el timeout solo limita datos huérfanos
+        'TIMEOUT': env.int('CACHE_TIMEOUT', default=60 * 60 * 24),
+        'OPTIONS': {
+            # Límite de entradas antes de expulsar (1/CULL_FREQUENCY de ellas)
+            'MAX_ENTRIES': env.int('CACHE_MAX_ENTRIES', default=5000),
+            'CULL_FREQUENCY': env.int('CACHE_CULL_FREQUENCY', default=3),
+        },
+    }
+}
+
+# --- Tareas en segundo plano ---
+# Las tareas pesadas se guardan en la tabla Tarea y las ejecuta 'python manage.py procesar_tareas'.
+# Con TAREAS_EN_LINEA=True se ejecutan en el propio proceso web (útil en desarrollo, sin trabajador).
+TAREAS_EN_LINEA = env.bool('TAREAS_EN_LINEA', default=False)
+# Días que se conservan las tareas terminadas antes de que los trabajadores las purguen
+TAREAS_RETENCION_DIAS = env.int('TAREAS_RETENCION_DIAS', default=7)
+# Días que se conservan las claves de idempotencia del registro de series (reintentos)
+IDEMPOTENCIA_RETENCION_DIAS = env.int('IDEMPOTENCIA_RETENCION_DIAS', default=30)
+
 # --- Configuración de Contraseñas ---
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -4,7 +4,7 @@ from django.urls import path, include
 from django.shortcuts import redirect
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
-from core.views import root_redirect 
+from core.views import root_redirect, service_worker_view
 from django.contrib.auth import views as auth_views
 from core.views import (
     RegistroUsuarioView,
@@ -15,9 +15,13 @@ from core.views import (
     EntrenamientoUpdateView,
     ConfigurarSeriesView,
     MisRutinasListView,
+    MisRutinasAPIView,
     RutinaEditarRegistroView,
+    RegistroSeriesAPIView,
+    SincronizarSeriesAPIView,
     MarcasPersonalesListView,
     ProgresionEjercicioDetailView,
+    ProgresionDatosView,
     AtletaProgresionMaxView,
     EjercicioCreateView,
     EntrenamientoDeleteView,
@@ -26,6 +30,12 @@ from core.views import (
     ActualizarOrdenEjerciciosView,
     EjercicioReactListView,MesocicloCreateView, 
     MesocicloDetailView, 
+    clonar_mesociclo_view,
+    AsignarProgramaAPIView,
+    guardar_plantilla_view,
+    PlantillaListView,
+    instanciar_plantilla_view,
+    TareaEstadoView,
     clonar_semana_view,
     
 )
@@ -39,6 +49,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("__reload__/", include("django_browser_reload.urls")),
     path('', root_redirect, name='root_redirect'),
+    path('sw.js', service_worker_view, name='service_worker'),
     path("login/",auth_views.LoginView.as_view(template_name="core/login.html",authentication_form=EmailOrUsernameLoginForm),name="login"),
     path("logout/", custom_logout_view, name="logout"),
     path("registro/", RegistroUsuarioView.as_view(), name="registro"),
@@ -70,9 +81,13 @@ urlpatterns = [
     # Sección del atleta
     # --------------------------------------------------------------------
     path("mis-rutinas/", MisRutinasListView.as_view(), name="mis_rutinas"),
+    path("api/mis-rutinas/", MisRutinasAPIView.as_view(), name="mis_rutinas_api"),
     path('rutina/<int:pk>/', RutinaEditarRegistroView.as_view(), name='detalle_rutina'),
+    path('rutina/<int:pk>/series/', RegistroSeriesAPIView.as_view(), name='registro_series'),
+    path('api/registro/sincronizar/', SincronizarSeriesAPIView.as_view(), name='sincronizar_series'),
     path("marcas-personales/", MarcasPersonalesListView.as_view(), name="marcas_personales"),
     path("progresion/<int:pk>/", ProgresionEjercicioDetailView.as_view(), name="progresion_ejercicio"),
+    path("progresion/<int:pk>/datos/", ProgresionDatosView.as_view(), name="progresion_datos"),
     path('mis-atletas/', ListaAtletasView.as_view(), name='lista_atletas'),
     path('entrenador/atleta/<int:pk>/records/', AtletaRecordDetailView.as_view(), name='atleta_record_detail'),
     path("progreso-maximo/<int:ejercicio_pk>/", AtletaProgresionMaxView.as_view(), name="progresion_maxima"),
@@ -82,6 +97,12 @@ urlpatterns = [
     path('mesociclo/crear/', MesocicloCreateView.as_view(), name='mesociclo_crear'),
     path('mesociclo/<int:pk>/', MesocicloDetailView.as_view(), name='mesociclo_detalle'),
     path('entrenamiento/<int:pk>/clonar/', clonar_semana_view, name='entrenamiento_clonar'),
+    path('mesociclo/<int:pk>/clonar/', clonar_mesociclo_view, name='mesociclo_clonar'),
+    path('mesociclo/asignar/', AsignarProgramaAPIView.as_view(), name='mesociclo_asignar'),
+    path('mesociclo/<int:pk>/guardar-plantilla/', guardar_plantilla_view, name='mesociclo_guardar_plantilla'),
+    path('plantillas/', PlantillaListView.as_view(), name='plantilla_lista'),
+    path('plantillas/<int:pk>/asignar/', instanciar_plantilla_view, name='plantilla_instanciar'),
+    path('tareas/<int:pk>/', TareaEstadoView.as_view(), name='tarea_estado'),
 
     # --------------------------------------------------------------------
     # Otros
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PerfilUsuario, Ejercicio, Entrenamiento, DetalleEntrenamiento, SerieEjercicio
+from .models import PerfilUsuario, Ejercicio, Entrenamiento, DetalleEntrenamiento, SerieEjercicio, MarcaPersonal, VolumenSemanal, PlantillaMesociclo, Tarea
 
 class AtletasAsignadosInline(admin.TabularInline):
     model = PerfilUsuario
@@ -70,4 +70,35 @@ class DetalleEntrenamientoAdmin(admin.ModelAdmin):
 class SerieEjercicioAdmin(admin.ModelAdmin):
     list_display = ("detalle_entrenamiento", "numero_serie", "repeticiones_o_rango", "peso_real", "repeticiones_reales")
     list_filter = ("detalle_entrenamiento",)
-    ordering = ("detalle_entrenamiento", "numero_serie")
\ No newline at end of file
+    ordering = ("detalle_entrenamiento", "numero_serie")
+
+
+@admin.register(MarcaPersonal)
+class MarcaPersonalAdmin(admin.ModelAdmin):
+    list_display = ("atleta", "ejercicio", "repeticiones", "peso", "fecha")
+    list_filter = ("ejercicio",)
+    search_fields = ("atleta__nombre", "ejercicio__nombre")
+    ordering = ("atleta", "ejercicio", "repeticiones")
+
+
+@admin.register(VolumenSemanal)
+class VolumenSemanalAdmin(admin.ModelAdmin):
+    list_display = ("atleta", "mesociclo", "semana", "ejercicio", "series_completadas", "series_prescritas", "tonelaje", "rpe_medio")
+    list_filter = ("mesociclo",)
+    search_fields = ("atleta__nombre", "ejercicio__nombre", "mesociclo__nombre")
+    ordering = ("mesociclo", "semana", "ejercicio")
+
+
+@admin.register(PlantillaMesociclo)
+class PlantillaMesocicloAdmin(admin.ModelAdmin):
+    list_display = ("nombre", "entrenador", "semanas_objetivo", "created_at")
+    search_fields = ("nombre", "entrenador__nombre")
+    ordering = ("-created_at",)
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ("id", "tipo", "estado", "intentos", "creado_por", "created_at", "terminada_en")
+    list_filter = ("estado", "tipo")
+    readonly_fields = ("bloqueada_por", "bloqueada_en", "hechos", "total", "resultado", "error", "created_at", "terminada_en")
+    ordering = ("-created_at",)
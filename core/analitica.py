@@ -0,0 +1,388 @@
+# core/analitica.py
+"""
+Motor vectorizado de 1RM estimado (e1RM) sobre el historial de series.
+
+Carga el historial de un atleta como arrays de NumPy (peso, repeticiones, RPE,
+fecha e id de ejercicio) y calcula el e1RM de todas las series en una sola
+pasada, sin bucles por fila ni aritmética Decimal.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+
+# ----------------------------------------------------------------------
+# TABLA RPE (porcentaje del 1RM)
+# ----------------------------------------------------------------------
+# Porcentaje del 1RM indexado por "repeticiones hasta el fallo": reps + (10 - RPE).
+# Ej: 5 reps a RPE 8 equivalen a 7 reps a RPE 10. Valores de la tabla RTS en pasos de 0,5.
+_RPE_REPS_FALLO = np.arange(1, 12.5, 0.5)
+_RPE_PORCENTAJE = np.array([
+    1.000, 0.978, 0.955, 0.939, 0.922, 0.907, 0.892, 0.878, 0.863, 0.850, 0.837, 0.824,
+    0.811, 0.799, 0.786, 0.774, 0.762, 0.751, 0.739, 0.723, 0.707, 0.694, 0.680,
+])
+
+
+def _epley(peso, reps, rpe):
+    return np.where(reps == 1, peso, peso * (1 + reps / 30))
+
+
+def _brzycki(peso, reps, rpe):
+    # La fórmula no está definida a partir de 37 repeticiones
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(reps < 37, peso * 36 / (37 - reps), np.nan)
+
+
+def _tabla_rpe(peso, reps, rpe):
+    """
+    e1RM = peso / %1RM según la tabla RPE. Las series sin RPE o fuera de la
+    tabla (más de 12 repeticiones hasta el fallo) se estiman con Epley.
+    """
+    reps_fallo = reps + (10 - rpe)
+    en_tabla = ~np.isnan(rpe) & (reps_fallo >= 1) & (reps_fallo <= _RPE_REPS_FALLO[-1])
+    porcentaje = np.interp(np.nan_to_num(reps_fallo, nan=1.0), _RPE_REPS_FALLO, _RPE_PORCENTAJE)
+    return np.where(en_tabla, peso / porcentaje, _epley(peso, reps, rpe))
+
+
+FORMULAS_E1RM = {
+    'epley': _epley,
+    'brzycki': _brzycki,
+    'rpe': _tabla_rpe,
+}
+
+
+def estimar_1rm(peso, reps, rpe=None, formula='epley'):
+    """
+    Calcula el 1RM estimado de muchas series a la vez.
+
+    Args:
+        peso (array-like): Pesos levantados (kg).
+        reps (array-like): Repeticiones realizadas.
+        rpe (array-like | None): RPE real de cada serie (NaN si no se registró).
+        formula (str): 'epley', 'brzycki' o 'rpe'.
+
+    Returns:
+        np.ndarray: e1RM de cada serie (float64).
+    """
+    if formula not in FORMULAS_E1RM:
+        raise ValueError(f"Fórmula de e1RM desconocida: '{formula}'. Opciones: {', '.join(FORMULAS_E1RM)}.")
+
+    peso = np.asarray(peso, dtype=np.float64)
+    reps = np.asarray(reps, dtype=np.float64)
+    rpe = np.full(peso.shape, np.nan) if rpe is None else np.asarray(rpe, dtype=np.float64)
+    return FORMULAS_E1RM[formula](peso, reps, rpe)
+
+
+# ----------------------------------------------------------------------
+# HISTORIAL COMO ARRAYS
+# ----------------------------------------------------------------------
+class HistorialSeries:
+    """
+    Historial de series válidas de un atleta en formato columnar.
+
+    Atributos (arrays de igual longitud):
+        peso (float64), reps (float64), rpe (float64, NaN si falta),
+        fecha (datetime64[s] del entrenamiento), ejercicio (int64),
+        entrenamiento (int64, sesión a la que pertenece la serie).
+    """
+
+    def __init__(self, peso, reps, rpe, fecha, ejercicio, entrenamiento):
+        self.peso = peso
+        self.reps = reps
+        self.rpe = rpe
+        self.fecha = fecha
+        self.ejercicio = ejercicio
+        self.entrenamiento = entrenamiento
+
+    def __len__(self):
+        return len(self.peso)
+
+    @classmethod
+    def desde_filas(cls, filas):
+        """
+        Construye el historial a partir de tuplas
+        (peso, reps, rpe, fecha, ejercicio_id, entrenamiento_id).
+        """
+        filas = list(filas)
+        if not filas:
+            vacio = np.empty(0, dtype=np.float64)
+            ids = np.empty(0, dtype=np.int64)
+            return cls(vacio, vacio, vacio, np.empty(0, dtype='datetime64[s]'), ids, ids)
+
+        peso, reps, rpe, fecha, ejercicio, entrenamiento = zip(*filas)
+
+        # Todas las series de un mismo entrenamiento comparten fecha: se convierte una vez por entrenamiento
+        segundos = {}
+        for f in fecha:
+            if f not in segundos:
+                segundos[f] = int(f.timestamp())
+
+        return cls(
+            peso=np.array(peso, dtype=np.float64),
+            reps=np.array(reps, dtype=np.float64),
+            rpe=np.array(rpe, dtype=np.float64),  # None -> NaN
+            fecha=np.array([segundos[f] for f in fecha], dtype='datetime64[s]'),
+            ejercicio=np.array(ejercicio, dtype=np.int64),
+            entrenamiento=np.array(entrenamiento, dtype=np.int64),
+        )
+
+    @classmethod
+    def cargar(cls, atleta, ejercicio=None, solo_sin_mesociclo=False):
+        """
+        Carga desde la base de datos las series válidas del atleta (opcionalmente de un
+        ejercicio, o solo las de entrenamientos sueltos, fuera de un mesociclo).
+        """
+        from .models import fecha_sesion
+        from .services import series_validas_para_marcas
+
+        series = series_validas_para_marcas().filter(detalle_entrenamiento__entrenamiento__atleta=atleta)
+        if ejercicio is not None:
+            series = series.filter(detalle_entrenamiento__ejercicio=ejercicio)
+        if solo_sin_mesociclo:
+            series = series.filter(detalle_entrenamiento__entrenamiento__mesociclo__isnull=True)
+
+        # Los decimales se convierten a float en la propia consulta para no crear objetos Decimal
+        return cls.desde_filas(series.order_by().values_list(
+            Cast('peso_real', FloatField()),
+            'repeticiones_reales',
+            Cast('rpe_real', FloatField()),
+            fecha_sesion(),
+            'detalle_entrenamiento__ejercicio_id',
+            'detalle_entrenamiento__entrenamiento_id',
+        ).iterator(chunk_size=5000))
+
+    def e1rm(self, formula='epley'):
+        """e1RM de cada serie del historial."""
+        return estimar_1rm(self.peso, self.reps, self.rpe, formula)
+
+    def mejor_e1rm_por_ejercicio(self, formula='epley'):
+        """
+        Returns:
+            dict: ejercicio_id -> mejor e1RM (float).
+        """
+        if not len(self):
+            return {}
+        ejercicios, mejores = _maximo_por_grupo(self.ejercicio, self.e1rm(formula))
+        return {int(e): float(m) for e, m in zip(ejercicios, mejores) if np.isfinite(m)}
+
+    def mejor_e1rm_por_semana(self, formula='epley'):
+        """
+        Mejor e1RM por ejercicio y semana (semanas de lunes a domingo).
+
+        Returns:
+            list: Tuplas (ejercicio_id, lunes de la semana (date), mejor e1RM), ordenadas.
+        """
+        if not len(self):
+            return []
+        # Días desde 1970-01-01 (jueves) -> índice del lunes de cada semana
+        dias = self.fecha.astype('datetime64[D]').astype(np.int64)
+        lunes = dias - (dias + 3) % 7
+
+        # Clave combinada (ejercicio, semana) en un único entero para agrupar con un solo sort
+        claves, mejores = _maximo_por_grupo(self.ejercicio * _DIAS_POR_EJERCICIO + lunes, self.e1rm(formula))
+
+        epoca = date(1970, 1, 1)
+        return [
+            (int(clave // _DIAS_POR_EJERCICIO), epoca + timedelta(days=int(clave % _DIAS_POR_EJERCICIO)), float(mejor))
+            for clave, mejor in zip(claves, mejores)
+            if np.isfinite(mejor)
+        ]
+
+    def progresion_por_sesion(self, formula='epley'):
+        """
+        Serie temporal por sesión (entrenamiento): mejor serie, e1RM y tonelaje.
+        Pensada para el historial de UN ejercicio (ver HistorialSeries.cargar).
+
+        Las series sin e1RM finito (Brzycki a partir de 37 repeticiones) no se tienen
+        en cuenta: NaN no es JSON válido y no se puede dibujar.
+
+        Returns:
+            dict de arrays ordenados por fecha: 'fecha' (datetime64[s]), 'top' (peso de la
+            mejor serie), 'reps' (repeticiones de esa serie), 'e1rm' y 'tonelaje' (peso × reps).
+        """
+        e1rm = self.e1rm(formula)
+        validas = np.flatnonzero(np.isfinite(e1rm))
+        if not len(validas):
+            return _progresion_vacia()
+
+        # Orden: fecha, sesión, peso, reps -> la última fila de cada sesión es su mejor serie
+        orden = validas[np.lexsort((
+            self.reps[validas], self.peso[validas], self.entrenamiento[validas], self.fecha[validas]
+        ))]
+        sesion = self.entrenamiento[orden]
+        inicios = np.flatnonzero(np.r_[True, sesion[1:] != sesion[:-1]])
+        finales = np.r_[inicios[1:], len(orden)] - 1
+
+        return {
+            'fecha': self.fecha[orden][inicios],
+            'top': self.peso[orden][finales],
+            'reps': self.reps[orden][finales],
+            'e1rm': np.fmax.reduceat(e1rm[orden], inicios),
+            'tonelaje': np.add.reduceat((self.peso * self.reps)[orden], inicios),
+        }
+
+
+def calcular_progresion(atleta, ejercicio, formula='epley'):
+    """
+    Progresión por sesión de un atleta en un ejercicio, calculada desde sus series.
+    Es lo que se guarda en la caché versionada del atleta, de modo que las
+    consultas por rango de fechas se sirven sin volver a leer las series.
+    """
+    return HistorialSeries.cargar(atleta, ejercicio).progresion_por_sesion(formula)
+
+
+def fechas_de_sesiones(atleta, ejercicio):
+    """
+    Fecha de cada sesión con series válidas del ejercicio (una fila por entrenamiento,
+    no por serie). Sirve para decidir la resolución sin cargar la progresión.
+    """
+    from .models import fecha_sesion
+    from .services import series_validas_para_marcas
+
+    fechas = series_validas_para_marcas().filter(
+        detalle_entrenamiento__entrenamiento__atleta=atleta, detalle_entrenamiento__ejercicio=ejercicio
+    ).order_by().values_list(fecha_sesion(), flat=True).distinct()
+    return {'fecha': np.array(sorted(int(f.timestamp()) for f in fechas), dtype='datetime64[s]')}
+
+
+def calcular_progresion_semanal(atleta, ejercicio, formula='epley'):
+    """
+    Progresión semanal (lunes a domingo) de un atleta en un ejercicio.
+
+    Con Epley se lee del resumen precalculado de VolumenSemanal (una fila por semana
+    de mesociclo, sin recorrer las series) y solo se cargan las series de los
+    entrenamientos sueltos, que no tienen resumen. Con otras fórmulas se agrupa la
+    progresión por sesión.
+    """
+    if formula != 'epley':
+        return agrupar_progresion_semanal(calcular_progresion(atleta, ejercicio, formula))
+
+    from .models import VolumenSemanal
+
+    resumenes = list(VolumenSemanal.objects.filter(
+        atleta=atleta, ejercicio=ejercicio, e1rm_maximo__isnull=False
+    ).order_by().values_list(
+        'fecha',
+        Cast('peso_maximo', FloatField()),
+        'repeticiones_peso_maximo',
+        Cast('e1rm_maximo', FloatField()),
+        Cast('tonelaje', FloatField()),
+    ))
+    sueltas = HistorialSeries.cargar(atleta, ejercicio, solo_sin_mesociclo=True).progresion_por_sesion(formula)
+    if not resumenes:
+        return agrupar_progresion_semanal(sueltas)
+
+    fecha, top, reps, e1rm, tonelaje = zip(*resumenes)
+    partes = [{
+        'fecha': np.array([int(f.timestamp()) for f in fecha], dtype='datetime64[s]'),
+        'top': np.array(top, dtype=np.float64),
+        'reps': np.array(reps, dtype=np.float64),
+        'e1rm': np.array(e1rm, dtype=np.float64),
+        'tonelaje': np.array(tonelaje, dtype=np.float64),
+    }, sueltas]
+
+    # Cada semana de mesociclo cuenta como una sesión fechada en su primer entrenamiento
+    unidas = {clave: np.concatenate([parte[clave] for parte in partes]) for clave in partes[0]}
+    orden = np.argsort(unidas['fecha'], kind='stable')
+    return agrupar_progresion_semanal({clave: valores[orden] for clave, valores in unidas.items()})
+
+
+def _progresion_vacia():
+    vacio = np.empty(0, dtype=np.float64)
+    return {'fecha': np.empty(0, dtype='datetime64[s]'), 'top': vacio, 'reps': vacio, 'e1rm': vacio, 'tonelaje': vacio}
+
+
+def agrupar_progresion_semanal(progresion):
+    """
+    Resumen semanal (lunes a domingo) de una progresión por sesión: mejor serie y
+    e1RM máximos de la semana y tonelaje acumulado. La fecha de cada punto es el lunes.
+    """
+    if not len(progresion['fecha']):
+        return _progresion_vacia()
+
+    dias = progresion['fecha'].astype('datetime64[D]').astype(np.int64)
+    lunes = dias - (dias + 3) % 7
+
+    # Las sesiones ya vienen por fecha; dentro de cada semana se ordena por peso y reps
+    orden = np.lexsort((progresion['reps'], progresion['top'], lunes))
+    semana = lunes[orden]
+    inicios = np.flatnonzero(np.r_[True, semana[1:] != semana[:-1]])
+    finales = np.r_[inicios[1:], len(orden)] - 1
+
+    return {
+        'fecha': semana[inicios].astype('datetime64[D]').astype('datetime64[s]'),
+        'top': progresion['top'][orden][finales],
+        'reps': progresion['reps'][orden][finales],
+        'e1rm': np.fmax.reduceat(progresion['e1rm'][orden], inicios),
+        'tonelaje': np.add.reduceat(progresion['tonelaje'][orden], inicios),
+    }
+
+
+def filtrar_progresion(progresion, desde=None, hasta=None):
+    """Recorta una progresión al rango de fechas [desde, hasta] (ambos inclusive, tipo date)."""
+    dias = progresion['fecha'].astype('datetime64[D]')
+    mascara = np.ones(len(dias), dtype=bool)
+    if desde is not None:
+        mascara &= dias >= np.datetime64(desde, 'D')
+    if hasta is not None:
+        mascara &= dias <= np.datetime64(hasta, 'D')
+    return {clave: valores[mascara] for clave, valores in progresion.items()}
+
+
+def lttb(x, y, puntos):
+    """
+    Largest-Triangle-Three-Buckets: elige 'puntos' índices de la serie (x, y)
+    conservando su forma visual. Siempre incluye el primer y el último punto.
+
+    Returns:
+        np.ndarray: Índices seleccionados, en orden creciente.
+    """
+    n = len(x)
+    if puntos >= n:
+        return np.arange(n)
+    if puntos < 3:
+        return np.array([0, n - 1][:max(puntos, 0)], dtype=np.int64)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    tamano = (n - 2) / (puntos - 2)
+
+    indices = np.empty(puntos, dtype=np.int64)
+    indices[0] = 0
+    a = 0
+    for i in range(puntos - 2):
+        inicio = int(i * tamano) + 1
+        fin = int((i + 1) * tamano) + 1
+
+        # Punto medio del cubo siguiente (el último punto si es el último cubo)
+        siguiente_fin = min(int((i + 2) * tamano) + 1, n)
+        if fin >= siguiente_fin:
+            media_x, media_y = x[n - 1], y[n - 1]
+        else:
+            media_x, media_y = x[fin:siguiente_fin].mean(), y[fin:siguiente_fin].mean()
+
+        # Punto del cubo actual que forma el triángulo de mayor área con 'a' y la media
+        areas = np.abs(
+            (x[a] - media_x) * (y[inicio:fin] - y[a]) - (x[a] - x[inicio:fin]) * (media_y - y[a])
+        )
+        a = inicio + int(np.argmax(areas))
+        indices[i + 1] = a
+
+    indices[-1] = n - 1
+    return indices
+
+
+# Rango de días reservado a cada ejercicio en la clave combinada (cubre hasta el año 2243)
+_DIAS_POR_EJERCICIO = 100_000
+
+
+def _maximo_por_grupo(claves, valores):
+    """
+    Máximo de 'valores' por cada clave distinta (ignorando NaN), ordenado por clave.
+    Ordena una vez y reduce cada tramo con fmax.reduceat.
+    """
+    orden = np.argsort(claves, kind='stable')
+    claves_unicas, inicios = np.unique(claves[orden], return_index=True)
+    return claves_unicas, np.fmax.reduceat(valores[orden], inicios)
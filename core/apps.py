@@ -6,4 +6,5 @@ class CoreConfig(AppConfig):
     name = "core"
 
     def ready(self):
+        import core.caching  # registra la comprobación de caché compartida
         import core.signals
@@ -0,0 +1,66 @@
+# core/backends.py
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Value
+from django.db.models.functions import Upper
+
+UserModel = get_user_model()
+
+
+class PerfilModelBackend(ModelBackend):
+    """
+    ModelBackend que recupera el usuario de la sesión junto con su PerfilUsuario
+    en una sola consulta (JOIN). Así request.user.perfil no cuesta una consulta más
+    en cada vista (ver core/middleware.py).
+
+    Para iniciar sesión acepta el username, el email o el nombre del perfil: el
+    identificador se resuelve primero a un único usuario y la contraseña se
+    comprueba UNA sola vez (el hash es lo caro del login).
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        user = self.usuario_por_identificador(username)
+        if user is None:
+            # Mismo coste que con un usuario existente: el tiempo de respuesta no
+            # revela si el identificador existe (igual que ModelBackend)
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def usuario_por_identificador(self, identificador):
+        """
+        Usuario al que corresponde lo escrito en el login, por orden de prioridad:
+        username exacto, email del perfil y nombre del perfil (sin distinguir
+        mayúsculas; el nombre solo si no hay otro perfil con el mismo). Cada paso es
+        una búsqueda por índice (ver los índices de PerfilUsuario).
+
+        Returns:
+            User | None
+        """
+        usuarios = UserModel._default_manager.select_related('perfil')
+        try:
+            return usuarios.get(**{UserModel.USERNAME_FIELD: identificador})
+        except UserModel.DoesNotExist:
+            pass
+
+        clave = Upper(Value(identificador))
+        usuario = usuarios.alias(email_perfil=Upper('perfil__email')).filter(email_perfil=clave).first()
+        if usuario is not None:
+            return usuario
+
+        por_nombre = list(usuarios.alias(nombre_perfil=Upper('perfil__nombre')).filter(nombre_perfil=clave)[:2])
+        return por_nombre[0] if len(por_nombre) == 1 else None
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related('perfil').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
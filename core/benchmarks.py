@@ -0,0 +1,287 @@
+# core/benchmarks.py
+"""
+Micro-benchmarks de las partes críticas de rendimiento.
+Se ejecutan con: python manage.py benchmark <nombre>
+Cada benchmark recibe una función 'escribir' para mostrar resultados por consola.
+"""
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from .analitica import HistorialSeries
+from .marcas import estimar_1rm_epley, frontera_no_dominada, frontera_no_dominada_referencia
+
+
+def generar_records_aleatorios(n, semilla=None):
+    """Genera n récords aleatorios con la forma que usa get_marcas_personales."""
+    rnd = random.Random(semilla)
+    return [
+        {
+            'peso': Decimal(rnd.randint(40, 1000)) / 4,
+            'repeticiones': rnd.randint(1, max(1, n // 2)),
+        }
+        for _ in range(n)
+    ]
+
+
+def generar_frontera_completa(n):
+    """Peor caso de la versión O(n²): ningún récord está dominado."""
+    return [{'peso': Decimal(1000 - i) / 4, 'repeticiones': i + 1} for i in range(n)]
+
+
+def _medir(funcion, repeticiones=3):
+    """Mejor tiempo (en segundos) de varias ejecuciones."""
+    return min(timeit.repeat(funcion, number=1, repeat=repeticiones))
+
+
+def benchmark_frontera(escribir):
+    """Compara el filtro de récords no dominados O(n²) con el barrido O(n log n)."""
+    casos = (
+        ('aleatorio', lambda n: generar_records_aleatorios(n, semilla=n)),
+        ('sin dominados', generar_frontera_completa),
+    )
+    for caso, generar in casos:
+        escribir(f"Caso: {caso}")
+        escribir(f"{'n':>7} | {'referencia (ms)':>16} | {'barrido (ms)':>13} | {'mejora':>7}")
+        for n in (10, 100, 1000, 10000):
+            records = generar(n)
+            t_ref = _medir(lambda: frontera_no_dominada_referencia(records), repeticiones=1 if n >= 10000 else 3)
+            t_nuevo = _medir(lambda: frontera_no_dominada(records))
+            escribir(f"{n:>7} | {t_ref * 1000:>16.3f} | {t_nuevo * 1000:>13.3f} | {t_ref / t_nuevo:>6.1f}x")
+
+
+def generar_filas_historial(n, ejercicios=20, series_por_sesion=20, semilla=None):
+    """
+    Genera n series sintéticas como tuplas (peso, reps, rpe, fecha, ejercicio_id,
+    entrenamiento_id), agrupadas en sesiones que comparten fecha, como las devuelve
+    la base de datos.
+    """
+    rnd = random.Random(semilla)
+    inicio = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    filas = []
+    for i in range(n):
+        if i % series_por_sesion == 0:
+            fecha = inicio + timedelta(days=i // series_por_sesion, hours=rnd.randint(6, 21))
+        filas.append((
+            Decimal(rnd.randint(80, 800)) / 4,
+            rnd.randint(1, 12),
+            Decimal(rnd.choice([6, 7, 8, 9, 10])) if rnd.random() < 0.7 else None,
+            fecha,
+            rnd.randint(1, ejercicios),
+            i // series_por_sesion + 1,
+        ))
+    return filas
+
+
+def _filas_con_float(filas):
+    """Las mismas filas tal y como llegan con Cast(..., FloatField()) en la consulta de HistorialSeries."""
+    return [
+        (float(peso), reps, None if rpe is None else float(rpe), fecha, ejercicio_id, entrenamiento_id)
+        for peso, reps, rpe, fecha, ejercicio_id, entrenamiento_id in filas
+    ]
+
+
+def _mejor_e1rm_por_fila(filas):
+    """Versión por fila: un e1RM (Epley) por serie, de una en una, y máximo por ejercicio."""
+    mejores = {}
+    for peso, reps, _, _, ejercicio_id, _ in filas:
+        e1rm = estimar_1rm_epley(peso, reps)
+        if ejercicio_id not in mejores or e1rm > mejores[ejercicio_id]:
+            mejores[ejercicio_id] = e1rm
+    return mejores
+
+
+def benchmark_e1rm(escribir):
+    """Compara el cálculo del mejor e1RM por ejercicio fila a fila (Decimal) con el motor NumPy."""
+    escribir(f"{'series':>8} | {'por fila (ms)':>14} | {'numpy (ms)':>11} | {'numpy + carga (ms)':>19} | {'mejora':>7}")
+    for n in (1000, 10000, 100000):
+        filas = generar_filas_historial(n, semilla=n)
+        filas_float = _filas_con_float(filas)
+        historial = HistorialSeries.desde_filas(filas_float)
+
+        t_fila = _medir(lambda: _mejor_e1rm_por_fila(filas))
+        t_numpy = _medir(lambda: historial.mejor_e1rm_por_ejercicio())
+        t_total = _medir(lambda: HistorialSeries.desde_filas(filas_float).mejor_e1rm_por_ejercicio())
+        escribir(
+            f"{n:>8} | {t_fila * 1000:>14.2f} | {t_numpy * 1000:>11.2f} | "
+            f"{t_total * 1000:>19.2f} | {t_fila / t_numpy:>6.1f}x"
+        )
+
+    # Las fórmulas disponibles sobre el mismo historial de 100.000 series
+    for formula in ('epley', 'brzycki', 'rpe'):
+        t = _medir(lambda: historial.mejor_e1rm_por_semana(formula))
+        escribir(f"  e1RM semanal ({formula}) con {len(historial)} series: {t * 1000:.2f} ms")
+
+
+def _actividad_por_atleta(atletas, ahora):
+    """Versión de referencia: las mismas métricas con varias consultas por atleta."""
+    from django.db.models import F, Sum
+
+    from .models import Entrenamiento, Mesociclo, SerieEjercicio
+    from .services import semana_mesociclo
+
+    hace_7_dias = ahora - timedelta(days=7)
+    hoy = ahora.date()
+    inicio_semana = datetime.combine(hoy - timedelta(days=hoy.weekday()), datetime.min.time(), tzinfo=ahora.tzinfo)
+    resumen = {}
+    for atleta in atletas:
+        entrenos = Entrenamiento.objects.filter(atleta=atleta, registrado_en__isnull=False)
+        ultima = entrenos.order_by('-registrado_en').values_list('registrado_en', flat=True).first()
+        mesociclo = Mesociclo.objects.filter(atleta=atleta, activo=True).order_by('-fecha_inicio', '-pk').first()
+        resumen[atleta.pk] = (
+            ultima,
+            entrenos.filter(registrado_en__gte=inicio_semana).count(),
+            SerieEjercicio.objects.filter(
+                detalle_entrenamiento__entrenamiento__atleta=atleta,
+                detalle_entrenamiento__entrenamiento__registrado_en__gte=hace_7_dias,
+                repeticiones_reales__gt=0,
+            ).aggregate(total=Sum(F('peso_real') * F('repeticiones_reales')))['total'] or 0,
+            mesociclo and semana_mesociclo(mesociclo.fecha_inicio, hoy),
+        )
+    return resumen
+
+
+def benchmark_lista_atletas(escribir, atletas=300, sesiones=12, series=5):
+    """
+    Lista de atletas de un entrenador con su actividad reciente: una consulta con
+    subconsultas correlacionadas frente a varias consultas por atleta. Crea los
+    datos dentro de una transacción que se deshace al terminar.
+    """
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone as tz
+
+    from .models import DetalleEntrenamiento, Ejercicio, Entrenamiento, Mesociclo, PerfilUsuario, SerieEjercicio
+    from .services import resumen_actividad_atletas, semana_mesociclo
+
+    rnd = random.Random(atletas)
+    ahora = tz.now()
+    with transaction.atomic():
+        usuarios = User.objects.bulk_create(
+            [User(username=f'bench_lista_{n}') for n in range(atletas + 1)]
+        )
+        entrenador = PerfilUsuario.objects.create(
+            user=usuarios[0], tipo='entrenador', nombre='bench', email='bench_lista@bench.test'
+        )
+        perfiles = PerfilUsuario.objects.bulk_create([
+            PerfilUsuario(user=usuario, tipo='atleta', nombre=usuario.username,
+                          email=f'{usuario.username}@bench.test', entrenador=entrenador)
+            for usuario in usuarios[1:]
+        ])
+        ejercicio = Ejercicio.objects.create(nombre='bench_lista')
+        Mesociclo.objects.bulk_create([
+            Mesociclo(nombre='Bloque', entrenador=entrenador, atleta=perfil,
+                      fecha_inicio=ahora.date() - timedelta(days=rnd.randint(0, 40)))
+            for perfil in perfiles
+        ])
+        # Sesiones de las últimas cuatro semanas (la mayoría fuera de la ventana de 7 días)
+        entrenos = Entrenamiento.objects.bulk_create([
+            Entrenamiento(entrenador=entrenador, atleta=perfil, nombre='Sesión', semana=1, dia_orden=n,
+                          registrado_en=ahora - timedelta(hours=rnd.randint(1, 28 * 24)))
+            for perfil in perfiles for n in range(sesiones)
+        ])
+        detalles = DetalleEntrenamiento.objects.bulk_create([
+            DetalleEntrenamiento(entrenamiento=entreno, ejercicio=ejercicio, orden=1) for entreno in entrenos
+        ])
+        SerieEjercicio.objects.bulk_create([
+            SerieEjercicio(detalle_entrenamiento=detalle, numero_serie=n, repeticiones_o_rango='5',
+                           peso_real=Decimal(rnd.randint(160, 600)) / 4, repeticiones_reales=rnd.randint(1, 10))
+            for detalle in detalles for n in range(1, series + 1)
+        ], batch_size=2000)
+
+        queryset = PerfilUsuario.objects.filter(tipo='atleta', entrenador=entrenador).select_related('user')
+        hoy = tz.localdate(ahora)
+
+        def una_consulta():
+            return {
+                a.pk: (a.ultima_sesion, a.sesiones_semana, a.tonelaje_7_dias, semana_mesociclo(a.mesociclo_inicio, hoy))
+                for a in resumen_actividad_atletas(queryset, ahora)
+            }
+
+        with CaptureQueriesContext(connection) as consultas_ref:
+            referencia = _actividad_por_atleta(list(queryset), ahora)
+        with CaptureQueriesContext(connection) as consultas_nuevo:
+            resultado = una_consulta()
+        if resultado != referencia:
+            escribir("⚠️ Los resultados no coinciden con la versión de referencia")
+
+        t_ref = _medir(lambda: _actividad_por_atleta(list(queryset), ahora))
+        t_nuevo = _medir(una_consulta)
+        escribir(
+            f"{atletas} atletas, {len(entrenos)} sesiones, {len(entrenos) * series} series ({connection.vendor})"
+        )
+        escribir(f"{'versión':>12} | {'consultas':>9} | {'tiempo (ms)':>11}")
+        escribir(f"{'por atleta':>12} | {len(consultas_ref):>9} | {t_ref * 1000:>11.2f}")
+        escribir(f"{'una consulta':>12} | {len(consultas_nuevo):>9} | {t_nuevo * 1000:>11.2f}")
+        escribir(f"Mejora: {t_ref / t_nuevo:.1f}x")
+        transaction.set_rollback(True)
+
+
+def _login_referencia(identificador, password):
+    """Login anterior: hasta tres authenticate() (username, email y nombre), un hash por intento."""
+    from django.contrib.auth.backends import ModelBackend
+    from django.contrib.auth.models import User
+
+    from .models import PerfilUsuario
+
+    backend = ModelBackend()
+    usuario = backend.authenticate(None, username=identificador, password=password)
+    if usuario is None:
+        try:
+            usuario = backend.authenticate(
+                None, username=User.objects.get(email__iexact=identificador).username, password=password
+            )
+        except User.DoesNotExist:
+            pass
+    if usuario is None:
+        try:
+            perfil = PerfilUsuario.objects.get(nombre__iexact=identificador)
+            usuario = backend.authenticate(None, username=perfil.user.username, password=password)
+        except (PerfilUsuario.DoesNotExist, PerfilUsuario.MultipleObjectsReturned):
+            pass
+    return usuario
+
+
+def benchmark_login(escribir, repeticiones=3):
+    """
+    Logins por segundo de un proceso con el hasher configurado: el formulario
+    anterior (hasta tres hashes por intento fallido) frente al actual (uno).
+    """
+    from django.contrib.auth.models import User
+    from django.db import transaction
+
+    from .forms import EmailOrUsernameLoginForm
+    from .models import PerfilUsuario
+
+    with transaction.atomic():
+        usuario = User.objects.create_user(
+            username='bench_login@bench.test', email='bench_login@bench.test', password='secreta-123'
+        )
+        PerfilUsuario.objects.create(user=usuario, tipo='atleta', nombre='Bench Login', email=usuario.email)
+
+        def login_actual(identificador, password):
+            return EmailOrUsernameLoginForm(data={'username': identificador, 'password': password}).is_valid()
+
+        casos = (
+            ('username correcto', 'bench_login@bench.test', 'secreta-123'),
+            ('nombre correcto', 'bench login', 'secreta-123'),
+            ('nombre, contraseña mala', 'Bench Login', 'otra'),
+            ('usuario inexistente', 'nadie', 'otra'),
+        )
+        escribir(f"{'caso':>24} | {'antes (login/s)':>15} | {'ahora (login/s)':>15} | {'mejora':>7}")
+        for caso, identificador, password in casos:
+            t_ref = _medir(lambda: _login_referencia(identificador, password), repeticiones)
+            t_nuevo = _medir(lambda: login_actual(identificador, password), repeticiones)
+            escribir(f"{caso:>24} | {1 / t_ref:>15.2f} | {1 / t_nuevo:>15.2f} | {t_ref / t_nuevo:>6.1f}x")
+        transaction.set_rollback(True)
+
+
+# Registro de benchmarks disponibles: nombre -> función
+BENCHMARKS = {
+    'frontera': benchmark_frontera,
+    'e1rm': benchmark_e1rm,
+    'lista_atletas': benchmark_lista_atletas,
+    'login': benchmark_login,
+}
@@ -0,0 +1,135 @@
+# core/caching.py
+"""
+Caché versionada por atleta.
+
+Cada atleta tiene un número de versión de sus datos de entrenamiento. Las claves
+de caché incluyen esa versión, de modo que basta con incrementarla (cuando se
+guarda, actualiza en bloque o borra una de sus series) para que todas sus
+entradas anteriores dejen de usarse y acaben expulsadas por el backend.
+
+Con el mismo mecanismo, cada perfil tiene una versión de su dashboard, que cambia
+al guardar o borrar sus mesociclos y entrenamientos (ver core/signals.py).
+"""
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+def _clave_version(atleta_id):
+    return f"atleta:{atleta_id}:version"
+
+
+def _clave_version_dashboard(perfil_id):
+    return f"perfil:{perfil_id}:dashboard"
+
+
+def _version(clave):
+    """
+    Devuelve la versión guardada en 'clave'.
+    Se inicializa con la hora actual (y no con 1) para que, si el backend expulsa
+    la clave de versión, nunca se vuelva a una versión antigua ya cacheada.
+    """
+    version = cache.get(clave)
+    if version is None:
+        version = time.time_ns()
+        cache.add(clave, version, timeout=None)
+        version = cache.get(clave, version)
+    return version
+
+
+def _incrementar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # La clave no existía (o fue expulsada): empezamos una versión nueva
+        cache.set(clave, time.time_ns(), timeout=None)
+
+
+def version_datos_atleta(atleta_id):
+    """Devuelve la versión actual de los datos del atleta."""
+    return _version(_clave_version(atleta_id))
+
+
+def invalidar_datos_atletas(*atleta_ids):
+    """
+    Incrementa la versión de los atletas indicados, invalidando sus entradas.
+    Igual que invalidar_dashboards, se hace al confirmar la transacción: una petición
+    que leyera antes del commit cachearía las marcas y el volumen antiguos con la
+    versión nueva, y se servirían hasta la siguiente escritura.
+    """
+    atleta_ids = {atleta_id for atleta_id in atleta_ids if atleta_id is not None}
+
+    def incrementar():
+        for atleta_id in atleta_ids:
+            _incrementar(_clave_version(atleta_id))
+
+    if atleta_ids:
+        transaction.on_commit(incrementar)
+
+
+def version_dashboard(perfil_id):
+    """Versión del dashboard del perfil: forma parte de la clave de sus fragmentos cacheados."""
+    return _version(_clave_version_dashboard(perfil_id))
+
+
+def invalidar_dashboards(*perfil_ids):
+    """
+    Incrementa la versión del dashboard de los perfiles indicados (entrenadores o atletas).
+    Se hace al confirmar la transacción: si se hiciera antes, una visita al dashboard
+    mientras tanto volvería a cachear los datos antiguos con la versión nueva.
+    """
+    perfil_ids = {perfil_id for perfil_id in perfil_ids if perfil_id is not None}
+
+    def incrementar():
+        for perfil_id in perfil_ids:
+            _incrementar(_clave_version_dashboard(perfil_id))
+
+    if perfil_ids:
+        transaction.on_commit(incrementar)
+
+
+def cache_por_atleta(atleta_id, nombre, calcular, timeout=None):
+    """
+    Devuelve el valor cacheado 'nombre' del atleta para su versión actual de datos,
+    o lo calcula con 'calcular()' y lo guarda si no estaba.
+
+    Args:
+        atleta_id (int): PerfilUsuario del atleta.
+        nombre (str): Identificador del dato (ej: 'marcas_personales').
+        calcular (callable): Función sin argumentos que genera el valor.
+        timeout (int | None): Segundos de vida; por defecto, el TIMEOUT del backend.
+    """
+    clave = f"atleta:{atleta_id}:v{version_datos_atleta(atleta_id)}:{nombre}"
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        if timeout is None:
+            cache.set(clave, valor)
+        else:
+            cache.set(clave, valor, timeout)
+    return valor
+
+
+def marcas_personales_en_cache(perfil):
+    """get_marcas_personales() del perfil, servido desde la caché versionada."""
+    return cache_por_atleta(perfil.pk, 'marcas_personales', perfil.get_marcas_personales)
+
+
+@checks.register(checks.Tags.caches)
+def comprobar_cache_compartida(app_configs, **kwargs):
+    """
+    Las versiones las incrementa el proceso que guarda (un worker web o el de tareas)
+    y las leen todos: con una caché por proceso (locmem) los demás seguirían sirviendo
+    récords y dashboards antiguos hasta que expirasen.
+    """
+    if settings.DEBUG or not isinstance(caches['default'], LocMemCache):
+        return []
+    return [checks.Warning(
+        "La caché 'default' es locmem: las invalidaciones por versión no llegan a otros procesos.",
+        hint="Usa CACHE_BACKEND=db (o file) en producción.",
+        id='core.W001',
+    )]
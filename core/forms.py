@@ -1,17 +1,20 @@
 # core/forms.py
+import logging
+
 from django import forms
 from django.db.models import Q
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
-from django.forms import inlineformset_factory, modelformset_factory
+from django.forms import BaseInlineFormSet, inlineformset_factory, modelformset_factory
 from django.contrib.auth.forms import PasswordResetForm, SetPasswordForm
-from django.core.mail import EmailMultiAlternatives
 from django.urls import reverse
 from django.template import loader
 from .models import PerfilUsuario, Entrenamiento, Ejercicio, SerieEjercicio, DetalleEntrenamiento, Mesociclo
-from decimal import Decimal, ROUND_HALF_UP
+from .services import normalizar_peso
+from .tareas import enviar_correo
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth import authenticate, get_user_model
+
+logger = logging.getLogger(__name__)
 
 
 # ========================================================================
@@ -155,9 +158,54 @@ class SeriePrescripcionForm(forms.ModelForm):
 # ========================================================================
 # Inline FormSet para Prescripción de Series
 # ========================================================================
+class SerieCargadaField(forms.ModelChoiceField):
+    """
+    Id oculto de cada serie: la resuelve entre las series ya cargadas en lugar
+    de hacer una consulta por formulario al validar.
+    """
+
+    def __init__(self, series, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.series = series
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.series[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+class BaseSeriePrescripcionFormSet(BaseInlineFormSet):
+    """
+    Series de un ejercicio. Con 'series' recibe la lista ya cargada (ordenada por
+    numero_serie), para montar los formsets de toda una sesión con una sola consulta.
+    El numero_serie no es obligatorio: la vista renumera al guardar.
+    """
+
+    def __init__(self, *args, series=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._series_cargadas = None
+        if series is not None:
+            self._queryset = series
+            self._series_cargadas = {serie.pk: serie for serie in series}
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        form.fields['numero_serie'].required = False
+        if self._series_cargadas is not None:
+            campo = form.fields[self._pk_field.name]
+            form.fields[self._pk_field.name] = SerieCargadaField(
+                self._series_cargadas, campo.queryset,
+                initial=campo.initial, required=False, widget=campo.widget
+            )
+
+
 SeriePrescripcionInlineFormSet = inlineformset_factory(
     DetalleEntrenamiento,
     SerieEjercicio,
+    formset=BaseSeriePrescripcionFormSet,
     fields=['numero_serie', 'repeticiones_o_rango', 'rpe_prescrito'], # <-- 1. Añade rpe_prescrito aquí
     extra=0,
     can_delete=True,
@@ -183,32 +231,45 @@ class SerieRegistroForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         """
-        1. Pone los valores de la sesión anterior (peso/reps/rPE) en el placeholder.
+        1. Pone los valores ya registrados (peso/reps/rPE) en el placeholder.
         2. Vacía el valor 'initial' del campo para que aparezca vacío.
         """
         super().__init__(*args, **kwargs)
         
         if not self.is_bound and self.instance and self.instance.pk:
-            
-            # --- Lógica para 'peso_real' ---
-            if self.instance.peso_real is not None:
-                peso_val = self.instance.peso_real
-                formatted_peso_str = str(peso_val.to_integral_value()) if peso_val == peso_val.to_integral_value() else str(peso_val)
-                self.fields['peso_real'].widget.attrs['placeholder'] = f"{formatted_peso_str} kg"
+            self._poner_placeholders(self.instance, vaciar=True)
+
+    def mostrar_referencia(self, serie):
+        """
+        Muestra como placeholder lo logrado en 'serie' (la misma serie de la semana
+        anterior) en los campos que esta serie aún no tiene registrados.
+        """
+        if serie is not None and not self.is_bound:
+            self._poner_placeholders(serie, vaciar=False)
+
+    def _poner_placeholders(self, serie, vaciar):
+        # --- Lógica para 'peso_real' ---
+        if serie.peso_real is not None and (vaciar or self.instance.peso_real is None):
+            peso_val = serie.peso_real
+            formatted_peso_str = str(peso_val.to_integral_value()) if peso_val == peso_val.to_integral_value() else str(peso_val)
+            self.fields['peso_real'].widget.attrs['placeholder'] = f"{formatted_peso_str} kg"
+            if vaciar:
                 self.initial['peso_real'] = None
 
-            # --- Lógica para 'repeticiones_reales' ---
-            if self.instance.repeticiones_reales is not None:
-                reps_val = self.instance.repeticiones_reales
-                self.fields['repeticiones_reales'].widget.attrs['placeholder'] = f"{reps_val}"
+        # --- Lógica para 'repeticiones_reales' ---
+        if serie.repeticiones_reales is not None and (vaciar or self.instance.repeticiones_reales is None):
+            reps_val = serie.repeticiones_reales
+            self.fields['repeticiones_reales'].widget.attrs['placeholder'] = f"{reps_val}"
+            if vaciar:
                 self.initial['repeticiones_reales'] = None
 
-            # --- NUEVO: Lógica para 'rpe_real' ---
-            if self.instance.rpe_real is not None:
-                rpe_val = self.instance.rpe_real
-                # Formatear para quitar el .0 si es entero (ej: 8.0 -> 8)
-                formatted_rpe = str(rpe_val.to_integral_value()) if rpe_val == rpe_val.to_integral_value() else str(rpe_val)
-                self.fields['rpe_real'].widget.attrs['placeholder'] = f"RPE {formatted_rpe}"
+        # --- NUEVO: Lógica para 'rpe_real' ---
+        if serie.rpe_real is not None and (vaciar or self.instance.rpe_real is None):
+            rpe_val = serie.rpe_real
+            # Formatear para quitar el .0 si es entero (ej: 8.0 -> 8)
+            formatted_rpe = str(rpe_val.to_integral_value()) if rpe_val == rpe_val.to_integral_value() else str(rpe_val)
+            self.fields['rpe_real'].widget.attrs['placeholder'] = f"RPE {formatted_rpe}"
+            if vaciar:
                 self.initial['rpe_real'] = None
 
     class Meta:
@@ -258,22 +319,7 @@ class SerieRegistroForm(forms.ModelForm):
         peso = self.cleaned_data.get('peso_real')
         if peso is None:
             return peso
-
-        if not isinstance(peso, Decimal):
-            try:
-                peso = Decimal(str(peso))
-            except Exception:
-                raise ValidationError("El peso debe ser un número válido.")
-        
-        peso = peso.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        INCREMENTO_MINIMO = Decimal('0.25')
-        residuo = peso % INCREMENTO_MINIMO
-
-        if not residuo.is_zero():
-             raise ValidationError(
-                 f"El peso debe ser un múltiplo de {INCREMENTO_MINIMO} (ej. 17.0, 17.25, 17.5, 17.75)."
-             )
-        return peso.to_integral_value() if peso == peso.to_integral_value() else peso
+        return normalizar_peso(peso)
 
     def clean(self):
         cleaned_data = super().clean()
@@ -318,75 +364,16 @@ class EmailOrUsernameLoginForm(AuthenticationForm):
     """
     Formulario de autenticación que permite a los usuarios iniciar sesión
     usando su Username (email), su Email O su Nombre de Perfil.
+
+    El clean() de AuthenticationForm llama a authenticate() una sola vez:
+    PerfilModelBackend resuelve el identificador a un único usuario y
+    comprueba la contraseña una vez (antes se probaba hasta tres veces,
+    con un hash completo por intento).
     """
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['username'].label = "Usuario o Email" 
-
-    def clean(self):
-        # El campo 'username' del formulario contiene lo que el usuario escribió
-        username_or_email_or_nombre = self.cleaned_data.get('username')
-        password = self.cleaned_data.get('password')
-
-        if username_or_email_or_nombre is not None and password:
-            User = get_user_model()
-            # Inicializamos el caché de usuario como None
-            self.user_cache = None
-
-
-            # INTENTO 1: Autenticar por USERNAME
-            # (El username es el email)
-            self.user_cache = authenticate(
-                self.request, 
-                username=username_or_email_or_nombre, 
-                password=password
-            )
-            
-
-            # INTENTO 2: Autenticar por EMAIL (Fallback)
-            if self.user_cache is None:
-                try:
-                    # Buscamos al usuario por su email
-                    user_by_email = User.objects.get(email__iexact=username_or_email_or_nombre)
-                    # Si lo encontramos, autenticamos usando su username real
-                    self.user_cache = authenticate(
-                        self.request, 
-                        username=user_by_email.username, 
-                        password=password
-                    )
-                except User.DoesNotExist:
-                    pass # No era un email, pasamos al siguiente intento
-
-            # ¡NUEVO! INTENTO 3: Autenticar por NOMBRE DE PERFIL
-
-            if self.user_cache is None:
-                try:
-                    # Buscamos el *perfil* por el campo 'nombre'
-                    perfil = PerfilUsuario.objects.get(nombre__iexact=username_or_email_or_nombre)
-                    
-                    # Autenticamos usando el 'username' del usuario de ese perfil
-                    self.user_cache = authenticate(
-                        self.request,
-                        username=perfil.user.username, 
-                        password=password
-                    )
-                except PerfilUsuario.DoesNotExist:
-                    pass 
-                except PerfilUsuario.MultipleObjectsReturned:
-                    pass
-
-            # ------------------------------------------------------------
-            # Comprobaciones finales de Django
-            # ------------------------------------------------------------
-            if self.user_cache is None:
-                # Si los 3 intentos fallaron, lanzamos el error
-                raise self.get_invalid_login_error()
-            else:
-                # Si alguno funcionó, confirmamos el login
-                self.confirm_login_allowed(self.user_cache)
-
-        return self.cleaned_data
     
 
 
@@ -467,21 +454,8 @@ class CustomPasswordResetForm(PasswordResetForm):
 
         context['recovery_url'] = f"{context['protocol']}://{context['domain']}{url_path}"
 
-        # 4. Crea el email
-        msg = EmailMultiAlternatives(
-            subject,    
-            body,       
-            from_email, 
-            [to_email]
-        )
-        
-        # 5. INSTRUCCIONES PARA ANYMAIL (BREVO)
-        
-        # 5a. Asigna el ID de la plantilla de Brevo.
-        msg.template_id = self.BREVO_TEMPLATE_ID
-        
-        # 5b. ¡AQUÍ ESTÁ LA SOLUCIÓN 1!
-        # Obtenemos el objeto User
+        # 4. Datos para la plantilla de Brevo (vía Anymail)
+        # 4a. Obtenemos el objeto User
         user = context.get('user') 
 
         # Hacemos la consulta del nombre más segura
@@ -510,17 +484,16 @@ class CustomPasswordResetForm(PasswordResetForm):
             "email": getattr(user, 'email', ''), 
         }
         
-        # 5c. Pasa el diccionario LIMPIO (solo strings) a Brevo
-        msg.merge_global_data = brevo_data
-
-        # 6. Envía el mensaje.
+        # 5. Se envía en la propia petición, sin pasar por la cola de tareas: el enlace
+        # de un solo uso no se guarda en la base de datos y el correo no depende de
+        # que haya un trabajador en marcha.
         try:
-            msg.send()
-        except Exception as e:
-            # Imprime el error real en la consola del servidor para depuración
-            print(f"ERROR AL ENVIAR CORREO CON ANYMAIL/BREVO: {e}")
-            raise e
-        
+            enviar_correo(subject, body, from_email, [to_email], self.BREVO_TEMPLATE_ID, brevo_data)
+        except Exception:
+            # Deja el error real (con la traza) en el log del servidor
+            logger.exception("Error al enviar el correo de recuperación a %s con Anymail/Brevo", to_email)
+            raise
+
 
 class MesocicloForm(forms.ModelForm):
     class Meta:
@@ -546,4 +519,29 @@ class MesocicloForm(forms.ModelForm):
             ).distinct().order_by('nombre')
         else:
             # Fallback por si acaso
-            self.fields['atleta'].queryset = PerfilUsuario.objects.filter(tipo='atleta').order_by('nombre')
\ No newline at end of file
+            self.fields['atleta'].queryset = PerfilUsuario.objects.filter(tipo='atleta').order_by('nombre')
+
+# ========================================================================
+# Formulario de Asignación de Programas (clonar mesociclo / usar plantilla)
+# ========================================================================
+class AsignarProgramaForm(forms.Form):
+    atletas = forms.ModelMultipleChoiceField(
+        queryset=PerfilUsuario.objects.none(),
+        widget=forms.CheckboxSelectMultiple,
+        label="Atletas"
+    )
+    fecha_inicio = forms.DateField(
+        required=False,
+        label="Fecha de inicio",
+        widget=forms.DateInput(attrs={"type": "date", "class": INPUT_CLASSES})
+    )
+
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        if user and hasattr(user, 'perfil'):
+            # Igual que en MesocicloForm: atletas propios O libres
+            self.fields['atletas'].queryset = PerfilUsuario.objects.filter(
+                Q(tipo='atleta'),
+                Q(entrenador=user.perfil) | Q(entrenador__isnull=True)
+            ).order_by('nombre')
@@ -0,0 +1,45 @@
+# core/management/commands/asignar_programa.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Mesociclo
+from core.services import ATLETAS_POR_LOTE, asignar_programa
+
+
+class Command(BaseCommand):
+    """
+    Asigna en bloque una copia de un mesociclo a muchos atletas, informando del progreso.
+    Uso: python manage.py asignar_programa <mesociclo_id> <atleta_id> [<atleta_id> ...]
+         [--fecha-inicio AAAA-MM-DD] [--lote N]
+    """
+    help = "Copia un mesociclo completo para una lista de atletas, por lotes (una transacción por lote)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('mesociclo', type=int, help="ID del mesociclo origen.")
+        parser.add_argument('atletas', type=int, nargs='+', help="IDs de PerfilUsuario de los atletas.")
+        parser.add_argument('--fecha-inicio', type=date.fromisoformat, help="Fecha de inicio (AAAA-MM-DD).")
+        parser.add_argument('--lote', type=int, default=ATLETAS_POR_LOTE, help="Atletas por lote de inserción.")
+
+    def handle(self, *args, **options):
+        try:
+            mesociclo = Mesociclo.objects.select_related('entrenador').get(pk=options['mesociclo'])
+        except Mesociclo.DoesNotExist:
+            raise CommandError(f"No existe un mesociclo con id {options['mesociclo']}.")
+
+        def progreso(hechos, total, mesociclos):
+            self.stdout.write(f"  {hechos}/{total} atletas")
+
+        nuevos, ignorados = asignar_programa(
+            mesociclo,
+            options['atletas'],
+            options['fecha_inicio'],
+            lote=max(1, options['lote']),
+            progreso=progreso
+        )
+
+        if ignorados:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ Atletas ignorados (no existen o tienen otro entrenador): {', '.join(map(str, ignorados))}"
+            ))
+        self.stdout.write(self.style.SUCCESS(f"✅ '{mesociclo.nombre}' asignado a {len(nuevos)} atletas."))
@@ -0,0 +1,25 @@
+# core/management/commands/benchmark.py
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    """
+    Ejecuta los micro-benchmarks definidos en core/benchmarks.py.
+    Uso: python manage.py benchmark [nombre ...]
+    """
+    help = "Ejecuta los micro-benchmarks de rendimiento de NoteGym."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'nombres',
+            nargs='*',
+            choices=sorted(BENCHMARKS),
+            help="Benchmarks a ejecutar (por defecto, todos)."
+        )
+
+    def handle(self, *args, **options):
+        for nombre in options['nombres'] or sorted(BENCHMARKS):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"--- Benchmark: {nombre} ---"))
+            BENCHMARKS[nombre](self.stdout.write)
@@ -0,0 +1,71 @@
+# core/management/commands/procesar_tareas.py
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+
+
+def _proceso_trabajador(una_vez, pausa):
+    """Punto de entrada de cada proceso hijo: prepara Django y procesa tareas."""
+    import django
+    django.setup()
+
+    from core.tareas import trabajar
+
+    activo = {'valor': True}
+
+    def parar(*args):
+        activo['valor'] = False
+
+    signal.signal(signal.SIGTERM, parar)
+    signal.signal(signal.SIGINT, parar)
+    return trabajar(una_vez=una_vez, pausa=pausa, seguir=lambda: activo['valor'])
+
+
+class Command(BaseCommand):
+    """
+    Ejecuta los trabajadores de la cola de tareas guardada en la base de datos.
+    Cada proceso reclama tareas con bloqueo a nivel de fila, así que pueden
+    lanzarse varios a la vez (en la misma máquina o en varias).
+    Uso: python manage.py procesar_tareas [--procesos N] [--una-vez] [--pausa S]
+    """
+    help = "Procesa las tareas en segundo plano pendientes (cola en la base de datos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=1, help="Número de procesos trabajadores.")
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help="Procesa las tareas disponibles y termina (en vez de esperar nuevas)."
+        )
+        parser.add_argument('--pausa', type=float, default=2.0, help="Segundos de espera cuando la cola está vacía.")
+
+    def handle(self, *args, **options):
+        procesos = max(1, options['procesos'])
+        una_vez, pausa = options['una_vez'], options['pausa']
+
+        if procesos == 1:
+            total = _proceso_trabajador(una_vez, pausa)
+            self.stdout.write(self.style.SUCCESS(f"✅ {total} tareas procesadas."))
+            return
+
+        # Procesos independientes ('spawn'): cada uno abre su propia conexión a la base de datos
+        contexto = multiprocessing.get_context('spawn')
+        hijos = [
+            contexto.Process(target=_proceso_trabajador, args=(una_vez, pausa), daemon=False)
+            for _ in range(procesos)
+        ]
+        for hijo in hijos:
+            hijo.start()
+        self.stdout.write(f"⚙️ {procesos} trabajadores en marcha.")
+
+        try:
+            for hijo in hijos:
+                hijo.join()
+        except KeyboardInterrupt:
+            for hijo in hijos:
+                hijo.terminate()
+            for hijo in hijos:
+                hijo.join()
+
+        self.stdout.write(self.style.SUCCESS("✅ Trabajadores detenidos."))
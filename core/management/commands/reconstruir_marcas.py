@@ -0,0 +1,34 @@
+# core/management/commands/reconstruir_marcas.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import PerfilUsuario
+from core.services import reconstruir_marcas_personales
+
+
+class Command(BaseCommand):
+    """
+    Reconstruye desde cero la tabla de marcas personales (MarcaPersonal)
+    a partir de todas las series registradas.
+    Uso: python manage.py reconstruir_marcas [--atleta <id>]
+    """
+    help = "Reconstruye la tabla de marcas personales a partir de las series registradas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--atleta',
+            type=int,
+            help="ID del PerfilUsuario del atleta a reconstruir (por defecto, todos)."
+        )
+
+    def handle(self, *args, **options):
+        atleta = None
+        if options['atleta'] is not None:
+            try:
+                atleta = PerfilUsuario.objects.get(pk=options['atleta'], tipo='atleta')
+            except PerfilUsuario.DoesNotExist:
+                raise CommandError(f"No existe un atleta con id {options['atleta']}.")
+
+        total = reconstruir_marcas_personales(atleta=atleta)
+
+        destino = atleta.nombre if atleta else "todos los atletas"
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} marcas personales reconstruidas para {destino}."))
@@ -0,0 +1,22 @@
+# core/management/commands/reconstruir_resumenes.py
+from django.core.management.base import BaseCommand
+
+from core.services import reconstruir_marcas_personales, reconstruir_volumen_semanal
+
+
+class Command(BaseCommand):
+    """
+    Reconstruye las tablas precalculadas (MarcaPersonal y VolumenSemanal) a partir de
+    las series registradas. Lo ejecuta el despliegue tras 'migrate' (build.sh y la fase
+    'release' del Procfile): cuando cambia cómo se calculan, las tablas quedan al día
+    antes de servir peticiones, sin esperar a la cola de tareas. Es idempotente.
+    Uso: python manage.py reconstruir_resumenes
+    """
+    help = "Reconstruye marcas personales y volumen semanal (se ejecuta en cada despliegue, tras migrate)."
+
+    def handle(self, *args, **options):
+        marcas = reconstruir_marcas_personales()
+        volumen = reconstruir_volumen_semanal()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {marcas} marcas personales y {volumen} filas de volumen semanal reconstruidas."
+        ))
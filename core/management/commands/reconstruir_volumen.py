@@ -0,0 +1,34 @@
+# core/management/commands/reconstruir_volumen.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import PerfilUsuario
+from core.services import reconstruir_volumen_semanal
+
+
+class Command(BaseCommand):
+    """
+    Reconstruye desde cero la tabla de volumen semanal (VolumenSemanal)
+    a partir de todas las series registradas.
+    Uso: python manage.py reconstruir_volumen [--atleta <id>]
+    """
+    help = "Reconstruye la tabla de volumen semanal a partir de las series registradas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--atleta',
+            type=int,
+            help="ID del PerfilUsuario del atleta a reconstruir (por defecto, todos)."
+        )
+
+    def handle(self, *args, **options):
+        atleta = None
+        if options['atleta'] is not None:
+            try:
+                atleta = PerfilUsuario.objects.get(pk=options['atleta'], tipo='atleta')
+            except PerfilUsuario.DoesNotExist:
+                raise CommandError(f"No existe un atleta con id {options['atleta']}.")
+
+        total = reconstruir_volumen_semanal(atleta=atleta)
+
+        destino = atleta.nombre if atleta else "todos los atletas"
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} filas de volumen semanal reconstruidas para {destino}."))
@@ -0,0 +1,126 @@
+# core/marcas.py
+"""
+Funciones puras para el cálculo de marcas personales (PRs).
+No dependen de la base de datos: trabajan sobre listas de diccionarios con,
+al menos, las claves 'peso' y 'repeticiones'.
+"""
+from decimal import Decimal
+from itertools import groupby
+
+from .analitica import estimar_1rm
+
+
+def frontera_no_dominada(records):
+    """
+    Devuelve los récords NO dominados (frontera de Pareto) en O(n log n).
+
+    Un récord A está dominado si existe otro récord B con MÁS repeticiones
+    y un peso IGUAL O SUPERIOR. Se ordenan los récords por repeticiones de
+    mayor a menor y se barren manteniendo el peso máximo visto en los grupos
+    de repeticiones superiores: A sobrevive solo si lo supera estrictamente.
+
+    El resultado conserva el orden de entrada, igual que la versión de referencia.
+    """
+    conservar = [False] * len(records)
+    orden = sorted(range(len(records)), key=lambda i: records[i]['repeticiones'], reverse=True)
+
+    # Peso máximo entre los récords con estrictamente más repeticiones que el grupo actual
+    max_peso_superior = None
+
+    for _, grupo in groupby(orden, key=lambda i: records[i]['repeticiones']):
+        grupo = list(grupo)
+        for i in grupo:
+            conservar[i] = max_peso_superior is None or records[i]['peso'] > max_peso_superior
+
+        max_grupo = max(records[i]['peso'] for i in grupo)
+        if max_peso_superior is None or max_grupo > max_peso_superior:
+            max_peso_superior = max_grupo
+
+    return [record for record, conservado in zip(records, conservar) if conservado]
+
+
+def frontera_no_dominada_referencia(records):
+    """
+    Versión original O(n²) del filtro de récords no dominados.
+    Se mantiene como referencia para las pruebas de equivalencia y el benchmark.
+    """
+    marcas_no_dominadas = []
+    for record_a in records:
+        es_dominado = False
+        for record_b in records:
+            # No comparar un récord consigo mismo
+            if record_a == record_b:
+                continue
+
+            # ¿'record_b' domina a 'record_a'?
+            # (Si B tiene MÁS reps con un peso IGUAL O SUPERIOR)
+            if (record_b['peso'] >= record_a['peso'] and
+                    record_b['repeticiones'] > record_a['repeticiones']):
+
+                es_dominado = True
+                break  # 'record_a' es dominado, no necesitamos seguir
+
+        # Si, tras comprobar contra todos, no fue dominado, lo añadimos
+        if not es_dominado:
+            marcas_no_dominadas.append(record_a)
+
+    return marcas_no_dominadas
+
+
+def estimar_1rm_epley(peso, repeticiones):
+    """
+    1RM estimado de una sola serie con la fórmula de Epley (ver core/analitica.py),
+    redondeado a centésimas. Para muchas series, mejor estimar_1rm en bloque.
+    """
+    return Decimal(str(round(float(estimar_1rm([peso], [repeticiones])[0]), 2)))
+
+
+def resumir_marcas_por_atleta(filas, levantamientos=3):
+    """
+    Agrupa filas de récords y calcula, para cada atleta, un resumen de sus
+    levantamientos principales (los de mayor 1RM estimado).
+
+    Args:
+        filas (iterable): Tuplas (atleta_id, ejercicio_id, ejercicio_nombre,
+            repeticiones, peso, fecha), una por récord de la tabla MarcaPersonal.
+        levantamientos (int): Número máximo de ejercicios por atleta.
+
+    Returns:
+        dict: atleta_id -> lista de diccionarios con 'ejercicio', 'mejor_1rm',
+        'mejor_e1rm', 'e1rm_peso', 'e1rm_repeticiones' y 'ultima_marca',
+        ordenada de mayor a menor 1RM estimado.
+    """
+    filas = list(filas)
+    # e1RM (Epley) de todos los récords en una sola pasada vectorizada
+    e1rms = estimar_1rm([fila[4] for fila in filas], [fila[3] for fila in filas]).round(2).tolist()
+
+    resumenes = {}
+    for (atleta_id, ejercicio_id, nombre, reps, peso, fecha), e1rm in zip(filas, e1rms):
+        por_ejercicio = resumenes.setdefault(atleta_id, {})
+        resumen = por_ejercicio.get(ejercicio_id)
+        if resumen is None:
+            resumen = por_ejercicio[ejercicio_id] = {
+                'ejercicio_id': ejercicio_id,
+                'ejercicio': nombre,
+                'mejor_1rm': None,
+                'mejor_e1rm': None,
+                'e1rm_peso': None,
+                'e1rm_repeticiones': None,
+                'ultima_marca': fecha,
+            }
+
+        if reps == 1 and (resumen['mejor_1rm'] is None or peso > resumen['mejor_1rm']):
+            resumen['mejor_1rm'] = peso
+
+        if resumen['mejor_e1rm'] is None or e1rm > resumen['mejor_e1rm']:
+            resumen['mejor_e1rm'] = e1rm
+            resumen['e1rm_peso'] = peso
+            resumen['e1rm_repeticiones'] = reps
+
+        if fecha > resumen['ultima_marca']:
+            resumen['ultima_marca'] = fecha
+
+    return {
+        atleta_id: sorted(por_ejercicio.values(), key=lambda r: r['mejor_e1rm'], reverse=True)[:levantamientos]
+        for atleta_id, por_ejercicio in resumenes.items()
+    }
@@ -0,0 +1,28 @@
+# core/middleware.py
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+
+# Backend con el que se iniciaron las sesiones anteriores a PerfilModelBackend
+BACKEND_ANTERIOR = 'django.contrib.auth.backends.ModelBackend'
+
+
+class PerfilMiddleware:
+    """
+    Deja el PerfilUsuario del usuario con sesión en request.perfil (None si es anónimo
+    o no tiene perfil). Va después de AuthenticationMiddleware: el usuario y su perfil
+    llegan juntos en una sola consulta gracias a PerfilModelBackend.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Las sesiones abiertas con el backend por defecto pasan al nuevo sin cerrar la sesión
+        if (
+            request.session.get(BACKEND_SESSION_KEY) == BACKEND_ANTERIOR
+            and BACKEND_ANTERIOR not in settings.AUTHENTICATION_BACKENDS
+        ):
+            request.session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+
+        request.perfil = getattr(request.user, 'perfil', None) if request.user.is_authenticated else None
+        return self.get_response(request)
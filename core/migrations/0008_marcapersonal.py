@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_mesociclo_objetivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaPersonal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('repeticiones', models.PositiveIntegerField(verbose_name='Repeticiones')),
+                ('peso', models.DecimalField(decimal_places=2, max_digits=5, verbose_name='Peso máximo (kg)')),
+                ('fecha', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('atleta', models.ForeignKey(limit_choices_to={'tipo': 'atleta'}, on_delete=django.db.models.deletion.CASCADE, related_name='marcas_personales', to='core.perfilusuario')),
+                ('ejercicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='marcas_personales', to='core.ejercicio')),
+                ('serie_origen', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.serieejercicio')),
+            ],
+            options={
+                'verbose_name': 'Marca Personal',
+                'verbose_name_plural': 'Marcas Personales',
+                'ordering': ['ejercicio', 'repeticiones'],
+                'constraints': [models.UniqueConstraint(fields=('atleta', 'ejercicio', 'repeticiones'), name='marca_personal_unica_por_reps')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_marcapersonal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detalleentrenamiento',
+            index=models.Index(fields=['ejercicio', 'entrenamiento'], name='detalle_ejercicio_entreno_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serieejercicio',
+            index=models.Index(fields=['detalle_entrenamiento', '-peso_real'], name='serie_detalle_peso_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_indices_top_series'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VolumenSemanal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semana', models.PositiveIntegerField(help_text='Número de semana dentro del mesociclo')),
+                ('series_prescritas', models.PositiveIntegerField(default=0)),
+                ('series_completadas', models.PositiveIntegerField(default=0, help_text='Series completadas (ver serie_completada)')),
+                ('repeticiones', models.PositiveIntegerField(default=0, verbose_name='Repeticiones totales')),
+                ('tonelaje', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Tonelaje (kg)')),
+                ('rpe_medio', models.DecimalField(blank=True, decimal_places=1, max_digits=3, null=True, verbose_name='RPE medio')),
+                ('peso_maximo', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='Peso máximo (kg)')),
+                ('repeticiones_peso_maximo', models.PositiveIntegerField(blank=True, help_text='Repeticiones de la serie más pesada', null=True)),
+                ('e1rm_maximo', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True, verbose_name='Mejor e1RM (Epley)')),
+                ('fecha', models.DateTimeField(blank=True, help_text='Fecha de la primera sesión de la semana', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('atleta', models.ForeignKey(limit_choices_to={'tipo': 'atleta'}, on_delete=django.db.models.deletion.CASCADE, related_name='volumenes_semanales', to='core.perfilusuario')),
+                ('ejercicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='volumenes_semanales', to='core.ejercicio')),
+                ('mesociclo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='volumenes_semanales', to='core.mesociclo')),
+            ],
+            options={
+                'verbose_name': 'Volumen Semanal',
+                'verbose_name_plural': 'Volúmenes Semanales',
+                'ordering': ['mesociclo', 'semana', 'ejercicio'],
+                'constraints': [models.UniqueConstraint(fields=('atleta', 'mesociclo', 'semana', 'ejercicio'), name='volumen_semanal_unico')],
+            },
+        ),
+    ]
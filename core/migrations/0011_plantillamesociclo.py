@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_volumensemanal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantillaMesociclo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=150)),
+                ('objetivo', models.CharField(blank=True, max_length=200)),
+                ('semanas_objetivo', models.PositiveIntegerField(default=4)),
+                ('notas', models.TextField(blank=True)),
+                ('estructura', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('entrenador', models.ForeignKey(limit_choices_to={'tipo': 'entrenador'}, on_delete=django.db.models.deletion.CASCADE, related_name='plantillas', to='core.perfilusuario')),
+            ],
+            options={
+                'verbose_name': 'Plantilla de Mesociclo',
+                'verbose_name_plural': 'Plantillas de Mesociclo',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
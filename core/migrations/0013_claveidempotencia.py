@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:11
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_tarea'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64)),
+                ('respuesta', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('atleta', models.ForeignKey(limit_choices_to={'tipo': 'atleta'}, on_delete=django.db.models.deletion.CASCADE, related_name='claves_idempotencia', to='core.perfilusuario')),
+            ],
+            options={
+                'verbose_name': 'Clave de Idempotencia',
+                'verbose_name_plural': 'Claves de Idempotencia',
+                'constraints': [models.UniqueConstraint(fields=('atleta', 'clave'), name='clave_idempotencia_unica')],
+            },
+        ),
+    ]
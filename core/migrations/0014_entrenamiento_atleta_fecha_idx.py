@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entrenamiento',
+            index=models.Index(fields=['atleta', '-created_at', '-id'], name='entreno_atleta_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:29
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F, Min, OuterRef, Subquery
+
+
+def poblar_registrado_en(apps, schema_editor):
+    """
+    Fecha en que se registró cada entrenamiento: la de su primera serie con
+    repeticiones reales registrada (la modificada hace más tiempo). Las series que no se han tocado desde que se crearon
+    (las copias de la semana anterior al clonar) no son un registro del atleta: un
+    entrenamiento clonado sin entrenar se queda con registrado_en a NULL.
+    """
+    Entrenamiento = apps.get_model('core', 'Entrenamiento')
+    SerieEjercicio = apps.get_model('core', 'SerieEjercicio')
+
+    primera_serie = SerieEjercicio.objects.filter(
+        detalle_entrenamiento__entrenamiento=OuterRef('pk'), repeticiones_reales__gt=0,
+        updated_at__gt=F('created_at') + timedelta(seconds=1),
+    ).order_by().values('detalle_entrenamiento__entrenamiento').annotate(primera=Min('updated_at')).values('primera')
+    Entrenamiento.objects.update(registrado_en=Subquery(primera_serie))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_entrenamiento_atleta_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entrenamiento',
+            name='registrado_en',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='entrenamiento',
+            index=models.Index(fields=['atleta', '-registrado_en'], name='entreno_atleta_registro_idx'),
+        ),
+        migrations.RunPython(poblar_registrado_en, migrations.RunPython.noop),
+    ]
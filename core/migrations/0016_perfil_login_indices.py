@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:34
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_entrenamiento_registrado_en'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='perfilusuario',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='perfil_email_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='perfilusuario',
+            index=models.Index(django.db.models.functions.text.Upper('nombre'), name='perfil_nombre_upper_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_perfil_login_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarea',
+            name='hechos',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tarea',
+            name='total',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
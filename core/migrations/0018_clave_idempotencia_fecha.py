@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_tarea_progreso'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claveidempotencia',
+            index=models.Index(fields=['created_at'], name='clave_idempotencia_fecha_idx'),
+        ),
+    ]
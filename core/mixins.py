@@ -1,60 +1,97 @@
 # En tu archivo core/mixins.py
 
+from functools import wraps
+
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import AccessMixin
+from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
-# Asume que tienes estos modelos que representan los tipos de perfil (Atleta y Entrenador)
-from .models import Atleta, Entrenador 
+
 
 # Mixin de acceso base que permite controlar los permisos y redirecciones.
-class EntrenadorRequiredMixin(AccessMixin):
+class PerfilRequeridoMixin(AccessMixin):
     """
-    Verifica que el usuario esté autenticado Y tenga un perfil de Entrenador.
-    Si no lo es, lo redirige a la página de inicio de sesión o al dashboard.
+    Verifica que el usuario esté autenticado Y que su perfil sea del tipo indicado.
+    Usa request.perfil (core.middleware.PerfilMiddleware), que ya viene cargado con
+    el usuario: comprobar el rol no cuesta ninguna consulta.
     """
+    tipo_perfil = None
+    # Vistas JSON: si se indica, responde 403 con este mensaje en vez de redirigir
+    mensaje_acceso_denegado = None
+
     # Método principal de los Mixins de clase de Django que maneja la lógica antes de ejecutar la vista.
     def dispatch(self, request, *args, **kwargs):
         # 1. Chequea si el usuario está logueado
         if not request.user.is_authenticated:
             # Si el usuario no está autenticado, llama al manejador por defecto (típicamente redirige a LOGIN_URL).
-            return self.handle_no_permission() 
-
-        # 2. Chequea si el usuario tiene un perfil de Entrenador
-        try:
-            # Consulta el modelo Entrenador para ver si existe un perfil asociado al usuario actual (request.user).
-            if not Entrenador.objects.filter(user=request.user).exists():
-                # Si está logueado pero NO tiene un perfil de Entrenador, lo redirigimos al dashboard.
-                return redirect(reverse_lazy('dashboard'))
-        except Exception:
-            # Captura cualquier excepción (ej. error de base de datos o modelo no configurado)
-            # y redirige al dashboard como medida de seguridad.
+            return self.handle_no_permission()
+
+        # 2. Chequea el tipo de perfil (None si el usuario no tiene PerfilUsuario)
+        perfil = getattr(request, 'perfil', None)
+        if perfil is None or perfil.tipo != self.tipo_perfil:
+            if self.mensaje_acceso_denegado:
+                return HttpResponseForbidden(self.mensaje_acceso_denegado)
+            # Si está logueado pero NO tiene el perfil requerido, lo redirigimos al dashboard.
             return redirect(reverse_lazy('dashboard'))
-            
-        # Si el usuario está autenticado Y es Entrenador, permite que la solicitud continúe a la vista.
+
+        # Si el usuario está autenticado Y tiene el perfil requerido, permite que la solicitud continúe.
         return super().dispatch(request, *args, **kwargs)
 
 
-class AtletaRequiredMixin(AccessMixin):
+class EntrenadorRequiredMixin(PerfilRequeridoMixin):
+    """
+    Verifica que el usuario esté autenticado Y tenga un perfil de Entrenador.
+    Si no lo es, lo redirige a la página de inicio de sesión o al dashboard.
+    """
+    tipo_perfil = 'entrenador'
+
+
+class AtletaRequiredMixin(PerfilRequeridoMixin):
     """
     Verifica que el usuario esté autenticado Y tenga un perfil de Atleta.
     Si no lo es, lo redirige a la página de inicio de sesión o al dashboard.
     """
-    # Método que se ejecuta antes de la lógica de la vista.
-    def dispatch(self, request, *args, **kwargs):
-        # 1. Chequea si el usuario está logueado
-        if not request.user.is_authenticated:
-            # Si no está logueado, se utiliza la gestión de permisos por defecto (redirige a login).
-            return self.handle_no_permission() 
-
-        # 2. Chequea si el usuario tiene un perfil de Atleta
-        try:
-            # Consulta el modelo Atleta para verificar si hay un perfil asociado al usuario actual.
-            if not Atleta.objects.filter(user=request.user).exists():
-                # Si está logueado pero NO tiene un perfil de Atleta, lo redirigimos al dashboard.
-                return redirect(reverse_lazy('dashboard'))
-        except Exception:
-            # Captura excepciones y redirige al dashboard para evitar errores en producción.
+    tipo_perfil = 'atleta'
+
+
+def entrenador_requerido(vista):
+    """
+    Equivalente de EntrenadorRequiredMixin para vistas de función: sin sesión lleva
+    al login y, si el perfil no es de entrenador, redirige al dashboard.
+    """
+    @wraps(vista)
+    def envoltorio(request, *args, **kwargs):
+        perfil = getattr(request, 'perfil', None)
+        if perfil is None or perfil.tipo != EntrenadorRequiredMixin.tipo_perfil:
             return redirect(reverse_lazy('dashboard'))
+        return vista(request, *args, **kwargs)
+
+    return login_required(envoltorio)
+
+
+class ObjetoPorPeticionMixin:
+    """
+    Para vistas de detalle (DetailView, UpdateView, DeleteView...): carga el objeto
+    una sola vez por petición y lo reutiliza en test_func, dispatch, get_context_data,
+    post, etc. Cada llamada a get_object() ya no repite la consulta.
+
+    'relaciones_objeto' indica las relaciones que se cargan con select_related en esa
+    misma consulta (las que usan los permisos y la plantilla: atleta, entrenador...).
+    """
+    relaciones_objeto = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.relaciones_objeto:
+            queryset = queryset.select_related(*self.relaciones_objeto)
+        return queryset
 
-        # Si el usuario está autenticado Y es Atleta, permite que la solicitud continúe.
-        return super().dispatch(request, *args, **kwargs)
\ No newline at end of file
+    def get_object(self, queryset=None):
+        # Con un queryset explícito se respeta el comportamiento normal de Django
+        if queryset is not None:
+            return super().get_object(queryset)
+        # La instancia de la vista es propia de cada petición: sirve de caché
+        if not hasattr(self, '_objeto_peticion'):
+            self._objeto_peticion = super().get_object()
+        return self._objeto_peticion
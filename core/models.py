@@ -1,9 +1,14 @@
 # core/models.py
 from django.db import models
+from django.db.models.functions import Coalesce, Upper
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from decimal import Decimal  
 from django.utils import timezone
 
+from .analitica import estimar_1rm
+from .marcas import frontera_no_dominada
+
 class PerfilUsuario(models.Model):
     """
     Modelo que extiende el modelo base de usuario de Django, permitiendo almacenar
@@ -66,6 +71,11 @@ class PerfilUsuario(models.Model):
         verbose_name_plural = "Perfiles de Usuarios"
         # Define el orden por defecto en las consultas: orden alfabético por nombre.
         ordering = ["nombre"]
+        indexes = [
+            # Login por email o por nombre sin distinguir mayúsculas (ver core/backends.py)
+            models.Index(Upper("email"), name="perfil_email_upper_idx"),
+            models.Index(Upper("nombre"), name="perfil_nombre_upper_idx"),
+        ]
 
     
     
@@ -79,26 +89,21 @@ class PerfilUsuario(models.Model):
         if self.tipo != 'atleta':
             return []  # Los entrenadores no tienen PRs personales
 
-        # 2. Filtrar series válidas
-        series_validas = SerieEjercicio.objects.filter(
-            detalle_entrenamiento__entrenamiento__atleta=self,
-            peso_real__isnull=False,
-            repeticiones_reales__isnull=False,
-            peso_real__gt=0,
-            repeticiones_reales__gt=0
-        ).select_related(
-            'detalle_entrenamiento__ejercicio',
-            'detalle_entrenamiento__entrenamiento'
+        # 2. Leer la tabla materializada de récords (una fila por ejercicio y REPETICIONES).
+        # La tabla se mantiene al día desde las señales de SerieEjercicio, así que
+        # ya no hace falta recorrer todo el historial de series del atleta.
+        # Se ordenan como el historial de series para respetar los mismos desempates.
+        marcas_guardadas = MarcaPersonal.objects.filter(atleta=self).select_related('ejercicio').order_by(
+            fecha_sesion('serie_origen__detalle_entrenamiento__entrenamiento__').desc(),
+            'serie_origen__detalle_entrenamiento__orden',
+            'serie_origen__numero_serie'
         )
         
-        # 3. Agrupar series por ejercicio y REPETICIONES
+        # 3. Agrupar récords por ejercicio
         marcas_por_ejercicio = {}
         
-        for serie in series_validas:
-            ejercicio = serie.detalle_entrenamiento.ejercicio
-            peso = Decimal(str(serie.peso_real))
-            reps = serie.repeticiones_reales
-            fecha = serie.detalle_entrenamiento.entrenamiento.created_at
+        for marca in marcas_guardadas:
+            ejercicio = marca.ejercicio
 
             if ejercicio.id not in marcas_por_ejercicio:
                 marcas_por_ejercicio[ejercicio.id] = {
@@ -106,17 +111,11 @@ class PerfilUsuario(models.Model):
                     'records_por_reps': {}
                 }
 
-            records = marcas_por_ejercicio[ejercicio.id]['records_por_reps']
-            
-            # Guardar el PESO MÁXIMO para cada número de repeticiones
-            if reps not in records or peso > records[reps]['peso']:
-                records[reps] = {
-                    'peso': peso,
-                    'repeticiones': reps,
-                    'fecha': fecha
-                }
-            elif peso == records[reps]['peso'] and fecha > records[reps]['fecha']:
-                records[reps]['fecha'] = fecha
+            marcas_por_ejercicio[ejercicio.id]['records_por_reps'][marca.repeticiones] = {
+                'peso': Decimal(str(marca.peso)),
+                'repeticiones': marca.repeticiones,
+                'fecha': marca.fecha
+            }
         
         # 4. Procesar récords por ejercicio
         marcas_finales = []
@@ -142,25 +141,14 @@ class PerfilUsuario(models.Model):
                     if record_max_peso_1rm is None or record['peso'] > record_max_peso_1rm['peso']:
                         record_max_peso_1rm = record.copy()
             
-            marcas_no_dominadas = []
-            for record_a in records_lista:
-                es_dominado = False
-                for record_b in records_lista:
-                    # No comparar un récord consigo mismo
-                    if record_a == record_b:
-                        continue
-                    
-                    # ¿'record_b' domina a 'record_a'?
-                    # (Si B tiene MÁS reps con un peso IGUAL O SUPERIOR)
-                    if (record_b['peso'] >= record_a['peso'] and 
-                        record_b['repeticiones'] > record_a['repeticiones']):
-                        
-                        es_dominado = True
-                        break # 'record_a' es dominado, no necesitamos seguir
-                
-                # Si, tras comprobar contra todos, no fue dominado, lo añadimos
-                if not es_dominado:
-                    marcas_no_dominadas.append(record_a)
+            # Mejor 1RM estimado (Epley) de todos los récords del ejercicio, en una pasada vectorizada
+            mejor_e1rm = estimar_1rm(
+                [record['peso'] for record in records_lista],
+                [record['repeticiones'] for record in records_lista]
+            ).max()
+
+            # Filtrar los récords dominados (frontera de Pareto, O(n log n))
+            marcas_no_dominadas = frontera_no_dominada(records_lista)
 
             # Ordenar la lista filtrada por repeticiones (ascendente: 1, 2, 3, ...)
             marcas_no_dominadas.sort(key=lambda x: x['repeticiones'])
@@ -171,6 +159,7 @@ class PerfilUsuario(models.Model):
                 'record_max_peso': record_max_peso,
                 'record_max_reps': record_max_reps,
                 'record_max_peso_1rm': record_max_peso_1rm,
+                'mejor_e1rm': round(float(mejor_e1rm), 2),
             })
 
         # 5. Ordenar ejercicios alfabéticamente
@@ -180,6 +169,19 @@ class PerfilUsuario(models.Model):
         return marcas_finales
     
 
+class ProgramaQuerySet(models.QuerySet):
+    """
+    Mesociclos y entrenamientos: bulk_create no lanza post_save, así que aquí se
+    invalida igualmente el dashboard cacheado de su entrenador y de su atleta.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .caching import invalidar_dashboards
+        objs = super().bulk_create(objs, *args, **kwargs)
+        invalidar_dashboards(*(perfil for obj in objs for perfil in (obj.entrenador_id, obj.atleta_id)))
+        return objs
+
+
 class Mesociclo(models.Model):
     """
     Agrupa varios entrenamientos en un bloque temporal (ej: 4 semanas).
@@ -214,6 +216,8 @@ class Mesociclo(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ProgramaQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.nombre} ({self.atleta.nombre})"
 
@@ -256,6 +260,24 @@ class Ejercicio(models.Model):
 # ----------------------------------------------------------------------
 # ENTRENAMIENTO
 # ----------------------------------------------------------------------
+class EntrenamientoQuerySet(ProgramaQuerySet):
+
+    def con_conteos(self):
+        """
+        Anota en cada entrenamiento, con la misma consulta, el número de ejercicios
+        (num_ejercicios), de series prescritas (num_series) y de series completadas
+        (num_series_completadas, ver serie_completada). Evita un COUNT por fila al
+        listar entrenamientos.
+        """
+        return self.annotate(
+            num_ejercicios=models.Count('detalles', distinct=True),
+            num_series=models.Count('detalles__series'),
+            num_series_completadas=models.Count(
+                'detalles__series', filter=serie_completada('detalles__series__', '')
+            ),
+        )
+
+
 class Entrenamiento(models.Model):
     """
     Modelo que representa una rutina o plan de entrenamiento asignado a un atleta
@@ -329,6 +351,12 @@ class Entrenamiento(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Cuándo registró el atleta la sesión (su primera serie; lo fija registrar_cambios_series).
+    # Es la fecha de la sesión en el historial (ver fecha_sesion)
+    registrado_en = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = EntrenamientoQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.nombre} - {self.atleta.nombre}"
 
@@ -336,11 +364,31 @@ class Entrenamiento(models.Model):
         verbose_name = "Entrenamiento"
         verbose_name_plural = "Entrenamientos"
         ordering = ["-created_at"]  # Orden descendente por fecha de creación.
+        indexes = [
+            # Rutinas del atleta, de la más reciente a la más antigua (paginación por cursor)
+            models.Index(fields=["atleta", "-created_at", "-id"], name="entreno_atleta_fecha_idx"),
+            # Actividad reciente de cada atleta (resumen de la lista de atletas)
+            models.Index(fields=["atleta", "-registrado_en"], name="entreno_atleta_registro_idx"),
+        ]
 
 
 # ----------------------------------------------------------------------
 # DETALLE DE ENTRENAMIENTO (Tabla intermedia entre Entrenamiento y Ejercicio)
 # ----------------------------------------------------------------------
+class DetalleEntrenamientoQuerySet(models.QuerySet):
+    """
+    bulk_update no dispara post_save: aquí se propagan igualmente los cambios de
+    orden o de ejercicio a las marcas personales y al volumen semanal.
+    """
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .services import registrar_cambios_detalles
+        objs = list(objs)
+        filas = super().bulk_update(objs, fields, *args, **kwargs)
+        registrar_cambios_detalles(objs)
+        return filas
+
+
 class DetalleEntrenamiento(models.Model):
     """
     Modelo intermedio que define la relación entre un entrenamiento y los ejercicios
@@ -397,6 +445,8 @@ class DetalleEntrenamiento(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DetalleEntrenamientoQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.orden}. {self.ejercicio.nombre} - {self.entrenamiento.nombre}"
 
@@ -404,10 +454,84 @@ class DetalleEntrenamiento(models.Model):
         verbose_name = "Detalle de Entrenamiento"
         verbose_name_plural = "Detalles de Entrenamientos"
         ordering = ["entrenamiento", "orden"]
+        indexes = [
+            # Historial de un ejercicio (ej: mejores series de un atleta en él)
+            models.Index(fields=["ejercicio", "entrenamiento"], name="detalle_ejercicio_entreno_idx"),
+        ]
 
 # ----------------------------------------------------------------------
 # SERIES DE EJERCICIOS 
 # ----------------------------------------------------------------------
+def serie_completada(ruta_serie='', ruta_entrenamiento='detalle_entrenamiento__entrenamiento__'):
+    """
+    Condición de serie completada, la misma en todo el proyecto: tiene repeticiones
+    reales y su entrenamiento lo ha registrado el atleta (Entrenamiento.registrado_en).
+    Las rutas permiten usarla desde otros modelos; desde Entrenamiento, por ejemplo,
+    serie_completada('detalles__series__', '').
+    """
+    return models.Q(**{
+        f'{ruta_serie}repeticiones_reales__gt': 0,
+        f'{ruta_entrenamiento}registrado_en__isnull': False,
+    })
+
+
+def fecha_sesion(ruta_entrenamiento='detalle_entrenamiento__entrenamiento__'):
+    """
+    Fecha de una sesión para el historial: cuándo la registró el atleta
+    (Entrenamiento.registrado_en) y, si aún no lo ha hecho, cuándo se creó.
+    No basta con created_at: al asignar o clonar un programa se crean todas sus
+    semanas a la vez y compartirían la misma fecha.
+    """
+    return Coalesce(f'{ruta_entrenamiento}registrado_en', f'{ruta_entrenamiento}created_at')
+
+
+class SerieEjercicioQuerySet(models.QuerySet):
+    """
+    bulk_create, bulk_update y update no disparan las señales post_save, así que
+    aquí se propagan igualmente los cambios a las marcas personales y a la caché.
+    delete() propaga una sola vez para todas las series borradas, en lugar de
+    hacerlo serie a serie desde la señal post_delete.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .services import registrar_cambios_series
+        objs = super().bulk_create(objs, *args, **kwargs)
+        registrar_cambios_series(objs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .services import registrar_cambios_series, series_en_bloque
+        objs = list(objs)
+        # bulk_update usa update() por debajo: se propaga una sola vez, aquí
+        with series_en_bloque():
+            filas = super().bulk_update(objs, fields, *args, **kwargs)
+        registrar_cambios_series(objs)
+        return filas
+
+    def update(self, **kwargs):
+        from .services import CAMPOS_REGISTRO_SERIE, propagacion_en_bloque_activa, registrar_cambios_series
+        campos_registro = {campo.removesuffix('_id') for campo in CAMPOS_REGISTRO_SERIE}
+        if propagacion_en_bloque_activa() or not campos_registro & {campo.removesuffix('_id') for campo in kwargs}:
+            return super().update(**kwargs)
+
+        # Valores de antes del UPDATE (post_init) y series actualizadas, para propagar solo lo que cambia
+        originales = {serie.pk: serie._valores_originales for serie in self}
+        filas = super().update(**kwargs)
+        series = list(self.model.objects.filter(pk__in=originales))
+        for serie in series:
+            serie._valores_originales = originales[serie.pk]
+        registrar_cambios_series(series)
+        return filas
+
+    def delete(self):
+        from .services import registrar_cambios_series, series_en_bloque
+        series = list(self)
+        with series_en_bloque():
+            resultado = super().delete()
+        registrar_cambios_series(series, borradas=True)
+        return resultado
+
+
 class SerieEjercicio(models.Model):
     """
     Modelo que registra los datos específicos de cada serie dentro de un ejercicio.
@@ -466,6 +590,8 @@ class SerieEjercicio(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = SerieEjercicioQuerySet.as_manager()
+
     def __str__(self):
         return f"Serie {self.numero_serie} - {self.detalle_entrenamiento.ejercicio.nombre}"
 
@@ -473,3 +599,273 @@ class SerieEjercicio(models.Model):
         verbose_name = "Serie de Ejercicio"
         verbose_name_plural = "Series de Ejercicios"
         ordering = ["detalle_entrenamiento", "numero_serie"]
+        indexes = [
+            # Series más pesadas de cada detalle (top-N por peso en AtletaProgresionMaxView)
+            models.Index(fields=["detalle_entrenamiento", "-peso_real"], name="serie_detalle_peso_idx"),
+        ]
+
+
+# ----------------------------------------------------------------------
+# MARCAS PERSONALES (Tabla materializada de récords)
+# ----------------------------------------------------------------------
+class MarcaPersonal(models.Model):
+    """
+    Récord personal precalculado de un atleta: el peso máximo levantado en un
+    ejercicio para un número concreto de repeticiones.
+    Se actualiza de forma incremental cada vez que cambia o se borra una serie
+    (ver core/signals.py) y puede reconstruirse con 'manage.py reconstruir_marcas'.
+    """
+
+    atleta = models.ForeignKey(
+        PerfilUsuario,
+        on_delete=models.CASCADE,
+        limit_choices_to={'tipo': 'atleta'},
+        related_name='marcas_personales'
+    )
+    ejercicio = models.ForeignKey(
+        Ejercicio,
+        on_delete=models.CASCADE,
+        related_name='marcas_personales'
+    )
+    repeticiones = models.PositiveIntegerField(verbose_name="Repeticiones")
+    peso = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Peso máximo (kg)")
+
+    # Fecha del entrenamiento en el que se consiguió la marca (el más reciente si hay empate).
+    fecha = models.DateTimeField()
+
+    # Primera serie con estas repeticiones en el orden natural del historial
+    # (entrenamiento más reciente, orden del ejercicio, número de serie): no es la
+    # serie del récord, sino la que fija el orden en que get_marcas_personales
+    # encontraba los récords. Se recalcula cuando cambia una serie o el orden o el
+    # ejercicio de su DetalleEntrenamiento (created_at del entrenamiento no se edita).
+    serie_origen = models.ForeignKey(
+        'SerieEjercicio',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.ejercicio.nombre}: {self.peso}kg x {self.repeticiones} ({self.atleta.nombre})"
+
+    class Meta:
+        verbose_name = "Marca Personal"
+        verbose_name_plural = "Marcas Personales"
+        ordering = ["ejercicio", "repeticiones"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["atleta", "ejercicio", "repeticiones"],
+                name="marca_personal_unica_por_reps"
+            ),
+        ]
+
+
+# ----------------------------------------------------------------------
+# VOLUMEN SEMANAL (Tabla materializada de volumen por mesociclo)
+# ----------------------------------------------------------------------
+class VolumenSemanal(models.Model):
+    """
+    Volumen de entrenamiento precalculado de un atleta en un ejercicio durante una
+    semana de un mesociclo: series prescritas y completadas, repeticiones, tonelaje
+    (peso × repeticiones) y RPE medio.
+    Guarda también la mejor serie y el mejor e1RM de la semana.
+    Se actualiza de forma incremental cada vez que cambia o se borra una serie
+    (ver core/signals.py) y puede reconstruirse con 'manage.py reconstruir_volumen'.
+    """
+
+    atleta = models.ForeignKey(
+        PerfilUsuario,
+        on_delete=models.CASCADE,
+        limit_choices_to={'tipo': 'atleta'},
+        related_name='volumenes_semanales'
+    )
+    mesociclo = models.ForeignKey(
+        Mesociclo,
+        on_delete=models.CASCADE,
+        related_name='volumenes_semanales'
+    )
+    semana = models.PositiveIntegerField(help_text="Número de semana dentro del mesociclo")
+    ejercicio = models.ForeignKey(
+        Ejercicio,
+        on_delete=models.CASCADE,
+        related_name='volumenes_semanales'
+    )
+
+    series_prescritas = models.PositiveIntegerField(default=0)
+    series_completadas = models.PositiveIntegerField(default=0, help_text="Series completadas (ver serie_completada)")
+    repeticiones = models.PositiveIntegerField(default=0, verbose_name="Repeticiones totales")
+    tonelaje = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Tonelaje (kg)")
+    rpe_medio = models.DecimalField(max_digits=3, decimal_places=1, null=True, blank=True, verbose_name="RPE medio")
+
+    # Resumen para la progresión semanal (core/analitica.py): sin series válidas quedan a NULL
+    fecha = models.DateTimeField(null=True, blank=True, help_text="Fecha de la primera sesión de la semana")
+    peso_maximo = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, verbose_name="Peso máximo (kg)")
+    repeticiones_peso_maximo = models.PositiveIntegerField(null=True, blank=True, help_text="Repeticiones de la serie más pesada")
+    e1rm_maximo = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, verbose_name="Mejor e1RM (Epley)")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"S{self.semana} {self.ejercicio.nombre}: {self.tonelaje}kg ({self.atleta.nombre})"
+
+    class Meta:
+        verbose_name = "Volumen Semanal"
+        verbose_name_plural = "Volúmenes Semanales"
+        ordering = ["mesociclo", "semana", "ejercicio"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["atleta", "mesociclo", "semana", "ejercicio"],
+                name="volumen_semanal_unico"
+            ),
+        ]
+
+
+# ----------------------------------------------------------------------
+# PLANTILLAS DE MESOCICLO (Programas reutilizables)
+# ----------------------------------------------------------------------
+class PlantillaMesociclo(models.Model):
+    """
+    Programa reutilizable guardado a partir de un mesociclo: todas sus semanas,
+    sesiones, ejercicios y series prescritas (sin datos de ejecución).
+    La estructura se guarda una sola vez como JSON y se instancia en bloque para
+    tantos atletas como se quiera (ver services.instanciar_plantilla).
+    """
+
+    entrenador = models.ForeignKey(
+        PerfilUsuario,
+        on_delete=models.CASCADE,
+        limit_choices_to={'tipo': 'entrenador'},
+        related_name='plantillas'
+    )
+    nombre = models.CharField(max_length=150)
+    objetivo = models.CharField(max_length=200, blank=True)
+    semanas_objetivo = models.PositiveIntegerField(default=4)
+    notas = models.TextField(blank=True)
+
+    # Lista de sesiones: [{semana, dia_orden, nombre, notas, detalles: [{ejercicio, orden,
+    # peso_recomendado, notas, series: [{numero_serie, repeticiones_o_rango, rpe_prescrito}]}]}]
+    estructura = models.JSONField(default=list)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.entrenador.nombre})"
+
+    @property
+    def total_sesiones(self):
+        return len(self.estructura)
+
+    class Meta:
+        verbose_name = "Plantilla de Mesociclo"
+        verbose_name_plural = "Plantillas de Mesociclo"
+        ordering = ["-created_at"]
+
+
+# ----------------------------------------------------------------------
+# TAREAS EN SEGUNDO PLANO (Cola en la propia base de datos)
+# ----------------------------------------------------------------------
+class Tarea(models.Model):
+    """
+    Trabajo pesado pendiente de ejecutar fuera de la petición web (copiar programas,
+    reconstruir tablas, enviar correos...). Lo procesan los trabajadores de
+    'manage.py procesar_tareas'; ver core/tareas.py.
+    """
+
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    COMPLETADA = 'completada'
+    FALLIDA = 'fallida'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (EN_CURSO, 'En curso'),
+        (COMPLETADA, 'Completada'),
+        (FALLIDA, 'Fallida'),
+    ]
+
+    tipo = models.CharField(max_length=50, help_text="Nombre de la tarea registrada (ej: 'asignar_programa')")
+    parametros = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=3)
+
+    # No se reclama antes de esta fecha (reintentos con espera exponencial)
+    disponible_en = models.DateTimeField(default=timezone.now)
+
+    # Trabajador que la está ejecutando y desde cuándo (para recuperar tareas huérfanas)
+    bloqueada_por = models.CharField(max_length=100, blank=True)
+    bloqueada_en = models.DateTimeField(null=True, blank=True)
+
+    # Progreso de las tareas por lotes (lo guarda tareas.informar_progreso tras cada lote)
+    hechos = models.PositiveIntegerField(null=True, blank=True)
+    total = models.PositiveIntegerField(null=True, blank=True)
+
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    creado_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='tareas'
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    terminada_en = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.tipo} ({self.get_estado_display()})"
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        ordering = ["-created_at"]
+        indexes = [
+            # Búsqueda de la siguiente tarea disponible por los trabajadores
+            models.Index(fields=["estado", "disponible_en"], name="tarea_estado_disponible_idx"),
+        ]
+
+
+# ----------------------------------------------------------------------
+# Claves de idempotencia del registro de series
+# ----------------------------------------------------------------------
+
+class ClaveIdempotencia(models.Model):
+    """
+    Clave enviada por el cliente con cada envío del registro de series (autoguardado).
+    Si el mismo envío llega dos veces (reintento tras un corte de red), se devuelve la
+    respuesta guardada en lugar de volver a aplicarlo: un reintento atrasado nunca
+    pisa valores más recientes. Caducan a los IDEMPOTENCIA_RETENCION_DIAS días y las
+    purgan los trabajadores de la cola (tareas.mantenimiento).
+    """
+
+    atleta = models.ForeignKey(
+        PerfilUsuario,
+        on_delete=models.CASCADE,
+        related_name='claves_idempotencia',
+        limit_choices_to={'tipo': 'atleta'}
+    )
+    clave = models.CharField(max_length=64)
+
+    # Respuesta del primer envío (series con sus valores guardados)
+    respuesta = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.atleta} - {self.clave}"
+
+    class Meta:
+        verbose_name = "Clave de Idempotencia"
+        verbose_name_plural = "Claves de Idempotencia"
+        constraints = [
+            models.UniqueConstraint(fields=["atleta", "clave"], name="clave_idempotencia_unica"),
+        ]
+        # Para purgar las claves caducadas (ver services.purgar_claves_idempotencia)
+        indexes = [
+            models.Index(fields=["created_at"], name="clave_idempotencia_fecha_idx"),
+        ]
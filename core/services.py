@@ -1,80 +1,1279 @@
-from django.db import transaction
-from .models import Entrenamiento, DetalleEntrenamiento, SerieEjercicio
+import base64
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from decimal import Decimal, ROUND_HALF_UP
+from django.db.models import (
+    Avg, Case, Count, DecimalField, Exists, F, FloatField, Max, Min, OuterRef, Prefetch, Q, Subquery, Sum, When,
+    Window,
+)
+from django.db.models.functions import Cast, Coalesce, FirstValue, RowNumber
+from django.utils import timezone
+from .models import (
+    ClaveIdempotencia, Ejercicio, Entrenamiento, DetalleEntrenamiento, SerieEjercicio, MarcaPersonal,
+    Mesociclo, PerfilUsuario, PlantillaMesociclo, VolumenSemanal, fecha_sesion, serie_completada,
+)
+from .caching import invalidar_datos_atletas
+from .marcas import resumir_marcas_por_atleta
 
 def replicar_planificacion_semanal(entrenamiento_origen, semanas_destino):
     """
     Toma un entrenamiento existente (ej: Semana 1, Día A) y crea copias idénticas
     para las semanas indicadas, pero SIN los datos de ejecución (pesos reales/RPE real).
-    
+
+    El número de consultas es constante, sea cual sea el número de semanas,
+    ejercicios o series: se lee el entrenamiento origen una sola vez, se comprueban
+    los duplicados de todas las semanas con una única consulta y cada nivel
+    (entrenamientos, detalles y series) se inserta con un solo bulk_create.
+
     Args:
         entrenamiento_origen (Entrenamiento): El objeto base a copiar.
         semanas_destino (list[int]): Lista de números de semana (ej: [2, 3, 4]).
+
+    Returns:
+        list[Entrenamiento]: Los entrenamientos creados (uno por semana nueva).
     """
-    
+
     # Validaciones básicas
-    if not entrenamiento_origen.mesociclo:
+    if not entrenamiento_origen.mesociclo_id:
         raise ValueError("Este entrenamiento no pertenece a un mesociclo.")
-    
-    nuevos_entrenamientos = []
 
     with transaction.atomic():
-        for num_semana in semanas_destino:
-            
-            # 1. Verificar si ya existe ese día en esa semana para evitar duplicados
-            ya_existe = Entrenamiento.objects.filter(
-                mesociclo=entrenamiento_origen.mesociclo,
-                semana=num_semana,
-                dia_orden=entrenamiento_origen.dia_orden
-            ).exists()
-            
-            if ya_existe:
-                continue # Saltamos si ya existe para no machacar datos por error
-
-            # 2. Copiar el objeto Entrenamiento (Cabecera)
-            nuevo_entreno = Entrenamiento.objects.create(
-                entrenador=entrenamiento_origen.entrenador,
-                atleta=entrenamiento_origen.atleta,
-                mesociclo=entrenamiento_origen.mesociclo,
+        # 1. Descartar las semanas en las que ya existe ese día (para no machacar datos por error)
+        ya_existen = set(Entrenamiento.objects.filter(
+            mesociclo_id=entrenamiento_origen.mesociclo_id,
+            semana__in=semanas_destino,
+            dia_orden=entrenamiento_origen.dia_orden
+        ).values_list('semana', flat=True))
+
+        semanas = [s for s in dict.fromkeys(semanas_destino) if s not in ya_existen]
+        if not semanas:
+            return []
+
+        # 2. Leer el árbol origen una sola vez (detalles y sus series)
+        detalles_origen = list(
+            entrenamiento_origen.detalles.order_by('orden').prefetch_related(
+                Prefetch('series', queryset=SerieEjercicio.objects.order_by('numero_serie'))
+            )
+        )
+
+        # 3. Copiar los objetos Entrenamiento (Cabecera), uno por semana
+        nuevos_entrenamientos = Entrenamiento.objects.bulk_create([
+            Entrenamiento(
+                entrenador_id=entrenamiento_origen.entrenador_id,
+                atleta_id=entrenamiento_origen.atleta_id,
+                mesociclo_id=entrenamiento_origen.mesociclo_id,
                 nombre=entrenamiento_origen.nombre, # Ej: "Torso A"
                 notas=entrenamiento_origen.notas,   # Copiamos notas generales
                 dia_orden=entrenamiento_origen.dia_orden, # Mismo "Día A"
                 semana=num_semana # Cambiamos solo la semana
             )
-            
-            # 3. Copiar Detalles (Ejercicios)
-            detalles_origen = entrenamiento_origen.detalles.all().order_by('orden')
-            
-            for detalle in detalles_origen:
-                nuevo_detalle = DetalleEntrenamiento.objects.create(
-                    entrenamiento=nuevo_entreno,
-                    ejercicio=detalle.ejercicio,
-                    orden=detalle.orden,
-                    peso_recomendado=detalle.peso_recomendado, # Opcional: Copiar o dejar None
-                    notas=detalle.notas
-                )
-                
-                # 4. Copiar Series (Aquí está la clave del RPE)
-                series_origen = detalle.series.all().order_by('numero_serie')
-                
-                # ¡ATENCIÓN A LA INDENTACIÓN AQUÍ! Debe ir dentro del "for detalle"
-                for serie in series_origen:
-                    SerieEjercicio.objects.create(
-                        detalle_entrenamiento=nuevo_detalle,
-                        numero_serie=serie.numero_serie,
-                        
-                        # --- LO QUE SE COPIA (La prescripción del entrenador) ---
-                        repeticiones_o_rango=serie.repeticiones_o_rango,
-                        rpe_prescrito=serie.rpe_prescrito, 
-                        
-                        # --- LO QUE AHORA SE MANTIENE COMO REFERENCIA ---
-                        peso_real=serie.peso_real,                    # Mantiene el peso de la semana anterior
-                        repeticiones_reales=serie.repeticiones_reales, # Mantiene las repeticiones logradas
-                        
-                        # --- LO QUE SE LIMPIA (El feedback de la nueva sesión) ---
-                        rpe_real=None                                 # Se vacía el esfuerzo percibido para que lo rellene
-                    )
-            
-            # Esto debe ir fuera del "for detalle", para añadir el entreno una sola vez
-            nuevos_entrenamientos.append(nuevo_entreno)
-            
-    return nuevos_entrenamientos
\ No newline at end of file
+            for num_semana in semanas
+        ])
+
+        # 4. Copiar Detalles (Ejercicios) de todas las semanas
+        nuevos_detalles = DetalleEntrenamiento.objects.bulk_create([
+            DetalleEntrenamiento(
+                entrenamiento=nuevo_entreno,
+                ejercicio_id=detalle.ejercicio_id,
+                orden=detalle.orden,
+                peso_recomendado=detalle.peso_recomendado, # Opcional: Copiar o dejar None
+                notas=detalle.notas
+            )
+            for nuevo_entreno in nuevos_entrenamientos
+            for detalle in detalles_origen
+        ])
+
+        # 5. Copiar Series (Aquí está la clave del RPE), en el mismo orden que los detalles
+        origen_por_detalle = detalles_origen * len(nuevos_entrenamientos)
+        SerieEjercicio.objects.bulk_create([
+            SerieEjercicio(
+                detalle_entrenamiento=nuevo_detalle,
+                numero_serie=serie.numero_serie,
+
+                # --- LO QUE SE COPIA (La prescripción del entrenador) ---
+                repeticiones_o_rango=serie.repeticiones_o_rango,
+                rpe_prescrito=serie.rpe_prescrito,
+
+                # --- LO QUE SE LIMPIA (El feedback de la nueva sesión) ---
+                # Los valores reales no se copian: una semana sin entrenar no cuenta como
+                # completada. Los de la semana anterior se muestran como referencia al
+                # registrar (ver series_semana_anterior).
+            )
+            for nuevo_detalle, detalle in zip(nuevos_detalles, origen_por_detalle)
+            for serie in detalle.series.all()
+        ])
+
+    return nuevos_entrenamientos
+
+
+def series_semana_anterior(entrenamiento):
+    """
+    Series del mismo día de la semana anterior del mesociclo, para mostrarlas como
+    referencia (la semana clonada no copia los valores reales).
+
+    Returns:
+        tuple: (entrenamiento previo o None, dict (ejercicio_id, numero_serie) -> SerieEjercicio)
+    """
+    if not entrenamiento.mesociclo_id or entrenamiento.semana <= 1:
+        return None, {}
+
+    # El entrenamiento equivalente: mismo mesociclo, semana previa y mismo día
+    entreno_previo = Entrenamiento.objects.filter(
+        mesociclo_id=entrenamiento.mesociclo_id,
+        semana=entrenamiento.semana - 1,
+        dia_orden=entrenamiento.dia_orden
+    ).first()
+    if entreno_previo is None:
+        # Si no existe la semana anterior (ej: se saltó una semana), no hay referencia
+        return None, {}
+
+    series = SerieEjercicio.objects.filter(
+        detalle_entrenamiento__entrenamiento=entreno_previo
+    ).select_related('detalle_entrenamiento')
+    return entreno_previo, {
+        (serie.detalle_entrenamiento.ejercicio_id, serie.numero_serie): serie for serie in series
+    }
+
+
+# -------------------------------------------------
+# CLONADO DE MESOCICLOS Y PLANTILLAS
+# -------------------------------------------------
+
+def _decimal_o_none(valor):
+    return None if valor is None else Decimal(str(valor))
+
+
+def estructura_mesociclo(mesociclo):
+    """
+    Lee en tres consultas el árbol completo de un mesociclo (sesiones, ejercicios
+    y series) y lo devuelve como estructura serializable en JSON, solo con la
+    prescripción del entrenador (sin pesos, repeticiones ni RPE reales).
+
+    Returns:
+        list[dict]: Sesiones con sus detalles y series (ver PlantillaMesociclo.estructura).
+    """
+    entrenamientos = mesociclo.entrenamientos.order_by('semana', 'dia_orden', 'created_at').prefetch_related(
+        Prefetch('detalles', queryset=DetalleEntrenamiento.objects.order_by('orden')),
+        Prefetch('detalles__series', queryset=SerieEjercicio.objects.order_by('numero_serie')),
+    )
+    return [
+        {
+            'semana': entreno.semana,
+            'dia_orden': entreno.dia_orden,
+            'nombre': entreno.nombre,
+            'notas': entreno.notas,
+            'detalles': [
+                {
+                    'ejercicio': detalle.ejercicio_id,
+                    'orden': detalle.orden,
+                    'peso_recomendado': None if detalle.peso_recomendado is None else str(detalle.peso_recomendado),
+                    'notas': detalle.notas,
+                    'series': [
+                        {
+                            'numero_serie': serie.numero_serie,
+                            'repeticiones_o_rango': serie.repeticiones_o_rango,
+                            'rpe_prescrito': None if serie.rpe_prescrito is None else str(serie.rpe_prescrito),
+                        }
+                        for serie in detalle.series.all()
+                    ],
+                }
+                for detalle in entreno.detalles.all()
+            ],
+        }
+        for entreno in entrenamientos
+    ]
+
+
+# Atletas por lote al asignar un programa en bloque (y tamaño máximo de cada INSERT)
+ATLETAS_POR_LOTE = 50
+FILAS_POR_INSERT = 1000
+
+
+def asignar_entrenador_a_atletas(entrenador, atletas):
+    """
+    Versión en bloque de la señal 'asignar_entrenador_a_atleta' (core/signals.py),
+    para cuando los entrenamientos se crean con bulk_create y la señal no se lanza:
+    los atletas que aún no tienen entrenador pasan a tener asignado 'entrenador'.
+    Actualiza también las instancias en memoria.
+    """
+    atletas = [atleta for atleta in atletas if atleta.entrenador_id is None]
+    if not atletas:
+        return
+    PerfilUsuario.objects.filter(
+        pk__in=[atleta.pk for atleta in atletas], entrenador__isnull=True
+    ).update(entrenador=entrenador)
+    for atleta in atletas:
+        atleta.entrenador = entrenador
+
+
+def _instanciar_lote(estructura, atletas, datos_mesociclo, ejercicios_existentes):
+    """Crea los mesociclos de un lote de atletas con un bulk_create por nivel."""
+    entrenador = datos_mesociclo['entrenador']
+    mesociclos = Mesociclo.objects.bulk_create(
+        [Mesociclo(atleta=atleta, **datos_mesociclo) for atleta in atletas],
+        batch_size=FILAS_POR_INSERT
+    )
+
+    entrenamientos = Entrenamiento.objects.bulk_create([
+        Entrenamiento(
+            entrenador=entrenador,
+            atleta=mesociclo.atleta,
+            mesociclo=mesociclo,
+            nombre=sesion['nombre'],
+            notas=sesion['notas'],
+            semana=sesion['semana'],
+            dia_orden=sesion['dia_orden'],
+        )
+        for mesociclo in mesociclos
+        for sesion in estructura
+    ], batch_size=FILAS_POR_INSERT)
+
+    # Cada detalle creado va emparejado con su detalle de la estructura (mismo orden)
+    detalles_origen = [
+        detalle
+        for _ in mesociclos
+        for sesion in estructura
+        for detalle in sesion['detalles']
+        if detalle['ejercicio'] in ejercicios_existentes
+    ]
+    detalles = DetalleEntrenamiento.objects.bulk_create([
+        DetalleEntrenamiento(
+            entrenamiento=entreno,
+            ejercicio_id=detalle['ejercicio'],
+            orden=detalle['orden'],
+            peso_recomendado=_decimal_o_none(detalle['peso_recomendado']),
+            notas=detalle['notas'],
+        )
+        for entreno, sesion in zip(entrenamientos, estructura * len(mesociclos))
+        for detalle in sesion['detalles']
+        if detalle['ejercicio'] in ejercicios_existentes
+    ], batch_size=FILAS_POR_INSERT)
+
+    SerieEjercicio.objects.bulk_create([
+        SerieEjercicio(
+            detalle_entrenamiento=detalle,
+            numero_serie=serie['numero_serie'],
+            repeticiones_o_rango=serie['repeticiones_o_rango'],
+            rpe_prescrito=_decimal_o_none(serie['rpe_prescrito']),
+        )
+        for detalle, origen in zip(detalles, detalles_origen)
+        for serie in origen['series']
+    ], batch_size=FILAS_POR_INSERT)
+
+    asignar_entrenador_a_atletas(entrenador, atletas)
+    return mesociclos
+
+
+def instanciar_programa(estructura, atletas, entrenador, nombre, objetivo='', semanas_objetivo=4, notas='',
+                        fecha_inicio=None, lote=None, progreso=None, omitir=0):
+    """
+    Crea un mesociclo por atleta a partir de una estructura de sesiones, con un
+    bulk_create por nivel (mesociclos, entrenamientos, detalles y series). Los atletas
+    se procesan en lotes de 'lote' (ATLETAS_POR_LOTE por defecto): el número de consultas no depende de semanas ni
+    series, y solo crece con el número de lotes.
+
+    Cada lote se guarda en su propia transacción, junto con su progreso (que se informa
+    dentro de ella): el progreso es visible mientras se ejecuta (ver Tarea.hechos) y,
+    si falla un lote, los anteriores quedan creados y registrados como hechos. Basta
+    con repetir indicando en 'omitir' los atletas ya hechos; nunca se duplica un lote.
+
+    Los ejercicios que ya no existen se omiten. Como bulk_create no lanza señales,
+    se aplica la regla de 'asignar_entrenador_a_atleta' con asignar_entrenador_a_atletas().
+
+    Args:
+        progreso (callable | None): Se llama como progreso(hechos, total, mesociclos) al
+            final de cada lote, dentro de su transacción; 'mesociclos' son los creados
+            hasta entonces en esta llamada.
+        omitir (int): Atletas del principio de la lista ya procesados, que se saltan.
+
+    Returns:
+        list[Mesociclo]: Los mesociclos creados, en el orden de 'atletas'.
+    """
+    atletas = list(atletas)
+    lote = lote or ATLETAS_POR_LOTE
+    if len(atletas) <= omitir:
+        return []
+
+    datos_mesociclo = {
+        'entrenador': entrenador,
+        'nombre': nombre,
+        'objetivo': objetivo,
+        'semanas_objetivo': semanas_objetivo,
+        'notas': notas,
+        'fecha_inicio': fecha_inicio or timezone.localdate(),
+    }
+
+    ejercicios_existentes = set(Ejercicio.objects.filter(
+        pk__in={d['ejercicio'] for sesion in estructura for d in sesion['detalles']}
+    ).values_list('pk', flat=True))
+
+    mesociclos = []
+    for inicio in range(omitir, len(atletas), lote):
+        with transaction.atomic():
+            mesociclos += _instanciar_lote(
+                estructura, atletas[inicio:inicio + lote], datos_mesociclo, ejercicios_existentes
+            )
+            if progreso:
+                progreso(min(inicio + lote, len(atletas)), len(atletas), mesociclos)
+
+    return mesociclos
+
+
+def clonar_mesociclo(mesociclo, atletas, fecha_inicio=None, **opciones):
+    """
+    Copia un mesociclo completo (todas las semanas, sesiones, ejercicios y series
+    prescritas) para uno o varios atletas.
+
+    Returns:
+        list[Mesociclo]: Los mesociclos creados.
+    """
+    return instanciar_programa(
+        estructura_mesociclo(mesociclo),
+        atletas,
+        entrenador=mesociclo.entrenador,
+        nombre=mesociclo.nombre,
+        objetivo=mesociclo.objetivo,
+        semanas_objetivo=mesociclo.semanas_objetivo,
+        notas=mesociclo.notas,
+        fecha_inicio=fecha_inicio,
+        **opciones
+    )
+
+
+def asignar_programa(mesociclo, atleta_ids, fecha_inicio=None, **opciones):
+    """
+    Asigna en bloque una copia del mesociclo a cada atleta de 'atleta_ids'.
+    Solo se aceptan atletas del entrenador del mesociclo o sin entrenador (como en
+    MesocicloForm); el resto de ids se devuelven como ignorados.
+
+    Returns:
+        tuple: (list[Mesociclo] creados, list[int] ids ignorados)
+    """
+    atleta_ids = list(dict.fromkeys(atleta_ids))
+    validos = {
+        atleta.pk: atleta
+        for atleta in PerfilUsuario.objects.filter(
+            Q(entrenador=mesociclo.entrenador) | Q(entrenador__isnull=True),
+            pk__in=atleta_ids,
+            tipo='atleta',
+        )
+    }
+    atletas = [validos[pk] for pk in atleta_ids if pk in validos]
+    ignorados = [pk for pk in atleta_ids if pk not in validos]
+    return clonar_mesociclo(mesociclo, atletas, fecha_inicio, **opciones), ignorados
+
+
+def crear_plantilla_desde_mesociclo(mesociclo, nombre=None):
+    """Guarda la estructura de un mesociclo como plantilla reutilizable de su entrenador."""
+    return PlantillaMesociclo.objects.create(
+        entrenador=mesociclo.entrenador,
+        nombre=nombre or mesociclo.nombre,
+        objetivo=mesociclo.objetivo,
+        semanas_objetivo=mesociclo.semanas_objetivo,
+        notas=mesociclo.notas,
+        estructura=estructura_mesociclo(mesociclo),
+    )
+
+
+def instanciar_plantilla(plantilla, atletas, fecha_inicio=None, **opciones):
+    """
+    Crea un mesociclo a partir de la plantilla para cada atleta (ver instanciar_programa).
+
+    Returns:
+        list[Mesociclo]: Los mesociclos creados.
+    """
+    return instanciar_programa(
+        plantilla.estructura,
+        atletas,
+        entrenador=plantilla.entrenador,
+        nombre=plantilla.nombre,
+        objetivo=plantilla.objetivo,
+        semanas_objetivo=plantilla.semanas_objetivo,
+        notas=plantilla.notas,
+        fecha_inicio=fecha_inicio,
+        **opciones
+    )
+
+
+# -------------------------------------------------
+# MARCAS PERSONALES (Tabla materializada)
+# -------------------------------------------------
+
+def series_validas_para_marcas():
+    """
+    Series que cuentan para los récords: completadas (ver serie_completada) y con peso.
+    """
+    return SerieEjercicio.objects.filter(
+        serie_completada(),
+        peso_real__isnull=False,
+        peso_real__gt=0,
+    )
+
+
+def mejores_series_por_repeticiones(series):
+    """
+    Reduce en la base de datos un queryset de series a UNA fila por
+    (atleta, ejercicio, repeticiones): la de mayor peso y, en caso de empate,
+    la de la sesión más reciente (fecha_sesion: registro del atleta, no creación).
+
+    Usa ROW_NUMBER() OVER (PARTITION BY ... ORDER BY ...), disponible tanto en
+    SQLite como en PostgreSQL, de modo que solo viajan a Python las filas ganadoras.
+
+    Además devuelve la primera serie de cada grupo en el orden natural del historial
+    (entrenamiento más reciente, orden del ejercicio, número de serie), que es el
+    orden en el que se desempatan los récords al mostrarlos.
+
+    Returns:
+        QuerySet de tuplas (atleta_id, ejercicio_id, repeticiones, peso, fecha, serie_origen_id).
+    """
+    atleta = 'detalle_entrenamiento__entrenamiento__atleta_id'
+    ejercicio = 'detalle_entrenamiento__ejercicio_id'
+    particion = [F(atleta), F(ejercicio), F('repeticiones_reales')]
+
+    return series.order_by().annotate(
+        fecha_marca=fecha_sesion(),
+    ).annotate(
+        posicion=Window(
+            expression=RowNumber(),
+            partition_by=particion,
+            order_by=[F('peso_real').desc(), F('fecha_marca').desc()]
+        ),
+        serie_origen_id=Window(
+            expression=FirstValue('pk'),
+            partition_by=particion,
+            order_by=[F('fecha_marca').desc(), F('detalle_entrenamiento__orden').asc(), F('numero_serie').asc()]
+        ),
+    ).filter(posicion=1).values_list(
+        atleta, ejercicio, 'repeticiones_reales', 'peso_real', 'fecha_marca', 'serie_origen_id'
+    )
+
+
+def recalcular_marcas_personales(claves):
+    """
+    Recalcula de forma incremental las filas de MarcaPersonal afectadas por un cambio
+    en las series. Solo toca las claves (atleta, ejercicio, repeticiones) indicadas,
+    sin volver a recorrer el resto del historial, y lo hace en bloque: una consulta
+    de ventana, un upsert y, si algún récord se ha quedado sin series, un borrado.
+
+    Args:
+        claves (iterable[tuple]): Tuplas (atleta_id, ejercicio_id, repeticiones).
+    """
+    claves = {clave for clave in claves if clave[2]}
+    if not claves:
+        return
+
+    marcas = [
+        MarcaPersonal(
+            atleta_id=atleta_id,
+            ejercicio_id=ejercicio_id,
+            repeticiones=reps,
+            peso=peso,
+            fecha=fecha,
+            serie_origen_id=serie_origen_id
+        )
+        for atleta_id, ejercicio_id, reps, peso, fecha, serie_origen_id in mejores_series_por_repeticiones(
+            series_validas_para_marcas().filter(
+                detalle_entrenamiento__entrenamiento__atleta_id__in={c[0] for c in claves},
+                detalle_entrenamiento__ejercicio_id__in={c[1] for c in claves},
+                repeticiones_reales__in={c[2] for c in claves}
+            )
+        )
+        if (atleta_id, ejercicio_id, reps) in claves
+    ]
+
+    # Ya no queda ninguna serie válida con esas repeticiones
+    sin_series = claves - {(m.atleta_id, m.ejercicio_id, m.repeticiones) for m in marcas}
+    if sin_series:
+        filtro = Q()
+        for atleta_id, ejercicio_id, reps in sin_series:
+            filtro |= Q(atleta_id=atleta_id, ejercicio_id=ejercicio_id, repeticiones=reps)
+        MarcaPersonal.objects.filter(filtro).delete()
+
+    MarcaPersonal.objects.bulk_create(
+        marcas,
+        update_conflicts=True,
+        unique_fields=['atleta', 'ejercicio', 'repeticiones'],
+        update_fields=['peso', 'fecha', 'serie_origen', 'updated_at'],
+    )
+
+
+# Campos de SerieEjercicio de los que dependen las marcas personales, el volumen semanal y la caché del atleta
+CAMPOS_REGISTRO_SERIE = {'detalle_entrenamiento_id', 'peso_real', 'repeticiones_reales', 'numero_serie', 'rpe_real'}
+
+
+def valores_registro_serie(serie):
+    """
+    Campos de una serie que afectan a los datos derivados del atleta
+    (récords, volumen semanal y caché): (detalle, peso, reps, número de serie, RPE real).
+    """
+    return (
+        serie.detalle_entrenamiento_id,
+        serie.peso_real,
+        serie.repeticiones_reales,
+        serie.numero_serie,
+        serie.rpe_real,
+    )
+
+
+# Mientras está activo, ni las señales de SerieEjercicio ni SerieEjercicioQuerySet.update()
+# propagan nada por su cuenta: quien opera en bloque llama después una sola vez a
+# registrar_cambios_series.
+_series_en_bloque = ContextVar('series_en_bloque', default=False)
+
+
+@contextmanager
+def series_en_bloque():
+    """Desactiva la propagación por serie (ver SerieEjercicioQuerySet.bulk_update y delete)."""
+    token = _series_en_bloque.set(True)
+    try:
+        yield
+    finally:
+        _series_en_bloque.reset(token)
+
+
+def propagacion_en_bloque_activa():
+    return _series_en_bloque.get()
+
+
+def registrar_cambios_series(series, borradas=False):
+    """
+    Propaga los cambios de un conjunto de series ya guardadas (o borradas):
+    recalcula las marcas personales y el volumen semanal afectados, marca la
+    fecha de registro (registrado_en) de los entrenamientos que el atleta registra
+    por primera vez e invalida la caché de sus atletas.
+
+    Compara los valores actuales con los que tenía cada serie al cargarse
+    ('_valores_originales', ver core/signals.py), así que las series sin cambios
+    relevantes no generan ninguna consulta. Se usa tanto desde las señales
+    (una serie) como desde bulk_create/bulk_update (muchas series a la vez).
+    """
+    cambios = []
+    for serie in series:
+        original = getattr(serie, '_valores_originales', None)
+        actual = None if borradas else valores_registro_serie(serie)
+        serie._valores_originales = actual
+        if original != actual:
+            cambios.append((original, actual))
+
+    if not cambios:
+        return
+
+    detalle_ids = {v[0] for par in cambios for v in par if v is not None}
+    claves_por_detalle = {}
+    entrenamiento_por_detalle = {}
+    for detalle_id, entrenamiento_id, atleta_id, ejercicio_id, mesociclo_id, semana in DetalleEntrenamiento.objects.filter(
+        pk__in=detalle_ids
+    ).values_list(
+        'pk', 'entrenamiento_id', 'entrenamiento__atleta_id', 'ejercicio_id',
+        'entrenamiento__mesociclo_id', 'entrenamiento__semana'
+    ):
+        claves_por_detalle[detalle_id] = (atleta_id, ejercicio_id, mesociclo_id, semana)
+        entrenamiento_por_detalle[detalle_id] = entrenamiento_id
+
+    # Registro del atleta: una serie pasa a tener repeticiones reales o las cambia
+    # (al clonar semanas no se copian los valores reales, así que no cuenta)
+    registrados = {
+        entrenamiento_por_detalle[actual[0]]
+        for original, actual in cambios
+        if actual is not None and actual[2]
+        and (original is None or original[1:3] + original[4:] != actual[1:3] + actual[4:])
+        and actual[0] in entrenamiento_por_detalle
+    }
+
+    atletas = set()
+    marcas_a_recalcular = set()  # (atleta, ejercicio, repeticiones)
+    semanas_a_recalcular = set()  # (atleta, mesociclo, semana, ejercicio)
+    for original, actual in cambios:
+        for valores in (original, actual):
+            if valores is None or valores[0] not in claves_por_detalle:
+                continue
+            atleta_id, ejercicio_id, mesociclo_id, semana = claves_por_detalle[valores[0]]
+            atletas.add(atleta_id)
+
+            # Renumerar una serie no cambia el volumen de la semana
+            if mesociclo_id is not None and (
+                original is None or actual is None
+                or original[:3] + original[4:] != actual[:3] + actual[4:]
+            ):
+                semanas_a_recalcular.add((atleta_id, mesociclo_id, semana, ejercicio_id))
+
+            # Solo importan para los récords los cambios de detalle, peso, reps o número de serie
+            detalle_id, peso, reps, numero_serie, _ = valores
+            if original is not None and actual is not None and original[:4] == actual[:4]:
+                continue
+            if peso and reps:
+                marcas_a_recalcular.add((atleta_id, ejercicio_id, reps))
+
+    # registrado_en decide qué series están completadas: se fija antes de recalcular.
+    # Solo la primera vez: es la fecha de la sesión en el historial (fecha_sesion) y
+    # corregir una serie días después no la cambia
+    if registrados:
+        primeros = list(Entrenamiento.objects.filter(
+            pk__in=registrados, registrado_en__isnull=True
+        ).values_list('pk', flat=True))
+        Entrenamiento.objects.filter(pk__in=primeros).update(registrado_en=timezone.now())
+
+        # En un entrenamiento registrado por primera vez pasan a contar todas sus series
+        if primeros:
+            for atleta_id, ejercicio_id, mesociclo_id, semana, peso, reps in SerieEjercicio.objects.filter(
+                detalle_entrenamiento__entrenamiento_id__in=primeros, repeticiones_reales__gt=0
+            ).values_list(
+                'detalle_entrenamiento__entrenamiento__atleta_id', 'detalle_entrenamiento__ejercicio_id',
+                'detalle_entrenamiento__entrenamiento__mesociclo_id', 'detalle_entrenamiento__entrenamiento__semana',
+                'peso_real', 'repeticiones_reales'
+            ).distinct():
+                if mesociclo_id is not None:
+                    semanas_a_recalcular.add((atleta_id, mesociclo_id, semana, ejercicio_id))
+                if peso:
+                    marcas_a_recalcular.add((atleta_id, ejercicio_id, reps))
+
+    recalcular_marcas_personales(marcas_a_recalcular)
+    recalcular_volumen_semanal(semanas_a_recalcular)
+
+    invalidar_datos_atletas(*atletas)
+
+
+def registrar_cambios_detalles(detalles):
+    """
+    Propaga los cambios de orden o de ejercicio de unos DetalleEntrenamiento ya
+    guardados: el orden fija la serie_origen de las marcas personales y el
+    ejercicio, a qué récords y semanas de volumen cuentan sus series.
+
+    Como registrar_cambios_series, compara con los valores al cargarse
+    ('_valores_originales', ver core/signals.py): sin cambios no hay consultas.
+    """
+    ejercicio_anterior = {}
+    for detalle in detalles:
+        original = getattr(detalle, '_valores_originales', None)
+        actual = (detalle.ejercicio_id, detalle.orden)
+        detalle._valores_originales = actual
+        if original != actual:
+            # Sin valores originales (campos diferidos) se recalcula con el ejercicio actual
+            ejercicio_anterior[detalle.pk] = original[0] if original else detalle.ejercicio_id
+
+    if not ejercicio_anterior:
+        return
+
+    atletas = set()
+    marcas_a_recalcular = set()  # (atleta, ejercicio, repeticiones)
+    semanas_a_recalcular = set()  # (atleta, mesociclo, semana, ejercicio)
+    for detalle_id, atleta_id, ejercicio_id, mesociclo_id, semana, reps in SerieEjercicio.objects.filter(
+        detalle_entrenamiento_id__in=ejercicio_anterior
+    ).values_list(
+        'detalle_entrenamiento_id', 'detalle_entrenamiento__entrenamiento__atleta_id',
+        'detalle_entrenamiento__ejercicio_id', 'detalle_entrenamiento__entrenamiento__mesociclo_id',
+        'detalle_entrenamiento__entrenamiento__semana', 'repeticiones_reales'
+    ).distinct():
+        atletas.add(atleta_id)
+        for ejercicio in {ejercicio_id, ejercicio_anterior[detalle_id]}:
+            if reps:
+                marcas_a_recalcular.add((atleta_id, ejercicio, reps))
+            # Reordenar no cambia el volumen; cambiar de ejercicio lo mueve de fila
+            if mesociclo_id is not None and ejercicio_anterior[detalle_id] != ejercicio_id:
+                semanas_a_recalcular.add((atleta_id, mesociclo_id, semana, ejercicio))
+
+    recalcular_marcas_personales(marcas_a_recalcular)
+    recalcular_volumen_semanal(semanas_a_recalcular)
+    invalidar_datos_atletas(*atletas)
+
+
+def reconstruir_marcas_personales(atleta=None):
+    """
+    Reconstruye desde cero la tabla MarcaPersonal a partir de las series registradas.
+    Si se indica un atleta, solo se reconstruyen sus récords.
+
+    Returns:
+        int: Número de récords generados.
+    """
+    series = series_validas_para_marcas()
+    if atleta is not None:
+        series = series.filter(detalle_entrenamiento__entrenamiento__atleta=atleta)
+
+    marcas = [
+        MarcaPersonal(
+            atleta_id=atleta_id,
+            ejercicio_id=ejercicio_id,
+            repeticiones=reps,
+            peso=peso,
+            fecha=fecha,
+            serie_origen_id=serie_origen_id
+        )
+        for atleta_id, ejercicio_id, reps, peso, fecha, serie_origen_id in mejores_series_por_repeticiones(series)
+    ]
+
+    with transaction.atomic():
+        existentes = MarcaPersonal.objects.all()
+        if atleta is not None:
+            existentes = existentes.filter(atleta=atleta)
+        atletas = set(existentes.values_list('atleta_id', flat=True))
+        existentes.delete()
+        MarcaPersonal.objects.bulk_create(marcas, batch_size=1000)
+
+    invalidar_datos_atletas(*atletas, *(marca.atleta_id for marca in marcas))
+    return len(marcas)
+
+
+def resumen_marcas_atletas(atletas, levantamientos=3):
+    """
+    Calcula en lote el resumen de récords (mejor 1RM, mejor 1RM estimado y fecha
+    de la última marca por levantamiento principal) de varios atletas.
+    Hace UNA sola consulta sobre MarcaPersonal, sea cual sea el número de atletas.
+
+    Args:
+        atletas (QuerySet | iterable): Perfiles de atleta o sus ids.
+        levantamientos (int): Número máximo de ejercicios por atleta.
+
+    Returns:
+        dict: atleta_id -> lista de resúmenes por ejercicio.
+    """
+    filas = MarcaPersonal.objects.filter(atleta__in=atletas).order_by().values_list(
+        'atleta_id', 'ejercicio_id', 'ejercicio__nombre', 'repeticiones', 'peso', 'fecha'
+    )
+    return resumir_marcas_por_atleta(filas.iterator(chunk_size=2000), levantamientos)
+
+
+def resumen_actividad_atletas(atletas, ahora=None):
+    """
+    Anota en un queryset de atletas su actividad reciente, en la MISMA consulta
+    (subconsultas correlacionadas, sin una consulta por atleta):
+
+    - ultima_sesion: última sesión registrada (Entrenamiento.registrado_en, fijado en su primer registro).
+    - sesiones_semana: entrenamientos registrados desde el lunes.
+    - tonelaje_7_dias: kg x repeticiones de las series completadas de los entrenamientos
+      registrados en los últimos 7 días. Se fecha por registrado_en, no por updated_at:
+      editar después una serie antigua no la vuelve a contar.
+    - mesociclo_actual_id / mesociclo_actual / mesociclo_inicio: su mesociclo activo
+      más reciente (ver semana_mesociclo para la semana en curso).
+
+    Las subconsultas parten del índice (atleta, registrado_en) de Entrenamiento: solo
+    se leen los entrenamientos recientes de cada atleta, no todo su historial.
+    """
+    ahora = ahora or timezone.now()
+    hoy = timezone.localdate(ahora)
+    inicio_semana = timezone.make_aware(datetime.combine(hoy - timedelta(days=hoy.weekday()), time.min))
+    hace_7_dias = ahora - timedelta(days=7)
+
+    registrados = Entrenamiento.objects.filter(atleta=OuterRef('pk'), registrado_en__isnull=False).order_by()
+    sesiones_semana = registrados.filter(registrado_en__gte=inicio_semana).values('atleta').annotate(
+        total=Count('pk')
+    ).values('total')
+    tonelaje = SerieEjercicio.objects.filter(
+        serie_completada(),
+        detalle_entrenamiento__entrenamiento__atleta=OuterRef('pk'),
+        detalle_entrenamiento__entrenamiento__registrado_en__gte=hace_7_dias,
+    ).order_by().values('detalle_entrenamiento__entrenamiento__atleta').annotate(
+        total=Sum(F('peso_real') * F('repeticiones_reales'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    ).values('total')
+    mesociclo = Mesociclo.objects.filter(atleta=OuterRef('pk'), activo=True).order_by('-fecha_inicio', '-pk')
+
+    return atletas.annotate(
+        ultima_sesion=Subquery(registrados.order_by('-registrado_en').values('registrado_en')[:1]),
+        sesiones_semana=Coalesce(Subquery(sesiones_semana), 0),
+        tonelaje_7_dias=Coalesce(
+            Subquery(tonelaje), Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2)
+        ),
+        mesociclo_actual_id=Subquery(mesociclo.values('pk')[:1]),
+        mesociclo_actual=Subquery(mesociclo.values('nombre')[:1]),
+        mesociclo_inicio=Subquery(mesociclo.values('fecha_inicio')[:1]),
+    )
+
+
+def semana_mesociclo(fecha_inicio, hoy=None):
+    """Semana en curso (1, 2, 3...) de un mesociclo que empezó en 'fecha_inicio'."""
+    if fecha_inicio is None:
+        return None
+    hoy = hoy or timezone.localdate()
+    return max(1, (hoy - fecha_inicio).days // 7 + 1)
+
+
+# -------------------------------------------------
+# VOLUMEN SEMANAL (Tabla materializada)
+# -------------------------------------------------
+
+def volumen_semanal_de_series(series):
+    """
+    Agrega en la base de datos un queryset de series a UNA fila por
+    (atleta, mesociclo, semana, ejercicio). Las series de entrenamientos
+    sin mesociclo no se agregan.
+
+    Además del volumen guarda la mejor serie de la semana (la más pesada y, a
+    igualdad de peso, la de más repeticiones), el mejor e1RM con Epley y la
+    fecha de la primera sesión: es lo que lee la progresión semanal
+    (ver core/analitica.py) sin recorrer las series.
+
+    Returns:
+        list[VolumenSemanal]: Instancias sin guardar, listas para bulk_create.
+    """
+    series = series.filter(detalle_entrenamiento__entrenamiento__mesociclo__isnull=False).order_by()
+    completada = serie_completada()
+    grupo = [
+        'detalle_entrenamiento__entrenamiento__atleta_id',
+        'detalle_entrenamiento__entrenamiento__mesociclo_id',
+        'detalle_entrenamiento__entrenamiento__semana',
+        'detalle_entrenamiento__ejercicio_id',
+    ]
+    validas = completada & Q(peso_real__gt=0)
+
+    # Epley en SQL (1 repetición = el propio peso), igual que core.analitica._epley
+    peso = Cast('peso_real', FloatField())
+    e1rm_epley = Case(
+        When(validas & Q(repeticiones_reales=1), then=peso),
+        When(validas, then=peso * (1 + Cast('repeticiones_reales', FloatField()) / 30)),
+        output_field=FloatField(),
+    )
+
+    filas = series.values(*grupo).annotate(
+        num_series=Count('pk'),
+        # Repeticiones, tonelaje y RPE solo de las series completadas
+        completadas=Count('pk', filter=completada),
+        total_reps=Sum('repeticiones_reales', filter=completada, default=0),
+        total_tonelaje=Sum(
+            F('peso_real') * F('repeticiones_reales'),
+            filter=completada,
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+            default=0
+        ),
+        media_rpe=Avg('rpe_real', filter=completada),
+        primera_sesion=Min(fecha_sesion()),
+        mejor_e1rm=Max(e1rm_epley),
+    )
+
+    # Mejor serie de cada semana: ROW_NUMBER() por grupo, como en mejores_series_por_repeticiones
+    mejores = {
+        tuple(fila[:4]): fila[4:]
+        for fila in series.filter(validas).annotate(
+            posicion=Window(
+                expression=RowNumber(),
+                partition_by=[F(campo) for campo in grupo],
+                order_by=[F('peso_real').desc(), F('repeticiones_reales').desc()]
+            )
+        ).filter(posicion=1).values_list(*grupo, 'peso_real', 'repeticiones_reales')
+    }
+
+    volumenes = []
+    for fila in filas:
+        clave = tuple(fila[campo] for campo in grupo)
+        peso_maximo, repeticiones_peso_maximo = mejores.get(clave, (None, None))
+        volumenes.append(VolumenSemanal(
+            atleta_id=clave[0],
+            mesociclo_id=clave[1],
+            semana=clave[2],
+            ejercicio_id=clave[3],
+            series_prescritas=fila['num_series'],
+            series_completadas=fila['completadas'],
+            repeticiones=fila['total_reps'],
+            tonelaje=Decimal(str(fila['total_tonelaje'])).quantize(Decimal('0.01')),
+            rpe_medio=(
+                None if fila['media_rpe'] is None
+                else Decimal(str(fila['media_rpe'])).quantize(Decimal('0.1'))
+            ),
+            fecha=fila['primera_sesion'],
+            peso_maximo=peso_maximo,
+            repeticiones_peso_maximo=repeticiones_peso_maximo,
+            e1rm_maximo=(
+                None if fila['mejor_e1rm'] is None
+                else Decimal(str(fila['mejor_e1rm'])).quantize(Decimal('0.01'))
+            ),
+        ))
+    return volumenes
+
+
+def recalcular_volumen_semanal(claves):
+    """
+    Recalcula de forma incremental las filas de VolumenSemanal indicadas, agregando
+    solo las series de esos mesociclos y ejercicios (una consulta de agregación,
+    un upsert en bloque y, si alguna semana se ha quedado sin series, un borrado).
+
+    Args:
+        claves (iterable[tuple]): Tuplas (atleta_id, mesociclo_id, semana, ejercicio_id).
+    """
+    claves = set(claves)
+    if not claves:
+        return
+
+    volumenes = [
+        volumen for volumen in volumen_semanal_de_series(
+            SerieEjercicio.objects.filter(
+                detalle_entrenamiento__entrenamiento__mesociclo_id__in={c[1] for c in claves},
+                detalle_entrenamiento__ejercicio_id__in={c[3] for c in claves},
+            )
+        )
+        if (volumen.atleta_id, volumen.mesociclo_id, volumen.semana, volumen.ejercicio_id) in claves
+    ]
+
+    # Semanas que se han quedado sin ninguna serie
+    vacias = claves - {(v.atleta_id, v.mesociclo_id, v.semana, v.ejercicio_id) for v in volumenes}
+    if vacias:
+        filtro = Q()
+        for atleta_id, mesociclo_id, semana, ejercicio_id in vacias:
+            filtro |= Q(atleta_id=atleta_id, mesociclo_id=mesociclo_id, semana=semana, ejercicio_id=ejercicio_id)
+        VolumenSemanal.objects.filter(filtro).delete()
+
+    VolumenSemanal.objects.bulk_create(
+        volumenes,
+        update_conflicts=True,
+        unique_fields=['atleta', 'mesociclo', 'semana', 'ejercicio'],
+        update_fields=[
+            'series_prescritas', 'series_completadas', 'repeticiones', 'tonelaje', 'rpe_medio',
+            'fecha', 'peso_maximo', 'repeticiones_peso_maximo', 'e1rm_maximo', 'updated_at'
+        ],
+    )
+
+
+def reconstruir_volumen_semanal(atleta=None):
+    """
+    Reconstruye desde cero la tabla VolumenSemanal a partir de las series registradas.
+    Si se indica un atleta, solo se reconstruye su volumen.
+
+    Returns:
+        int: Número de filas generadas.
+    """
+    series = SerieEjercicio.objects.all()
+    if atleta is not None:
+        series = series.filter(detalle_entrenamiento__entrenamiento__atleta=atleta)
+
+    volumenes = volumen_semanal_de_series(series)
+
+    with transaction.atomic():
+        existentes = VolumenSemanal.objects.all()
+        if atleta is not None:
+            existentes = existentes.filter(atleta=atleta)
+        existentes.delete()
+        VolumenSemanal.objects.bulk_create(volumenes, batch_size=1000)
+
+    return len(volumenes)
+
+
+def volumen_semanal_mesociclo(mesociclo):
+    """
+    Volumen semana a semana de un mesociclo, leído de la tabla precalculada.
+
+    Returns:
+        dict: semana -> {'series_prescritas', 'series_completadas', 'repeticiones',
+              'tonelaje', 'ejercicios': [VolumenSemanal, ...]}, ordenado por semana.
+    """
+    semanas = {}
+    for volumen in mesociclo.volumenes_semanales.select_related('ejercicio').order_by('semana', 'ejercicio__nombre'):
+        semana = semanas.setdefault(volumen.semana, {
+            'series_prescritas': 0,
+            'series_completadas': 0,
+            'repeticiones': 0,
+            'tonelaje': Decimal('0'),
+            'ejercicios': [],
+        })
+        semana['series_prescritas'] += volumen.series_prescritas
+        semana['series_completadas'] += volumen.series_completadas
+        semana['repeticiones'] += volumen.repeticiones
+        semana['tonelaje'] += volumen.tonelaje
+        semana['ejercicios'].append(volumen)
+    return semanas
+
+
+# -------------------------------------------------
+# REGISTRO DE SERIES POR EL ATLETA (autoguardado)
+# -------------------------------------------------
+
+# Campos que registra el atleta en cada serie
+CAMPOS_REGISTRO_ATLETA = ('peso_real', 'repeticiones_reales', 'rpe_real')
+
+INCREMENTO_MINIMO_PESO = Decimal('0.25')
+
+
+def normalizar_peso(peso):
+    """
+    Redondea el peso a centésimas y comprueba que sea múltiplo de INCREMENTO_MINIMO_PESO.
+    Los pesos enteros se devuelven sin decimales (17.00 -> 17).
+    """
+    if not isinstance(peso, Decimal):
+        try:
+            peso = Decimal(str(peso))
+        except Exception:
+            raise ValidationError("El peso debe ser un número válido.")
+
+    peso = peso.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if not (peso % INCREMENTO_MINIMO_PESO).is_zero():
+        raise ValidationError(
+            f"El peso debe ser un múltiplo de {INCREMENTO_MINIMO_PESO} (ej. 17.0, 17.25, 17.5, 17.75)."
+        )
+    return peso.to_integral_value() if peso == peso.to_integral_value() else peso
+
+
+def valor_registro_atleta(campo, valor):
+    """Convierte y valida un valor enviado por el atleta con las reglas del campo del modelo."""
+    if valor is None or valor == '':
+        return None
+    valor = SerieEjercicio._meta.get_field(campo).clean(str(valor), None)
+    return normalizar_peso(valor) if campo == 'peso_real' else valor
+
+
+def _valores_atleta(serie):
+    return {'id': serie.pk, **{campo: getattr(serie, campo) for campo in CAMPOS_REGISTRO_ATLETA}}
+
+
+def registrar_series(entrenamiento, cambios, clave=None):
+    """
+    Guarda lo que el atleta ha hecho en una o varias series del entrenamiento,
+    a medida que las completa (autoguardado).
+
+        cambios = [{'id': <serie>, 'peso_real': ..., 'repeticiones_reales': ..., 'rpe_real': ...}, ...]
+
+    Solo se tocan los campos presentes (null los borra) y solo se escriben las series
+    que cambian, con un único bulk_update. Con 'clave', un envío repetido devuelve la
+    respuesta del primero sin volver a aplicarse.
+
+    Returns:
+        tuple: ({'series': [{'id', 'peso_real', 'repeticiones_reales', 'rpe_real'}, ...]}, repetida)
+
+    Raises:
+        ValidationError: Si algún valor no es válido o alguna serie no es de este
+            entrenamiento (no se guarda nada).
+    """
+    with transaction.atomic():
+        registro = None
+        if clave:
+            # La clave se reserva antes de aplicar nada: si ya existe, el envío es un reintento
+            try:
+                with transaction.atomic():
+                    registro = ClaveIdempotencia.objects.create(atleta_id=entrenamiento.atleta_id, clave=clave)
+            except IntegrityError:
+                previa = ClaveIdempotencia.objects.get(atleta_id=entrenamiento.atleta_id, clave=clave)
+                return previa.respuesta, True
+
+        series = {
+            serie.pk: serie for serie in SerieEjercicio.objects.filter(
+                pk__in=[cambio['id'] for cambio in cambios],
+                detalle_entrenamiento__entrenamiento=entrenamiento
+            )
+        }
+
+        errores = {}
+        tocadas = {}
+        modificadas = {}
+        campos = set()
+        for cambio in cambios:
+            serie = series.get(cambio['id'])
+            if serie is None:
+                errores[str(cambio['id'])] = ["La serie no pertenece a este entrenamiento."]
+                continue
+            tocadas[serie.pk] = serie
+            for campo in CAMPOS_REGISTRO_ATLETA:
+                if campo not in cambio:
+                    continue
+                try:
+                    valor = valor_registro_atleta(campo, cambio[campo])
+                except ValidationError as e:
+                    errores.setdefault(str(serie.pk), []).extend(e.messages)
+                    continue
+                if valor != getattr(serie, campo):
+                    setattr(serie, campo, valor)
+                    modificadas[serie.pk] = serie
+                    campos.add(campo)
+
+        if errores:
+            raise ValidationError(errores)
+
+        if modificadas:
+            ahora = timezone.now()
+            for serie in modificadas.values():
+                serie.updated_at = ahora
+            SerieEjercicio.objects.bulk_update(modificadas.values(), sorted(campos) + ['updated_at'])
+
+        respuesta = {'series': [_valores_atleta(serie) for serie in tocadas.values()]}
+        if registro is not None:
+            registro.respuesta = respuesta
+            registro.save(update_fields=['respuesta'])
+
+    return respuesta, False
+
+
+def _serie_sincronizada(serie):
+    """Valores de la serie más su versión (updated_at con microsegundos) para el cliente offline."""
+    return {**_valores_atleta(serie), 'version': serie.updated_at.isoformat()}
+
+
+def sincronizar_series(atleta, operaciones):
+    """
+    Aplica en bloque las series que el atleta registró sin conexión (cola offline del
+    navegador), en una sola transacción.
+
+        operaciones = [{'clave': str, 'id': <serie>, 'version': datetime, 'registrado_en': datetime,
+                        'peso_real': ..., 'repeticiones_reales': ..., 'rpe_real': ...}, ...]
+
+    - Cada operación lleva su clave de idempotencia: las ya aplicadas no se repiten.
+    - 'version' es el updated_at de la serie que vio el cliente al registrarla
+      (data-version en detalle_rutina.html). Si la serie cambió después en el servidor,
+      la versión ya no coincide: gana el servidor y se devuelven sus valores ('conflicto').
+      No se comparan relojes: el del móvil puede ir adelantado o atrasado.
+    - Las operaciones de una misma serie se comparan con la versión anterior al lote
+      y se aplican por orden de 'registrado_en' (todas vienen del mismo dispositivo).
+    - Una operación con valores no válidos se rechaza sola ('error'), sin bloquear el resto.
+      Ni los errores ni los conflictos consumen la clave: un reenvío se vuelve a evaluar.
+
+    Sea cual sea el tamaño del lote: una consulta de claves, una de series, un
+    bulk_update de series y un bulk_create de claves.
+
+    Returns:
+        list: Un resultado por operación, en el mismo orden:
+            {'clave', 'estado': 'aplicada'|'conflicto'|'repetida'|'error', 'serie', 'errores'}
+            'serie' incluye la 'version' actual, la que debe enviar el cliente la próxima vez.
+    """
+    with transaction.atomic():
+        vistas = dict(ClaveIdempotencia.objects.filter(
+            atleta=atleta, clave__in={op['clave'] for op in operaciones}
+        ).values_list('clave', 'respuesta'))
+
+        series = {
+            serie.pk: serie for serie in SerieEjercicio.objects.filter(
+                pk__in={op['id'] for op in operaciones},
+                detalle_entrenamiento__entrenamiento__atleta=atleta
+            )
+        }
+        # Versión de cada serie en el servidor antes de aplicar el lote
+        version_previa = {pk: serie.updated_at for pk, serie in series.items()}
+
+        ahora = timezone.now()
+        resultados = [None] * len(operaciones)
+        nuevas_claves = []
+        modificadas = {}
+        campos = set()
+
+        for indice, op in sorted(enumerate(operaciones), key=lambda par: par[1]['registrado_en']):
+            clave = op['clave']
+            if clave in vistas:
+                resultados[indice] = {**(vistas[clave] or {}), 'clave': clave, 'estado': 'repetida'}
+                continue
+
+            serie = series.get(op['id'])
+            if serie is None:
+                resultados[indice] = {
+                    'clave': clave, 'estado': 'error', 'serie': None,
+                    'errores': ["La serie no existe o no es de este atleta."],
+                }
+                continue
+
+            if op['version'] != version_previa[serie.pk]:
+                resultados[indice] = {'clave': clave, 'estado': 'conflicto', 'serie': _serie_sincronizada(serie)}
+                continue
+
+            valores, errores = {}, []
+            for campo in CAMPOS_REGISTRO_ATLETA:
+                if campo in op:
+                    try:
+                        valores[campo] = valor_registro_atleta(campo, op[campo])
+                    except ValidationError as e:
+                        errores.extend(e.messages)
+            if errores:
+                resultados[indice] = {'clave': clave, 'estado': 'error', 'serie': None, 'errores': errores}
+                continue
+
+            for campo, valor in valores.items():
+                if valor != getattr(serie, campo):
+                    setattr(serie, campo, valor)
+                    serie.updated_at = ahora
+                    modificadas[serie.pk] = serie
+                    campos.add(campo)
+            respuesta = {'estado': 'aplicada', 'serie': _serie_sincronizada(serie)}
+
+            vistas[clave] = respuesta
+            nuevas_claves.append(ClaveIdempotencia(atleta=atleta, clave=clave, respuesta=respuesta))
+            resultados[indice] = {**respuesta, 'clave': clave}
+
+        if modificadas:
+            SerieEjercicio.objects.bulk_update(modificadas.values(), sorted(campos) + ['updated_at'])
+
+        ClaveIdempotencia.objects.bulk_create(nuevas_claves, ignore_conflicts=True)
+
+    return resultados
+
+
+def purgar_claves_idempotencia(antes_de=None):
+    """
+    Borra las claves de idempotencia creadas antes de 'antes_de' (por defecto, hace
+    IDEMPOTENCIA_RETENCION_DIAS días). Un reintento más antiguo que eso ya no se
+    reconoce como repetido.
+
+    Returns:
+        int: Número de claves borradas.
+    """
+    if antes_de is None:
+        antes_de = timezone.now() - timedelta(days=getattr(settings, 'IDEMPOTENCIA_RETENCION_DIAS', 30))
+    borradas, _ = ClaveIdempotencia.objects.filter(created_at__lt=antes_de).delete()
+    return borradas
+
+
+# -------------------------------------------------
+# LISTADO DE RUTINAS DEL ATLETA (paginación por cursor)
+# -------------------------------------------------
+
+TAMANO_PAGINA_RUTINAS = 24
+
+ESTADOS_RUTINA = ('completada', 'pendiente')
+
+
+def codificar_cursor(entrenamiento):
+    """Cursor opaco con la posición (created_at, id) del último entrenamiento de la página."""
+    posicion = f"{entrenamiento.created_at.isoformat()}|{entrenamiento.pk}"
+    return base64.urlsafe_b64encode(posicion.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """
+    Devuelve (created_at, id) a partir de un cursor de codificar_cursor().
+    Lanza ValueError si el cursor no es válido.
+    """
+    try:
+        fecha, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        created_at = datetime.fromisoformat(fecha)
+        pk = int(pk)
+    except (ValueError, UnicodeError):
+        raise ValueError("Cursor no válido.")
+    if timezone.is_naive(created_at):
+        raise ValueError("Cursor no válido.")
+    return created_at, pk
+
+
+def pagina_rutinas(atleta, cursor=None, mesociclo=None, semana=None, estado=None, tamano=TAMANO_PAGINA_RUTINAS):
+    """
+    Una página de las rutinas del atleta, de la más reciente a la más antigua, con los
+    conteos de ejercicios y series (Entrenamiento.objects.con_conteos()).
+
+    Paginación por cursor sobre (created_at, id): cada página continúa tras la última
+    fila de la anterior, así que una página profunda cuesta lo mismo que la primera
+    (índice entreno_atleta_fecha_idx), a diferencia de OFFSET. Los conteos se agrupan
+    solo sobre los ids de la página (subconsulta con LIMIT), no sobre todo el historial.
+
+    Filtros opcionales: mesociclo (id), semana y estado ('completada': todas sus
+    series completadas, ver serie_completada; 'pendiente': el resto).
+
+    Returns:
+        tuple: (lista de entrenamientos, cursor de la página siguiente o None)
+    """
+    rutinas = Entrenamiento.objects.filter(atleta=atleta)
+    if mesociclo is not None:
+        rutinas = rutinas.filter(mesociclo_id=mesociclo)
+    if semana is not None:
+        rutinas = rutinas.filter(semana=semana)
+    if cursor:
+        created_at, pk = decodificar_cursor(cursor)
+        rutinas = rutinas.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    # Completada: tiene series y ninguna sin completar (EXISTS por fila, sin GROUP BY)
+    series = SerieEjercicio.objects.filter(detalle_entrenamiento__entrenamiento=OuterRef('pk'))
+    completada = Q(Exists(series)) & ~Q(Exists(series.exclude(serie_completada())))
+    if estado == 'completada':
+        rutinas = rutinas.filter(completada)
+    elif estado == 'pendiente':
+        rutinas = rutinas.exclude(completada)
+
+    # Primero los ids de la página (una fila de más para saber si hay página siguiente)
+    # y después los conteos solo de esas filas, en la misma consulta
+    ids = rutinas.order_by('-created_at', '-pk').values('pk')[:tamano + 1]
+    pagina = list(
+        Entrenamiento.objects.filter(pk__in=ids).select_related('entrenador').con_conteos().order_by('-created_at', '-pk')
+    )
+    siguiente = codificar_cursor(pagina[tamano - 1]) if len(pagina) > tamano else None
+    return pagina[:tamano], siguiente
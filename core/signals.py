@@ -1,6 +1,11 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_init
 from django.dispatch import receiver
-from .models import Entrenamiento, PerfilUsuario 
+from .caching import invalidar_dashboards
+from .models import DetalleEntrenamiento, Entrenamiento, Mesociclo, PerfilUsuario, SerieEjercicio
+from .services import (
+    CAMPOS_REGISTRO_SERIE, propagacion_en_bloque_activa, registrar_cambios_detalles, registrar_cambios_series,
+    valores_registro_serie,
+)
 
 # Escucha el evento 'post_save' (después de guardar) del modelo Entrenamiento
 @receiver(post_save, sender=Entrenamiento)
@@ -27,4 +32,84 @@ def asignar_entrenador_a_atleta(sender, instance, created, **kwargs):
             atleta.save()
             
             # (Opcional) Puedes dejar esto para verificar en tu consola que funciona
-            print(f"Signal: Atleta {atleta.nombre} asignado a Entrenador {entrenador.nombre}")
\ No newline at end of file
+            print(f"Signal: Atleta {atleta.nombre} asignado a Entrenador {entrenador.nombre}")
+
+
+# -------------------------------------------------
+# MANTENIMIENTO INCREMENTAL DE MARCAS PERSONALES Y CACHÉ
+# -------------------------------------------------
+
+@receiver(post_init, sender=SerieEjercicio)
+def guardar_valores_originales_serie(sender, instance, **kwargs):
+    """
+    Recuerda los valores de la serie tal y como se cargaron, para saber al
+    guardarla qué récords recalcular y si hay que invalidar la caché del atleta.
+    """
+    # Si algún campo está diferido (.only()/.defer()) no lo leemos aquí para no
+    # lanzar una consulta por instancia: al guardar se tratará como cambio.
+    diferidos = instance.get_deferred_fields()
+    if instance.pk is None or diferidos & CAMPOS_REGISTRO_SERIE:
+        instance._valores_originales = None
+    else:
+        instance._valores_originales = valores_registro_serie(instance)
+
+
+@receiver(post_save, sender=SerieEjercicio)
+def actualizar_marcas_al_guardar_serie(sender, instance, created, **kwargs):
+    """
+    Cuando cambia el registro de una serie, recalcula solo los récords afectados
+    (repeticiones antiguas y nuevas) y el volumen de su semana, e invalida la caché del atleta.
+    """
+    registrar_cambios_series([instance])
+
+
+@receiver(post_delete, sender=SerieEjercicio)
+def actualizar_marcas_al_borrar_serie(sender, instance, **kwargs):
+    """
+    Al borrar una serie, recalcula su récord y el volumen de su semana, e invalida la caché del atleta.
+    En los borrados en bloque (SerieEjercicioQuerySet.delete) se propaga una sola vez al final.
+    """
+    if propagacion_en_bloque_activa():
+        return
+    registrar_cambios_series([instance], borradas=True)
+
+
+@receiver(post_init, sender=DetalleEntrenamiento)
+def guardar_valores_originales_detalle(sender, instance, **kwargs):
+    """
+    Recuerda el ejercicio y el orden del detalle tal y como se cargaron: si cambian,
+    cambian los récords (y su orden) y el volumen a los que cuentan sus series.
+    """
+    if instance.pk is None or instance.get_deferred_fields() & {'ejercicio_id', 'orden'}:
+        instance._valores_originales = None
+    else:
+        instance._valores_originales = (instance.ejercicio_id, instance.orden)
+
+
+@receiver(post_save, sender=DetalleEntrenamiento)
+def actualizar_marcas_al_guardar_detalle(sender, instance, created, **kwargs):
+    """Al reordenar un ejercicio o cambiarlo por otro, recalcula las marcas y el volumen de sus series."""
+    if created:
+        # Un detalle nuevo aún no tiene series
+        instance._valores_originales = (instance.ejercicio_id, instance.orden)
+        return
+    registrar_cambios_detalles([instance])
+
+
+# -------------------------------------------------
+# INVALIDACIÓN DEL DASHBOARD CACHEADO
+# -------------------------------------------------
+
+@receiver(post_save, sender=Mesociclo)
+@receiver(post_delete, sender=Mesociclo)
+@receiver(post_save, sender=Entrenamiento)
+@receiver(post_delete, sender=Entrenamiento)
+def invalidar_dashboard_programa(sender, instance, **kwargs):
+    """Los programas y rutinas aparecen en el dashboard de su entrenador y de su atleta."""
+    invalidar_dashboards(instance.entrenador_id, instance.atleta_id)
+
+
+@receiver(post_save, sender=PerfilUsuario)
+def invalidar_dashboard_entrenador(sender, instance, **kwargs):
+    """El dashboard del entrenador muestra el nombre de sus atletas."""
+    invalidar_dashboards(instance.entrenador_id)
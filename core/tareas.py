@@ -0,0 +1,363 @@
+# core/tareas.py
+"""
+Cola de tareas en segundo plano guardada en la propia base de datos (modelo Tarea).
+
+- encolar() crea la tarea y devuelve enseguida; la petición web solo guarda una fila.
+- Los trabajadores ('manage.py procesar_tareas') reclaman tareas con un UPDATE
+  condicional sobre la fila: aunque haya varios procesos a la vez, solo uno consigue
+  pasarla de 'pendiente' a 'en_curso'. No hace falta Redis ni ningún broker externo.
+- Si una tarea falla se reintenta con espera exponencial hasta 'max_intentos';
+  si un trabajador muere a mitad, la tarea se vuelve a reclamar pasado TIEMPO_MAXIMO.
+- Las tareas por lotes guardan su avance con informar_progreso() (Tarea.hechos/total)
+  y, al reintentarse, continúan desde progreso_anterior().
+
+Las funciones que se pueden encolar se registran con el decorador @tarea('nombre').
+Con TAREAS_EN_LINEA = True (settings) se ejecutan al momento, sin trabajador.
+"""
+import logging
+import os
+import socket
+import time
+import traceback
+from contextvars import ContextVar
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Entrenamiento, Mesociclo, PerfilUsuario, PlantillaMesociclo, SerieEjercicio, Tarea
+from .services import (
+    asignar_programa, instanciar_plantilla, purgar_claves_idempotencia, reconstruir_marcas_personales,
+    reconstruir_volumen_semanal,
+)
+
+logger = logging.getLogger(__name__)
+
+# Espera antes del reintento n: ESPERA_BASE * 2^(n-1), como mucho ESPERA_MAXIMA
+ESPERA_BASE = timedelta(seconds=30)
+ESPERA_MAXIMA = timedelta(hours=1)
+
+# Una tarea 'en_curso' sin dar señales (informar_progreso renueva bloqueada_en) durante
+# más tiempo se considera huérfana (trabajador caído)
+TIEMPO_MAXIMO = timedelta(minutes=15)
+
+# Los trabajadores purgan las tareas terminadas hace más de TAREAS_RETENCION_DIAS
+# (settings), como mucho una vez cada PURGA_CADA
+PURGA_CADA = timedelta(hours=1)
+
+MANEJADORES = {}
+
+# Tarea que se está ejecutando en este contexto (para informar_progreso)
+_tarea_en_curso = ContextVar('tarea_en_curso', default=None)
+
+
+def tarea(nombre):
+    """Registra una función como tarea encolable con el nombre indicado."""
+    def registrar(funcion):
+        MANEJADORES[nombre] = funcion
+        return funcion
+    return registrar
+
+
+def nombre_trabajador():
+    """Identificador del proceso trabajador (máquina:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# -------------------------------------------------
+# ENCOLAR, RECLAMAR Y EJECUTAR
+# -------------------------------------------------
+
+def encolar(tipo, parametros=None, creado_por=None, max_intentos=3):
+    """
+    Guarda una tarea pendiente y devuelve la instancia (su pk es el id de seguimiento).
+    Los parámetros deben ser serializables en JSON.
+    """
+    if tipo not in MANEJADORES:
+        raise ValueError(f"Tarea desconocida: {tipo}")
+
+    nueva = Tarea.objects.create(
+        tipo=tipo,
+        parametros=parametros or {},
+        creado_por=creado_por if getattr(creado_por, 'is_authenticated', False) else None,
+        max_intentos=max_intentos,
+    )
+
+    if getattr(settings, 'TAREAS_EN_LINEA', False):
+        # Se ejecuta al confirmar la transacción actual (o al momento si no hay ninguna)
+        transaction.on_commit(lambda: _ejecutar_en_linea(nueva.pk))
+    return nueva
+
+
+def _huerfanas(ahora):
+    return Q(estado=Tarea.EN_CURSO, bloqueada_en__lt=ahora - TIEMPO_MAXIMO)
+
+
+def _disponibles(ahora):
+    return Q(estado=Tarea.PENDIENTE, disponible_en__lte=ahora) | (
+        _huerfanas(ahora) & Q(intentos__lt=F('max_intentos'))
+    )
+
+
+def abandonar_huerfanas(ahora=None):
+    """
+    Marca como fallidas las tareas huérfanas que ya agotaron sus intentos: una tarea
+    que tumba a su trabajador (memoria, timeout) no se reintenta indefinidamente.
+
+    Returns:
+        int: Número de tareas marcadas como fallidas.
+    """
+    ahora = ahora or timezone.now()
+    return Tarea.objects.filter(_huerfanas(ahora), intentos__gte=F('max_intentos')).update(
+        estado=Tarea.FALLIDA, terminada_en=ahora,
+        error="El trabajador dejó de responder en el último intento permitido.",
+    )
+
+
+def reclamar(trabajador, candidatas=10):
+    """
+    Reclama la siguiente tarea disponible para 'trabajador', o devuelve None.
+
+    El reclamo es un UPDATE condicional sobre una sola fila (compare-and-set): si otro
+    proceso se la ha llevado antes, el UPDATE no afecta a ninguna fila y se prueba con
+    la siguiente candidata. Funciona igual en SQLite y en PostgreSQL.
+    Una tarea huérfana se vuelve a reclamar solo si le quedan intentos.
+    """
+    ahora = timezone.now()
+    abandonar_huerfanas(ahora)
+    ids = list(Tarea.objects.filter(_disponibles(ahora)).order_by(
+        'disponible_en', 'pk'
+    ).values_list('pk', flat=True)[:candidatas])
+
+    for pk in ids:
+        reclamada = Tarea.objects.filter(_disponibles(ahora), pk=pk).update(
+            estado=Tarea.EN_CURSO,
+            bloqueada_por=trabajador,
+            bloqueada_en=ahora,
+            intentos=F('intentos') + 1,
+        )
+        if reclamada:
+            return Tarea.objects.get(pk=pk)
+    return None
+
+
+def ejecutar(tarea_reclamada):
+    """
+    Ejecuta una tarea ya reclamada y guarda su resultado, o programa el reintento.
+    Solo escribe si la tarea sigue siendo de este trabajador (no ha caducado su reclamo).
+
+    Returns:
+        bool: True si se completó correctamente.
+    """
+    propia = Tarea.objects.filter(pk=tarea_reclamada.pk, bloqueada_por=tarea_reclamada.bloqueada_por)
+    manejador = MANEJADORES.get(tarea_reclamada.tipo)
+
+    en_curso = _tarea_en_curso.set(tarea_reclamada)
+    try:
+        if manejador is None:
+            raise LookupError(f"Tarea desconocida: {tarea_reclamada.tipo}")
+        resultado = manejador(**tarea_reclamada.parametros)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception("Tarea %s (%s) fallida en el intento %s", tarea_reclamada.pk, tarea_reclamada.tipo, tarea_reclamada.intentos)
+
+        if manejador is not None and tarea_reclamada.intentos < tarea_reclamada.max_intentos:
+            espera = min(ESPERA_BASE * 2 ** (tarea_reclamada.intentos - 1), ESPERA_MAXIMA)
+            propia.update(
+                estado=Tarea.PENDIENTE, disponible_en=timezone.now() + espera,
+                bloqueada_por='', bloqueada_en=None, error=error
+            )
+        else:
+            propia.update(estado=Tarea.FALLIDA, terminada_en=timezone.now(), error=error)
+        return False
+    finally:
+        _tarea_en_curso.reset(en_curso)
+
+    # Los parámetros ya no hacen falta (solo servían para reintentar): no se conservan
+    propia.update(estado=Tarea.COMPLETADA, parametros={}, resultado=resultado, terminada_en=timezone.now(), error='')
+    return True
+
+
+def informar_progreso(hechos, total, resultado=None):
+    """
+    Guarda el avance de la tarea en ejecución (hechos de total), que devuelve
+    TareaEstadoView, y renueva su bloqueo: mientras informe de progreso, ningún
+    otro trabajador la toma por huérfana. Con 'resultado' guarda también el resultado
+    parcial (ver resultado_parcial). Fuera de una tarea no hace nada.
+
+    Llamada dentro de la transacción de un lote, el progreso se confirma con él.
+    """
+    tarea_actual = _tarea_en_curso.get()
+    if tarea_actual is None:
+        return
+    tarea_actual.hechos, tarea_actual.total = hechos, total
+    tarea_actual.bloqueada_en = timezone.now()
+    campos = {'hechos': hechos, 'total': total, 'bloqueada_en': tarea_actual.bloqueada_en}
+    if resultado is not None:
+        campos['resultado'] = resultado
+    Tarea.objects.filter(pk=tarea_actual.pk, bloqueada_por=tarea_actual.bloqueada_por).update(**campos)
+
+
+def progreso_anterior():
+    """Elementos ya hechos por un intento anterior de la tarea en ejecución (0 si ninguno)."""
+    tarea_actual = _tarea_en_curso.get()
+    return (tarea_actual.hechos or 0) if tarea_actual is not None else 0
+
+
+def resultado_parcial():
+    """
+    Resultado guardado con informar_progreso por la tarea en ejecución, en este intento
+    o en los anteriores, leído de la base de datos ({} si no hay ninguno).
+    """
+    tarea_actual = _tarea_en_curso.get()
+    if tarea_actual is None:
+        return {}
+    return Tarea.objects.values_list('resultado', flat=True).get(pk=tarea_actual.pk) or {}
+
+
+def _ejecutar_en_linea(pk):
+    trabajador = f"en-linea:{os.getpid()}"
+    if Tarea.objects.filter(pk=pk, estado=Tarea.PENDIENTE).update(
+        estado=Tarea.EN_CURSO, bloqueada_por=trabajador, bloqueada_en=timezone.now(), intentos=F('intentos') + 1
+    ):
+        ejecutar(Tarea.objects.get(pk=pk))
+
+
+def purgar_tareas(antes_de=None):
+    """
+    Borra las tareas completadas o fallidas que terminaron antes de 'antes_de'
+    (por defecto, hace TAREAS_RETENCION_DIAS días).
+
+    Returns:
+        int: Número de tareas borradas.
+    """
+    if antes_de is None:
+        antes_de = timezone.now() - timedelta(days=getattr(settings, 'TAREAS_RETENCION_DIAS', 7))
+    borradas, _ = Tarea.objects.filter(
+        estado__in=[Tarea.COMPLETADA, Tarea.FALLIDA], terminada_en__lt=antes_de
+    ).delete()
+    return borradas
+
+
+def mantenimiento():
+    """Limpieza periódica que hacen los trabajadores cuando la cola está vacía."""
+    borradas = purgar_tareas()
+    if borradas:
+        logger.info("Purgadas %s tareas terminadas", borradas)
+    claves = purgar_claves_idempotencia()
+    if claves:
+        logger.info("Purgadas %s claves de idempotencia caducadas", claves)
+
+
+def trabajar(trabajador=None, una_vez=False, pausa=2.0, seguir=lambda: True):
+    """
+    Bucle de un proceso trabajador: reclama y ejecuta tareas hasta que 'seguir()'
+    devuelva False (o, con 'una_vez', hasta que no quede ninguna disponible).
+    Con la cola vacía hace el mantenimiento (purgas), como mucho una vez cada PURGA_CADA.
+
+    Returns:
+        int: Número de tareas procesadas.
+    """
+    trabajador = trabajador or nombre_trabajador()
+    procesadas = 0
+    ultima_purga = None
+    while seguir():
+        siguiente = reclamar(trabajador)
+        if siguiente is None:
+            if ultima_purga is None or timezone.now() - ultima_purga >= PURGA_CADA:
+                mantenimiento()
+                ultima_purga = timezone.now()
+            if una_vez:
+                break
+            time.sleep(pausa)
+            continue
+        ejecutar(siguiente)
+        procesadas += 1
+    return procesadas
+
+
+# -------------------------------------------------
+# TAREAS REGISTRADAS
+# -------------------------------------------------
+
+def _progreso_programa():
+    """
+    progreso() para instanciar_programa dentro de una tarea: cada lote se confirma junto
+    con su avance y los ids de todos los mesociclos creados, también por los intentos
+    anteriores. Un reintento sigue tras el último lote hecho sin duplicar ninguno.
+    """
+    previos = resultado_parcial().get('mesociclos', [])
+
+    def progreso(hechos, total, mesociclos):
+        informar_progreso(hechos, total, {'mesociclos': previos + [m.pk for m in mesociclos]})
+    return progreso
+
+
+@tarea('asignar_programa')
+def tarea_asignar_programa(mesociclo_id, atleta_ids, fecha_inicio=None):
+    mesociclo = Mesociclo.objects.select_related('entrenador').get(pk=mesociclo_id)
+    _, ignorados = asignar_programa(
+        mesociclo,
+        atleta_ids,
+        date.fromisoformat(fecha_inicio) if fecha_inicio else None,
+        progreso=_progreso_programa(),
+        omitir=progreso_anterior()
+    )
+    return {'mesociclos': resultado_parcial().get('mesociclos', []), 'ignorados': ignorados}
+
+
+@tarea('instanciar_plantilla')
+def tarea_instanciar_plantilla(plantilla_id, atleta_ids, fecha_inicio=None):
+    plantilla = PlantillaMesociclo.objects.select_related('entrenador').get(pk=plantilla_id)
+    # Orden fijo: al reintentar, los primeros atletas son los de los lotes ya hechos
+    atletas = PerfilUsuario.objects.filter(pk__in=atleta_ids, tipo='atleta').order_by('pk')
+    instanciar_plantilla(
+        plantilla,
+        atletas,
+        date.fromisoformat(fecha_inicio) if fecha_inicio else None,
+        progreso=_progreso_programa(),
+        omitir=progreso_anterior()
+    )
+    return {'mesociclos': resultado_parcial().get('mesociclos', [])}
+
+
+@tarea('reconstruir_marcas')
+def tarea_reconstruir_marcas(atleta_id=None):
+    atleta = PerfilUsuario.objects.get(pk=atleta_id) if atleta_id else None
+    return {'marcas': reconstruir_marcas_personales(atleta=atleta)}
+
+
+@tarea('reconstruir_volumen')
+def tarea_reconstruir_volumen(atleta_id=None):
+    atleta = PerfilUsuario.objects.get(pk=atleta_id) if atleta_id else None
+    return {'filas': reconstruir_volumen_semanal(atleta=atleta)}
+
+
+@tarea('borrar_entrenamiento')
+def tarea_borrar_entrenamiento(entrenamiento_id):
+    with transaction.atomic():
+        # Primero las series en bloque: marcas y volumen se recalculan una sola vez
+        series, _ = SerieEjercicio.objects.filter(detalle_entrenamiento__entrenamiento_id=entrenamiento_id).delete()
+        borrados, _ = Entrenamiento.objects.filter(pk=entrenamiento_id).delete()
+    return {'borrados': borrados + series}
+
+
+def enviar_correo(asunto, cuerpo, remitente, destinatarios, plantilla_id=None, datos=None):
+    """Envía un correo (opcionalmente con plantilla y datos de Anymail/Brevo)."""
+    msg = EmailMultiAlternatives(asunto, cuerpo, remitente, destinatarios)
+    if plantilla_id is not None:
+        msg.template_id = plantilla_id
+    if datos is not None:
+        msg.merge_global_data = datos
+    msg.send()
+
+
+@tarea('enviar_correo')
+def tarea_enviar_correo(asunto, cuerpo, remitente, destinatarios, plantilla_id=None, datos=None):
+    # Los correos con enlaces de un solo uso (recuperar contraseña) NO se encolan:
+    # los parámetros se guardan en la tabla Tarea mientras la tarea está pendiente
+    enviar_correo(asunto, cuerpo, remitente, destinatarios, plantilla_id, datos)
+    return {'enviados': len(destinatarios)}
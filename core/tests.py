@@ -1,3 +1,1610 @@
-from django.test import TestCase
+import io
+import json
+import random
+import re
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .analitica import agrupar_progresion_semanal, calcular_progresion, calcular_progresion_semanal
+from .benchmarks import generar_records_aleatorios
+from .caching import comprobar_cache_compartida, marcas_personales_en_cache
+from .forms import EmailOrUsernameLoginForm
+from .marcas import frontera_no_dominada, frontera_no_dominada_referencia
+from .models import (
+    ClaveIdempotencia, DetalleEntrenamiento, Ejercicio, Entrenamiento, MarcaPersonal, Mesociclo,
+    PerfilUsuario, SerieEjercicio, Tarea, VolumenSemanal,
+)
+from .services import (
+    TAMANO_PAGINA_RUTINAS, asignar_programa, clonar_mesociclo, crear_plantilla_desde_mesociclo,
+    instanciar_plantilla, pagina_rutinas, reconstruir_marcas_personales, reconstruir_volumen_semanal,
+    registrar_series, replicar_planificacion_semanal, resumen_actividad_atletas, semana_mesociclo,
+    series_validas_para_marcas,
+)
+from .tareas import (
+    MANEJADORES, encolar, ejecutar, informar_progreso, progreso_anterior, reclamar, tarea, trabajar,
+)
+from .views import AtletaProgresionMaxView, EntrenamientoUpdateView
+
+
+def crear_perfil(nombre, tipo, entrenador=None):
+    """Usuario (contraseña 'x') con su perfil; el email es <nombre>@test.com."""
+    return PerfilUsuario.objects.create(
+        user=User.objects.create_user(username=nombre, password='x'),
+        tipo=tipo, nombre=nombre, email=f'{nombre}@test.com', entrenador=entrenador
+    )
+
+
+class EntrenadorAtletaTestCase(TestCase):
+    """
+    Base de los tests con un entrenador y un atleta suyo (cls.entrenador y
+    cls.atleta), con un helper para capturar las consultas de una llamada.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.entrenador = crear_perfil('entrenador', 'entrenador')
+        cls.atleta = crear_perfil('atleta', 'atleta', entrenador=cls.entrenador)
+
+    def capturar_consultas(self, funcion, *args, **kwargs):
+        """
+        Llama a la función (petición del cliente o servicio) y devuelve su resultado y
+        el SQL ejecutado: solo las consultas de datos, sin las de la tabla de caché
+        (CACHE_BACKEND='db') ni los SAVEPOINT de las transacciones.
+        """
+        tabla_cache = connection.ops.quote_name(settings.CACHES['default']['LOCATION'])
+        with CaptureQueriesContext(connection) as ctx:
+            resultado = funcion(*args, **kwargs)
+        return resultado, [
+            q['sql'] for q in ctx.captured_queries
+            if tabla_cache not in q['sql'] and not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        ]
+
+
+class FronteraNoDominadaTests(SimpleTestCase):
+    """
+    Equivalencia entre el barrido O(n log n) y la versión de referencia O(n²)
+    sobre entradas aleatorias de 10 a 10.000 récords.
+    """
+
+    def test_equivalente_a_referencia_en_entradas_aleatorias(self):
+        rnd = random.Random(2024)
+        for _ in range(200):
+            n = rnd.randint(10, 300)
+            records = generar_records_aleatorios(n, semilla=rnd.random())
+            with self.subTest(n=n):
+                self.assertEqual(frontera_no_dominada(records), frontera_no_dominada_referencia(records))
+
+    def test_equivalente_a_referencia_en_entradas_grandes(self):
+        for n in (1000, 10000):
+            records = generar_records_aleatorios(n, semilla=n)
+            with self.subTest(n=n):
+                self.assertEqual(frontera_no_dominada(records), frontera_no_dominada_referencia(records))
+
+    def test_empates_de_peso_y_repeticiones(self):
+        rnd = random.Random(7)
+        for _ in range(200):
+            # Pocos valores distintos para forzar empates
+            records = [
+                {'peso': Decimal(rnd.choice([50, 60, 70])), 'repeticiones': rnd.randint(1, 4)}
+                for _ in range(rnd.randint(10, 40))
+            ]
+            self.assertEqual(frontera_no_dominada(records), frontera_no_dominada_referencia(records))
+
+    def test_lista_vacia(self):
+        self.assertEqual(frontera_no_dominada([]), [])
+
+
+def marcas_personales_referencia(atleta):
+    """
+    El cálculo original de get_marcas_personales: recorre todas las series válidas
+    del atleta en el orden del historial y se queda con el mayor peso por
+    repeticiones (en caso de empate, con la fecha más reciente).
+    """
+    marcas_por_ejercicio = {}
+    for serie in series_validas_para_marcas().filter(
+        detalle_entrenamiento__entrenamiento__atleta=atleta
+    ).select_related('detalle_entrenamiento__ejercicio', 'detalle_entrenamiento__entrenamiento'):
+        ejercicio = serie.detalle_entrenamiento.ejercicio
+        peso, reps = Decimal(str(serie.peso_real)), serie.repeticiones_reales
+        entreno = serie.detalle_entrenamiento.entrenamiento
+        fecha = entreno.registrado_en or entreno.created_at
+        records = marcas_por_ejercicio.setdefault(ejercicio.id, {'ejercicio': ejercicio, 'records_por_reps': {}})[
+            'records_por_reps'
+        ]
+        if reps not in records or peso > records[reps]['peso']:
+            records[reps] = {'peso': peso, 'repeticiones': reps, 'fecha': fecha}
+        elif peso == records[reps]['peso'] and fecha > records[reps]['fecha']:
+            records[reps]['fecha'] = fecha
+
+    marcas_finales = []
+    for data in marcas_por_ejercicio.values():
+        records_lista = list(data['records_por_reps'].values())
+        record_max_peso = record_max_reps = record_max_peso_1rm = None
+        for record in records_lista:
+            if record_max_peso is None or record['peso'] > record_max_peso['peso']:
+                record_max_peso = record.copy()
+            if record_max_reps is None or record['repeticiones'] > record_max_reps['repeticiones']:
+                record_max_reps = record.copy()
+            if record['repeticiones'] == 1:
+                if record_max_peso_1rm is None or record['peso'] > record_max_peso_1rm['peso']:
+                    record_max_peso_1rm = record.copy()
+        marcas_finales.append({
+            'ejercicio': data['ejercicio'],
+            'records_por_reps': sorted(frontera_no_dominada_referencia(records_lista), key=lambda x: x['repeticiones']),
+            'record_max_peso': record_max_peso,
+            'record_max_reps': record_max_reps,
+            'record_max_peso_1rm': record_max_peso_1rm,
+        })
+    marcas_finales.sort(key=lambda x: x['ejercicio'].nombre)
+    return marcas_finales
+
+
+class MarcasYVolumenIncrementalesTests(EntrenadorAtletaTestCase):
+    """
+    MarcaPersonal y VolumenSemanal, mantenidas serie a serie, coinciden con su
+    reconstrucción desde cero; get_marcas_personales da lo mismo que el cálculo
+    original sobre todo el historial y su caché se invalida al guardar una serie.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.otro = crear_perfil('otro', 'atleta', entrenador=cls.entrenador)
+        cls.ejercicios = [Ejercicio.objects.create(nombre=nombre) for nombre in ('Sentadilla', 'Press banca')]
+        # Pocos pesos y repeticiones posibles: muchos empates de peso entre sesiones
+        azar = random.Random(7)
+        ahora = timezone.now()
+        for atleta in (cls.atleta, cls.otro):
+            mesociclo = Mesociclo.objects.create(nombre='Bloque', entrenador=cls.entrenador, atleta=atleta)
+            for semana in range(1, 5):
+                entreno = Entrenamiento.objects.create(
+                    entrenador=cls.entrenador, atleta=atleta, mesociclo=mesociclo,
+                    nombre=f'S{semana}', semana=semana, dia_orden=1
+                )
+                series = SerieEjercicio.objects.bulk_create([
+                    SerieEjercicio(detalle_entrenamiento=detalle, numero_serie=n, repeticiones_o_rango='5')
+                    for detalle in DetalleEntrenamiento.objects.bulk_create([
+                        DetalleEntrenamiento(entrenamiento=entreno, ejercicio=ejercicio, orden=orden)
+                        for orden, ejercicio in enumerate(cls.ejercicios, start=1)
+                    ])
+                    for n in range(1, 5)
+                ])
+                for serie in series:
+                    serie.peso_real = Decimal(azar.choice((60, 80, 100)))
+                    serie.repeticiones_reales = azar.choice((1, 3, 5))
+                SerieEjercicio.objects.bulk_update(series, ['peso_real', 'repeticiones_reales'])
+                # Una sesión por semana, registrada en su semana
+                Entrenamiento.objects.filter(pk=entreno.pk).update(registrado_en=ahora - timedelta(days=7 * (4 - semana)))
+        reconstruir_marcas_personales()
+        reconstruir_volumen_semanal()
+
+    def setUp(self):
+        cache.clear()
+
+    def _series(self, atleta):
+        return list(SerieEjercicio.objects.filter(detalle_entrenamiento__entrenamiento__atleta=atleta).order_by('pk'))
+
+    def _tablas(self):
+        return (
+            list(MarcaPersonal.objects.order_by('atleta', 'ejercicio', 'repeticiones').values_list(
+                'atleta_id', 'ejercicio_id', 'repeticiones', 'peso', 'fecha', 'serie_origen_id'
+            )),
+            list(VolumenSemanal.objects.order_by('atleta', 'mesociclo', 'semana', 'ejercicio').values_list(
+                'atleta_id', 'mesociclo_id', 'semana', 'ejercicio_id', 'series_prescritas',
+                'series_completadas', 'repeticiones', 'tonelaje', 'rpe_medio',
+                'fecha', 'peso_maximo', 'repeticiones_peso_maximo', 'e1rm_maximo'
+            )),
+        )
+
+    def assertIgualQueReconstruir(self):
+        incrementales = self._tablas()
+        reconstruir_marcas_personales()
+        reconstruir_volumen_semanal()
+        self.assertEqual(incrementales, self._tablas())
+
+    def test_guardar_y_borrar_series(self):
+        self.assertIgualQueReconstruir()
+        series = self._series(self.atleta)
+        series[0].peso_real = Decimal('120')  # nuevo récord
+        series[0].save()
+        series[1].repeticiones_reales = 8  # el récord de sus repeticiones anteriores puede cambiar
+        series[1].save()
+        series[2].peso_real = None  # deja de contar
+        series[2].save()
+        series[3].delete()
+        self.assertIgualQueReconstruir()
+
+    def test_actualizar_y_borrar_en_bloque(self):
+        series = self._series(self.atleta)
+        for serie in series[::3]:
+            serie.peso_real, serie.repeticiones_reales = Decimal('40'), 2
+        SerieEjercicio.objects.bulk_update(series[::3], ['peso_real', 'repeticiones_reales'])
+        self.assertIgualQueReconstruir()
+
+        SerieEjercicio.objects.filter(pk__in=[serie.pk for serie in series[1::4]]).delete()
+        self.assertIgualQueReconstruir()
+
+        SerieEjercicio.objects.filter(pk__in=[serie.pk for serie in series[2::4]]).update(
+            peso_real=Decimal('150'), repeticiones_reales=3
+        )
+        self.assertIgualQueReconstruir()
+
+    def test_reconstruir_resumenes_al_desplegar(self):
+        esperadas = self._tablas()
+        MarcaPersonal.objects.update(peso=Decimal('1'))
+        VolumenSemanal.objects.all().delete()
+        call_command('reconstruir_resumenes', stdout=io.StringIO())
+        self.assertEqual(self._tablas(), esperadas)
+
+    def test_solo_cuentan_las_sesiones_registradas(self):
+        # Una sesión con valores reales que el atleta no ha registrado (ej: datos antiguos clonados)
+        entreno = Entrenamiento.objects.filter(atleta=self.atleta, semana=4).get()
+        Entrenamiento.objects.filter(pk=entreno.pk).update(registrado_en=None)
+        reconstruir_marcas_personales()
+        reconstruir_volumen_semanal()
+        semana = VolumenSemanal.objects.filter(atleta=self.atleta, semana=4)
+        self.assertEqual(set(semana.values_list('series_completadas', 'tonelaje', 'e1rm_maximo')), {(0, 0, None)})
+        self.assertFalse(MarcaPersonal.objects.filter(serie_origen__detalle_entrenamiento__entrenamiento=entreno).exists())
+
+        # Al registrar una sola serie pasan a contar todas las de la sesión
+        serie = SerieEjercicio.objects.filter(detalle_entrenamiento__entrenamiento=entreno).first()
+        serie.repeticiones_reales = 2
+        serie.save()
+        self.assertEqual(set(semana.values_list('series_completadas', flat=True)), {4})
+        self.assertIgualQueReconstruir()
+
+    def test_reordenar_y_cambiar_de_ejercicio(self):
+        # El orden de los ejercicios decide la serie_origen de cada récord
+        detalles = list(DetalleEntrenamiento.objects.filter(entrenamiento__atleta=self.atleta))
+        for detalle in detalles:
+            detalle.orden = 3 - detalle.orden
+        DetalleEntrenamiento.objects.bulk_update(detalles, ['orden'])
+        self.assertIgualQueReconstruir()
+
+        detalle = DetalleEntrenamiento.objects.get(pk=detalles[0].pk)
+        detalle.ejercicio = Ejercicio.objects.create(nombre='Peso muerto')
+        detalle.save()
+        self.assertIgualQueReconstruir()
+        self.test_mismo_resultado_que_el_calculo_original()
+
+    def test_mismo_resultado_que_el_calculo_original(self):
+        for atleta in (self.atleta, self.otro):
+            marcas = atleta.get_marcas_personales()
+            for marca in marcas:
+                del marca['mejor_e1rm']
+            self.assertEqual(marcas, marcas_personales_referencia(atleta))
+
+    def test_guardar_una_serie_invalida_la_cache(self):
+        antes = marcas_personales_en_cache(self.atleta)
+        repetidas, consultas = self.capturar_consultas(marcas_personales_en_cache, self.atleta)
+        self.assertEqual((repetidas, consultas), (antes, []))
+
+        serie = self._series(self.atleta)[0]
+        serie.peso_real, serie.repeticiones_reales = Decimal('200'), 1
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            serie.save()
+        # La versión cambia al confirmar: antes, nadie cachea lo antiguo con la versión nueva
+        self.assertEqual(marcas_personales_en_cache(self.atleta), antes)
+        for callback in callbacks:
+            callback()
+        despues = {m['ejercicio'].pk: m for m in marcas_personales_en_cache(self.atleta)}
+        self.assertEqual(despues[serie.detalle_entrenamiento.ejercicio_id]['record_max_peso_1rm']['peso'], Decimal('200'))
+
+        # También al actualizar en bloque con update()
+        with self.captureOnCommitCallbacks(execute=True):
+            SerieEjercicio.objects.filter(pk=serie.pk).update(peso_real=Decimal('210'))
+        despues = {m['ejercicio'].pk: m for m in marcas_personales_en_cache(self.atleta)}
+        self.assertEqual(despues[serie.detalle_entrenamiento.ejercicio_id]['record_max_peso_1rm']['peso'], Decimal('210'))
+
+    def test_pagina_de_progresion_semanal(self):
+        self.client.force_login(self.atleta.user)
+        url = reverse('progresion_ejercicio', kwargs={'pk': self.ejercicios[0].pk})
+        for formula in ('epley', 'brzycki', 'rpe'):
+            with self.subTest(formula=formula):
+                respuesta = self.client.get(url, {'formula': formula})
+                self.assertEqual(respuesta.context['formula'], formula)
+                # Cuatro sesiones, una por semana
+                self.assertEqual(len(respuesta.context['e1rm_semanal']), 4)
+                self.assertContains(respuesta, ' kg</td>', count=4)
+
+    def test_progresion_semanal_desde_el_resumen(self):
+        # Una sesión suelta, fuera del mesociclo, en una semana sin resumen
+        suelto = Entrenamiento.objects.create(entrenador=self.entrenador, atleta=self.atleta, nombre='Suelto')
+        detalle = DetalleEntrenamiento.objects.create(entrenamiento=suelto, ejercicio=self.ejercicios[0], orden=1)
+        SerieEjercicio.objects.create(
+            detalle_entrenamiento=detalle, numero_serie=1, repeticiones_o_rango='5',
+            peso_real=Decimal('70'), repeticiones_reales=4
+        )
+        Entrenamiento.objects.filter(pk=suelto.pk).update(registrado_en=timezone.now() - timedelta(days=60))
+
+        for ejercicio in self.ejercicios:
+            semanal, consultas = self.capturar_consultas(calcular_progresion_semanal, self.atleta, ejercicio)
+            esperada = agrupar_progresion_semanal(calcular_progresion(self.atleta, ejercicio))
+            self.assertEqual(len(semanal['fecha']), 5 if ejercicio == self.ejercicios[0] else 4)
+            np.testing.assert_array_equal(semanal['fecha'], esperada['fecha'])
+            for clave in ('top', 'reps', 'e1rm', 'tonelaje'):
+                np.testing.assert_allclose(semanal[clave], esperada[clave], rtol=1e-4)
+            # Las series solo se leen para los entrenamientos sin mesociclo
+            for sql in consultas:
+                if 'core_serieejercicio' in sql:
+                    self.assertIn('"mesociclo_id" IS NULL', sql)
+
+    def test_datos_de_progresion_sin_valores_no_finitos(self):
+        # Brzycki no está definida a partir de 37 repeticiones: una sesión entera sin e1RM
+        primera = self._series(self.atleta)[:4]
+        SerieEjercicio.objects.filter(pk__in=[serie.pk for serie in primera]).update(repeticiones_reales=40)
+
+        def rechazar(constante):
+            raise ValueError(f"JSON no válido: {constante}")
+
+        self.client.force_login(self.atleta.user)
+        url = reverse('progresion_datos', kwargs={'pk': self.ejercicios[0].pk})
+        for resolucion in ('sesion', 'semana'):
+            with self.subTest(resolucion=resolucion):
+                respuesta = self.client.get(url, {'formula': 'brzycki', 'resolucion': resolucion})
+                datos = json.loads(respuesta.content, parse_constant=rechazar)
+                self.assertEqual((datos['total'], len(datos['e1rm'])), (3, 3))
+
+    def test_top_n_solo_con_series_del_atleta(self):
+        ejercicio = self.ejercicios[0]
+        # La serie más pesada del ejercicio es de otro atleta
+        ajena = self._series(self.otro)[0]
+        ajena.peso_real, ajena.repeticiones_reales = Decimal('300'), 1
+        ajena.save()
+
+        url = reverse('progresion_maxima', kwargs={'ejercicio_pk': ejercicio.pk})
+        for perfil, atleta, parametros in (
+            (self.atleta, self.atleta, {}), (self.entrenador, self.atleta, {'atleta': self.atleta.pk}),
+            (self.entrenador, self.otro, {'atleta': self.otro.pk}),
+        ):
+            with self.subTest(perfil=perfil.nombre, atleta=atleta.nombre):
+                # La respuesta sin renderizar: basta con el contexto de la vista
+                peticion = RequestFactory().get(url, {'n': 50, **parametros})
+                peticion.user = perfil.user
+                # Lo que deja PerfilMiddleware (RequestFactory no pasa por los middlewares)
+                peticion.perfil = perfil
+                series = AtletaProgresionMaxView.as_view()(peticion, ejercicio_pk=ejercicio.pk).context_data['series']
+                propias = series_validas_para_marcas().filter(
+                    detalle_entrenamiento__entrenamiento__atleta=atleta, detalle_entrenamiento__ejercicio=ejercicio
+                )
+                self.assertEqual({serie.pk for serie in series}, set(propias.values_list('pk', flat=True)))
+                self.assertEqual(ajena.pk in {serie.pk for serie in series}, atleta == self.otro)
+
+
+class ReplicarPlanificacionSemanalTests(EntrenadorAtletaTestCase):
+    """
+    El clonado de una sesión a otras semanas hace un número de consultas
+    constante, sea cual sea el número de semanas, ejercicios o series.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.mesociclo = Mesociclo.objects.create(
+            nombre='Bloque', entrenador=cls.entrenador, atleta=cls.atleta, semanas_objetivo=12
+        )
+        cls.origen = Entrenamiento.objects.create(
+            entrenador=cls.entrenador, atleta=cls.atleta, mesociclo=cls.mesociclo, nombre='Torso A', semana=1, dia_orden=1
+        )
+        for orden in range(1, 7):
+            detalle = DetalleEntrenamiento.objects.create(
+                entrenamiento=cls.origen, ejercicio=Ejercicio.objects.create(nombre=f'Ejercicio {orden}'), orden=orden
+            )
+            SerieEjercicio.objects.bulk_create([
+                SerieEjercicio(
+                    detalle_entrenamiento=detalle, numero_serie=numero, repeticiones_o_rango='8',
+                    rpe_prescrito=Decimal('8'), peso_real=Decimal('60') + numero, repeticiones_reales=8,
+                    rpe_real=Decimal('7.5')
+                )
+                for numero in range(1, 5)
+            ])
+
+    def _clonar(self, semanas):
+        nuevos, consultas = self.capturar_consultas(replicar_planificacion_semanal, self.origen, semanas)
+        return nuevos, len(consultas)
+
+    def test_numero_de_consultas_constante(self):
+        # Tres semanas (72 series) caben en un solo INSERT incluso con el límite de
+        # parámetros de SQLite; por encima, bulk_create lo trocea en lotes.
+        _, una_semana = self._clonar([2])
+        _, tres_semanas = self._clonar([3, 4, 5])
+        self.assertEqual(una_semana, tres_semanas)
+        self.assertLessEqual(una_semana, 13)
+
+    def test_copia_la_prescripcion_sin_los_valores_reales(self):
+        nuevos, _ = self._clonar([2, 3])
+        self.assertEqual([e.semana for e in nuevos], [2, 3])
+        for entreno in nuevos:
+            series = SerieEjercicio.objects.filter(detalle_entrenamiento__entrenamiento=entreno)
+            self.assertEqual(entreno.detalles.count(), 6)
+            self.assertEqual(series.count(), 24)
+            self.assertFalse(series.filter(
+                Q(peso_real__isnull=False) | Q(repeticiones_reales__isnull=False) | Q(rpe_real__isnull=False)
+            ).exists())
+            self.assertEqual(
+                list(series.order_by('detalle_entrenamiento__orden', 'numero_serie').values_list(
+                    'detalle_entrenamiento__orden', 'numero_serie', 'repeticiones_o_rango', 'rpe_prescrito')),
+                list(SerieEjercicio.objects.filter(detalle_entrenamiento__entrenamiento=self.origen).order_by(
+                    'detalle_entrenamiento__orden', 'numero_serie').values_list(
+                    'detalle_entrenamiento__orden', 'numero_serie', 'repeticiones_o_rango', 'rpe_prescrito')),
+            )
+            self.assertIsNone(entreno.registrado_en)
+
+        # La semana clonada cuenta como prescrita, no como completada
+        self.assertEqual(
+            set(VolumenSemanal.objects.filter(mesociclo=self.mesociclo, semana=3).values_list(
+                'series_prescritas', 'series_completadas', 'tonelaje')),
+            {(4, 0, Decimal('0'))},
+        )
+        self.assertEqual(MarcaPersonal.objects.filter(atleta=self.origen.atleta).count(), 6)
+        rutinas, _ = pagina_rutinas(self.atleta, semana=3, estado='pendiente')
+        self.assertEqual(len(rutinas), 1)
+
+    def test_registro_muestra_la_semana_anterior(self):
+        nuevo, = self._clonar([2])[0]
+        self.client.force_login(self.atleta.user)
+        respuesta = self.client.get(reverse('detalle_rutina', kwargs={'pk': nuevo.pk}))
+        # Pesos de la semana 1 (61 a 64 kg) como placeholder, con el campo vacío
+        for peso in range(61, 65):
+            self.assertContains(respuesta, f'placeholder="{peso} kg"', count=6)
+
+    def test_omite_semanas_existentes(self):
+        self._clonar([2])
+        nuevos, _ = self._clonar([2, 3, 3])
+        self.assertEqual([e.semana for e in nuevos], [3])
+        self.assertEqual(self._clonar([2, 3])[0], [])
+
+
+class ClonarMesocicloTests(EntrenadorAtletaTestCase):
+    """
+    Copia de un mesociclo completo y uso de plantillas: misma estructura
+    prescrita y número de consultas independiente del número de atletas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        atleta = cls.atleta
+        cls.atletas = [crear_perfil(f'nuevo{i}', 'atleta') for i in range(4)]
+        cls.mesociclo = Mesociclo.objects.create(nombre='Bloque', entrenador=cls.entrenador, atleta=atleta, semanas_objetivo=3)
+        ejercicios = [Ejercicio.objects.create(nombre=f'Ejercicio {i}') for i in range(2)]
+        for semana in range(1, 4):
+            for dia in (1, 2):
+                entreno = Entrenamiento.objects.create(
+                    entrenador=cls.entrenador, atleta=atleta, mesociclo=cls.mesociclo,
+                    nombre=f'Día {dia}', semana=semana, dia_orden=dia
+                )
+                for orden, ejercicio in enumerate(ejercicios, start=1):
+                    detalle = DetalleEntrenamiento.objects.create(entrenamiento=entreno, ejercicio=ejercicio, orden=orden)
+                    SerieEjercicio.objects.bulk_create([
+                        SerieEjercicio(
+                            detalle_entrenamiento=detalle, numero_serie=numero, repeticiones_o_rango='5',
+                            rpe_prescrito=Decimal('8.5'), peso_real=Decimal('100'), repeticiones_reales=5
+                        )
+                        for numero in range(1, 3)
+                    ])
+
+    def _arbol(self, mesociclo):
+        return list(SerieEjercicio.objects.filter(
+            detalle_entrenamiento__entrenamiento__mesociclo=mesociclo
+        ).order_by(
+            'detalle_entrenamiento__entrenamiento__semana', 'detalle_entrenamiento__entrenamiento__dia_orden',
+            'detalle_entrenamiento__orden', 'numero_serie'
+        ).values_list(
+            'detalle_entrenamiento__entrenamiento__semana', 'detalle_entrenamiento__entrenamiento__dia_orden',
+            'detalle_entrenamiento__ejercicio_id', 'numero_serie', 'repeticiones_o_rango', 'rpe_prescrito'
+        ))
+
+    def test_clonar_copia_solo_la_prescripcion(self):
+        nuevo, = clonar_mesociclo(self.mesociclo, [self.atletas[0]])
+        self.assertEqual(nuevo.atleta, self.atletas[0])
+        self.assertEqual(self._arbol(nuevo), self._arbol(self.mesociclo))
+        self.assertFalse(SerieEjercicio.objects.filter(
+            detalle_entrenamiento__entrenamiento__mesociclo=nuevo, peso_real__isnull=False
+        ).exists())
+        # Como la señal de creación de Entrenamiento, asigna el entrenador a los atletas libres
+        self.atletas[0].refresh_from_db()
+        self.assertEqual(self.atletas[0].entrenador, self.entrenador)
+
+    def test_plantilla_consultas_constantes_por_atleta(self):
+        # 24 series por atleta: tres atletas caben en un solo INSERT con el límite de SQLite
+        plantilla = crear_plantilla_desde_mesociclo(self.mesociclo)
+        _, uno = self.capturar_consultas(instanciar_plantilla, plantilla, self.atletas[:1])
+        nuevos, tres = self.capturar_consultas(instanciar_plantilla, plantilla, self.atletas[1:4])
+        self.assertEqual(len(uno), len(tres))
+        self.assertEqual(len(nuevos), 3)
+        for mesociclo in nuevos:
+            self.assertEqual(self._arbol(mesociclo), self._arbol(self.mesociclo))
+
+    def test_programa_asignado_fechado_por_registro(self):
+        # Todas las semanas del programa se crean a la vez, con el mismo created_at
+        nuevo, = asignar_programa(self.mesociclo, [self.atletas[0].pk])[0]
+        atleta, ejercicio = self.atletas[0], Ejercicio.objects.get(nombre='Ejercicio 0')
+        inicio = timezone.now() - timedelta(weeks=3)
+        for semana in range(1, 4):
+            entreno = nuevo.entrenamientos.get(semana=semana, dia_orden=1)
+            serie = SerieEjercicio.objects.get(
+                detalle_entrenamiento__entrenamiento=entreno, detalle_entrenamiento__ejercicio=ejercicio, numero_serie=1
+            )
+            with mock.patch('django.utils.timezone.now', return_value=inicio + timedelta(weeks=semana - 1)):
+                registrar_series(entreno, [{'id': serie.pk, 'peso_real': 90 + 10 * semana, 'repeticiones_reales': 5}])
+
+        fechas = [inicio + timedelta(weeks=semana) for semana in range(3)]
+        progresion = calcular_progresion(atleta, ejercicio)
+        self.assertEqual(list(progresion['top']), [100, 110, 120])
+        np.testing.assert_array_equal(
+            progresion['fecha'], np.array([int(f.timestamp()) for f in fechas], dtype='datetime64[s]')
+        )
+        self.assertEqual(
+            list(VolumenSemanal.objects.filter(mesociclo=nuevo, ejercicio=ejercicio).order_by('semana').values_list('fecha', flat=True)),
+            fechas
+        )
+        self.assertEqual(MarcaPersonal.objects.get(atleta=atleta, ejercicio=ejercicio, repeticiones=5).fecha, fechas[2])
+
+    def test_tarea_reintentada_sin_duplicar_lotes(self):
+        ids = [atleta.pk for atleta in self.atletas]
+        tarea_asignar = encolar('asignar_programa', {'mesociclo_id': self.mesociclo.pk, 'atleta_ids': ids})
+        avances = []
+
+        def caer_en_el_segundo_lote(hechos, total, resultado=None):
+            # El trabajador cae al guardar el progreso del segundo lote
+            avances.append(hechos)
+            if len(avances) == 2:
+                raise RuntimeError("fallo de prueba")
+            informar_progreso(hechos, total, resultado)
+
+        with mock.patch('core.services.ATLETAS_POR_LOTE', 2):
+            with mock.patch('core.tareas.informar_progreso', side_effect=caer_en_el_segundo_lote):
+                self.assertFalse(ejecutar(reclamar('trabajador')))
+            tarea_asignar.refresh_from_db()
+            # El segundo lote se deshace con su progreso: el reintento lo repite una sola vez
+            self.assertEqual(tarea_asignar.hechos, 2)
+            self.assertEqual(Mesociclo.objects.filter(atleta__in=self.atletas).count(), 2)
+
+            Tarea.objects.filter(pk=tarea_asignar.pk).update(disponible_en=timezone.now())
+            self.assertTrue(ejecutar(reclamar('trabajador')))
+
+        tarea_asignar.refresh_from_db()
+        creados = Mesociclo.objects.filter(atleta__in=self.atletas)
+        self.assertEqual(sorted(creados.values_list('atleta_id', flat=True)), ids)
+        # El resultado incluye también los mesociclos del primer intento
+        self.assertEqual(sorted(tarea_asignar.resultado['mesociclos']), sorted(creados.values_list('pk', flat=True)))
+
+    def test_asignar_programa_por_lotes(self):
+        otro_entrenador = crear_perfil('otro', 'entrenador')
+        ajeno = crear_perfil('ajeno', 'atleta', entrenador=otro_entrenador)
+        avances = []
+        ids = [atleta.pk for atleta in self.atletas] + [ajeno.pk]
+        nuevos, ignorados = asignar_programa(
+            self.mesociclo, ids, lote=3, progreso=lambda hechos, total, mesociclos: avances.append((hechos, total))
+        )
+
+        self.assertEqual([m.atleta_id for m in nuevos], ids[:-1])
+        self.assertEqual(ignorados, [ajeno.pk])
+        self.assertEqual(avances, [(3, 4), (4, 4)])
+        self.assertEqual(
+            PerfilUsuario.objects.filter(pk__in=ids[:-1], entrenador=self.entrenador).count(), len(self.atletas)
+        )
+        ajeno.refresh_from_db()
+        self.assertEqual(ajeno.entrenador, otro_entrenador)
+
+
+class ProcesarSeriesTests(EntrenadorAtletaTestCase):
+    """
+    Edición de las series de una sesión: solo se escriben las diferencias y el
+    número de consultas no depende del número de series.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ejercicio = Ejercicio.objects.create(nombre='Sentadilla')
+
+    def _sesion(self, series):
+        entreno = Entrenamiento.objects.create(
+            entrenador=self.entrenador, atleta=self.atleta, nombre='Sesión', semana=1, dia_orden=1
+        )
+        detalle = DetalleEntrenamiento.objects.create(entrenamiento=entreno, ejercicio=self.ejercicio, orden=1)
+        SerieEjercicio.objects.bulk_create([
+            SerieEjercicio(detalle_entrenamiento=detalle, numero_serie=n, repeticiones_o_rango='5', rpe_prescrito=Decimal('8'))
+            for n in range(1, series + 1)
+        ])
+        vista = EntrenamientoUpdateView()
+        vista.object = entreno
+        return vista, detalle
+
+    def _editar_todo(self, series):
+        """Cambia las reps de todas las series menos la primera (que se borra) y añade dos nuevas."""
+        vista, detalle = self._sesion(series)
+        ids = list(detalle.series.order_by('numero_serie').values_list('pk', flat=True))
+        post = {f'serie_{pk}_repeticiones': '3' for pk in ids}
+        post.update({f'serie_{pk}_rpe': '8.0' for pk in ids})  # mismo valor: no es un cambio
+        post[f'serie_{ids[0]}_delete'] = '1'
+        post.update({
+            'new_serie_form_0_1_repeticiones': '2', 'new_serie_form_0_1_numero': str(series + 1),
+            'new_serie_form_0_2_repeticiones': '1', 'new_serie_form_0_2_rpe': '9.5',
+            'new_serie_form_0_x_repeticiones': '1',  # clave mal formada: se ignora
+        })
+        _, consultas = self.capturar_consultas(vista._procesar_series, post, {'0': detalle})
+        return detalle, consultas
+
+    def test_consultas_constantes(self):
+        _, pocas = self._editar_todo(3)
+        detalle, muchas = self._editar_todo(40)
+        self.assertEqual(len(pocas), len(muchas))
+        self.assertEqual(detalle.series.count(), 41)
+        self.assertEqual(detalle.series.filter(repeticiones_o_rango='3').count(), 39)
+        self.assertTrue(detalle.series.filter(repeticiones_o_rango='1', rpe_prescrito=Decimal('9.5')).exists())
+
+    def test_sin_cambios_no_escribe(self):
+        vista, detalle = self._sesion(5)
+        post = {f'serie_{pk}_repeticiones': '5' for pk in detalle.series.values_list('pk', flat=True)}
+        _, consultas = self.capturar_consultas(vista._procesar_series, post, {'0': detalle})
+        self.assertEqual(len(consultas), 1)
+
+    def test_valor_no_valido(self):
+        vista, detalle = self._sesion(2)
+        serie = detalle.series.first()
+        with self.assertRaises(ValidationError):
+            vista._procesar_series({
+                f'serie_{serie.pk}_repeticiones': '4',
+                f'serie_{serie.pk}_rpe': 'mucho',
+            }, {'0': detalle})
+        serie.refresh_from_db()
+        self.assertEqual(serie.repeticiones_o_rango, '5')
+
+    def test_formulario_tras_deshacer_sin_filas_inexistentes(self):
+        vista, detalle = self._sesion(1)
+        entreno, serie = vista.object, detalle.series.get()
+        self.client.force_login(self.entrenador.user)
+        respuesta = self.client.post(reverse('entrenamiento_update', args=[entreno.pk]), {
+            'atleta': self.atleta.pk, 'nombre': entreno.nombre, 'semana': 1, 'dia_orden': 1,
+            'detalles-TOTAL_FORMS': '2', 'detalles-INITIAL_FORMS': '1',
+            'detalles-0-id': detalle.pk, 'detalles-0-ejercicio': self.ejercicio.pk,
+            'detalles-1-ejercicio': self.ejercicio.pk,  # ejercicio nuevo
+            f'serie_{serie.pk}_rpe': 'mucho',
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(entreno.detalles.count(), 1)
+        existente, nuevo = respuesta.context['detalle_formset'].forms
+        self.assertEqual(existente.instance.pk, detalle.pk)
+        self.assertIsNone(nuevo.instance.pk)
+        self.assertTrue(nuevo.instance._state.adding)
+
+
+class ConfigurarSeriesTests(EntrenadorAtletaTestCase):
+    """
+    Configuración de las series prescritas de una sesión: mismo número de
+    consultas al mostrar y al guardar, tenga la sesión 2 o 10 ejercicios.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ejercicios = [Ejercicio.objects.create(nombre=f'Ejercicio {i}') for i in range(10)]
+
+    def setUp(self):
+        self.client.force_login(self.entrenador.user)
+
+    def _sesion(self, ejercicios):
+        entreno = Entrenamiento.objects.create(
+            entrenador=self.entrenador, atleta=self.atleta, nombre='Sesión', semana=1, dia_orden=1
+        )
+        for orden, ejercicio in enumerate(self.ejercicios[:ejercicios], start=1):
+            detalle = DetalleEntrenamiento.objects.create(entrenamiento=entreno, ejercicio=ejercicio, orden=orden)
+            SerieEjercicio.objects.bulk_create([
+                SerieEjercicio(detalle_entrenamiento=detalle, numero_serie=n, repeticiones_o_rango='5')
+                for n in range(1, 4)
+            ])
+        return entreno
+
+    def _datos(self, entreno):
+        """Borra la primera serie de cada ejercicio, cambia las demás y añade una nueva."""
+        datos = {}
+        for detalle in entreno.detalles.all():
+            prefijo = f'series-{detalle.pk}'
+            series = list(detalle.series.order_by('numero_serie'))
+            datos[f'{prefijo}-TOTAL_FORMS'] = len(series) + 1
+            datos[f'{prefijo}-INITIAL_FORMS'] = len(series)
+            for i, serie in enumerate(series):
+                datos.update({
+                    f'{prefijo}-{i}-id': serie.pk,
+                    f'{prefijo}-{i}-detalle_entrenamiento': detalle.pk,
+                    f'{prefijo}-{i}-repeticiones_o_rango': '8-10',
+                    f'{prefijo}-{i}-rpe_prescrito': '8',
+                })
+            datos[f'{prefijo}-0-DELETE'] = 'on'
+            datos[f'{prefijo}-{len(series)}-repeticiones_o_rango'] = '3'
+        return datos
+
+    def _consultas(self, metodo, entreno, datos=None):
+        url = reverse('configurar_series', kwargs={'pk': entreno.pk})
+        respuesta, consultas = self.capturar_consultas(metodo, url, datos) if datos else self.capturar_consultas(metodo, url)
+        self.assertIn(respuesta.status_code, (200, 302))
+        return len(consultas)
+
+    def test_mostrar_consultas_constantes(self):
+        self.assertEqual(
+            self._consultas(self.client.get, self._sesion(2)),
+            self._consultas(self.client.get, self._sesion(10)),
+        )
+
+    def test_guardar_consultas_constantes(self):
+        pequeña, grande = self._sesion(2), self._sesion(10)
+        self.assertEqual(
+            self._consultas(self.client.post, pequeña, self._datos(pequeña)),
+            self._consultas(self.client.post, grande, self._datos(grande)),
+        )
+        for detalle in grande.detalles.all():
+            self.assertEqual(
+                list(detalle.series.order_by('numero_serie').values_list('numero_serie', 'repeticiones_o_rango')),
+                [(1, '8-10'), (2, '8-10'), (3, '3')]
+            )
+
+
+class ActualizarOrdenEjerciciosTests(EntrenadorAtletaTestCase):
+    """
+    Reordenación de ejercicios por AJAX: varias sesiones en una petición,
+    con las mismas consultas que una sola y autorizando todas las filas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        atleta = cls.atleta
+        ejercicios = [Ejercicio.objects.create(nombre=f'Ejercicio {i}') for i in range(4)]
+        cls.sesiones = []
+        for dia in (1, 2):
+            entreno = Entrenamiento.objects.create(
+                entrenador=cls.entrenador, atleta=atleta, nombre=f'Día {dia}', semana=1, dia_orden=dia
+            )
+            cls.sesiones.append([
+                DetalleEntrenamiento.objects.create(entrenamiento=entreno, ejercicio=ejercicio, orden=orden).pk
+                for orden, ejercicio in enumerate(ejercicios, start=1)
+            ])
+
+    def _post(self, datos):
+        respuesta, consultas = self.capturar_consultas(
+            self.client.post, reverse('actualizar_orden_ejercicios'), json.dumps(datos), content_type='application/json'
+        )
+        return respuesta, len(consultas)
+
+    def test_varias_sesiones_en_una_peticion(self):
+        self.client.force_login(self.entrenador.user)
+        una, consultas_una = self._post({'orden': self.sesiones[0][::-1]})
+        dos, consultas_dos = self._post({'ordenes': [self.sesiones[0], self.sesiones[1][::-1]]})
+
+        self.assertEqual((una.status_code, dos.status_code), (200, 200))
+        self.assertEqual(consultas_una, consultas_dos)
+        self.assertEqual(dos.json()['actualizados'], 8)
+        for sesion in self.sesiones:
+            self.assertEqual(
+                list(DetalleEntrenamiento.objects.filter(pk__in=sesion).order_by('orden').values_list('pk', flat=True)),
+                sesion if sesion is self.sesiones[0] else sesion[::-1]
+            )
+
+    def test_rechaza_listas_mezcladas_y_ajenas(self):
+        self.client.force_login(self.entrenador.user)
+        respuesta, _ = self._post({'orden': self.sesiones[0][:2] + self.sesiones[1][:2]})
+        self.assertEqual(respuesta.status_code, 400)
+
+        otro = crear_perfil('otro', 'entrenador')
+        self.client.force_login(otro.user)
+        respuesta, _ = self._post({'orden': self.sesiones[0][::-1]})
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertEqual(DetalleEntrenamiento.objects.get(pk=self.sesiones[0][0]).orden, 1)
+
+
+class RegistroSeriesAPITests(EntrenadorAtletaTestCase):
+    """
+    Autoguardado del registro del atleta: solo las series tocadas, valores
+    validados como en el formulario y envíos repetidos sin efecto.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        entrenador = cls.entrenador
+        cls.entreno = Entrenamiento.objects.create(
+            entrenador=entrenador, atleta=cls.atleta, nombre='Sesión', semana=1, dia_orden=1
+        )
+        detalle = DetalleEntrenamiento.objects.create(
+            entrenamiento=cls.entreno, ejercicio=Ejercicio.objects.create(nombre='Press'), orden=1
+        )
+        cls.series = SerieEjercicio.objects.bulk_create([
+            SerieEjercicio(detalle_entrenamiento=detalle, numero_serie=n, repeticiones_o_rango='5')
+            for n in range(1, 4)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.atleta.user)
+
+    def _patch(self, series, clave=None):
+        cabeceras = {'HTTP_IDEMPOTENCY_KEY': clave} if clave else {}
+        return self.client.patch(
+            reverse('registro_series', kwargs={'pk': self.entreno.pk}),
+            json.dumps({'series': series}), content_type='application/json', **cabeceras
+        )
+
+    def test_guarda_solo_la_serie_tocada(self):
+        serie = self.series[1]
+        respuesta = self._patch([{'id': serie.pk, 'peso_real': '100.5', 'repeticiones_reales': 5}], 'a1')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['series'], [
+            {'id': serie.pk, 'peso_real': '100.50', 'repeticiones_reales': 5, 'rpe_real': None}
+        ])
+        self.assertEqual(SerieEjercicio.objects.filter(peso_real__isnull=False).count(), 1)
+        self.assertTrue(MarcaPersonal.objects.filter(atleta=self.atleta, repeticiones=5, peso=Decimal('100.5')).exists())
+
+    def test_envio_repetido_no_se_vuelve_a_aplicar(self):
+        serie = self.series[0]
+        primera = self._patch([{'id': serie.pk, 'peso_real': 80, 'repeticiones_reales': 8}], 'misma')
+        self._patch([{'id': serie.pk, 'peso_real': 90}], 'otra')
+        repetida = self._patch([{'id': serie.pk, 'peso_real': 80, 'repeticiones_reales': 8}], 'misma')
+
+        self.assertTrue(repetida.json()['repetida'])
+        self.assertEqual(repetida.json()['series'], primera.json()['series'])
+        serie.refresh_from_db()
+        self.assertEqual(serie.peso_real, Decimal('90'))
+
+    def test_valor_no_valido_no_consume_la_clave(self):
+        serie = self.series[2]
+        self.assertEqual(self._patch([{'id': serie.pk, 'peso_real': '17.1'}], 'k').status_code, 400)
+        self.assertEqual(self._patch([{'id': serie.pk, 'peso_real': '17.25'}], 'k').status_code, 200)
+        serie.refresh_from_db()
+        self.assertEqual(serie.peso_real, Decimal('17.25'))
+
+    def test_id_booleano_no_es_valido(self):
+        self.assertEqual(self._patch([{'id': True, 'peso_real': 80}]).status_code, 400)
+
+    def test_purga_de_claves_caducadas(self):
+        serie = self.series[0]
+        self._patch([{'id': serie.pk, 'peso_real': 80}], 'antigua')
+        self._patch([{'id': serie.pk, 'peso_real': 85}], 'reciente')
+        ClaveIdempotencia.objects.filter(clave='antigua').update(created_at=timezone.now() - timedelta(days=31))
+
+        # El trabajador las purga al quedarse sin tareas
+        trabajar('trabajador', una_vez=True)
+        self.assertEqual(list(ClaveIdempotencia.objects.values_list('clave', flat=True)), ['reciente'])
+
+    def test_otro_atleta_no_puede_registrar(self):
+        otro = crear_perfil('otro', 'atleta')
+        self.client.force_login(otro.user)
+        self.assertEqual(self._patch([{'id': self.series[0].pk, 'peso_real': 50}]).status_code, 403)
+
+
+class SincronizarSeriesTests(EntrenadorAtletaTestCase):
+    """
+    Sincronización de la cola offline: lotes en una transacción, claves repetidas
+    sin efecto, conflictos detectados por la versión de la serie y coste fijo por lote.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        entrenador = cls.entrenador
+        cls.entreno = entreno = Entrenamiento.objects.create(
+            entrenador=entrenador, atleta=cls.atleta, nombre='Sesión', semana=1, dia_orden=1
+        )
+        detalle = DetalleEntrenamiento.objects.create(
+            entrenamiento=entreno, ejercicio=Ejercicio.objects.create(nombre='Sentadilla'), orden=1
+        )
+        cls.series = SerieEjercicio.objects.bulk_create([
+            SerieEjercicio(detalle_entrenamiento=detalle, numero_serie=n, repeticiones_o_rango='5')
+            for n in range(1, 61)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.atleta.user)
+        self.futuro = timezone.now() + timedelta(minutes=1)
+
+    def _op(self, clave, serie, **valores):
+        """Operación de la cola; por defecto con la versión actual de la serie."""
+        registrado_en = valores.pop('registrado_en', self.futuro)
+        version = valores.pop('version', None) or SerieEjercicio.objects.get(pk=serie.pk).updated_at.isoformat()
+        return {
+            'clave': clave, 'id': serie.pk, 'version': version,
+            'registrado_en': registrado_en.isoformat(), **valores,
+        }
+
+    def _post(self, operaciones):
+        return self.client.post(
+            reverse('sincronizar_series'), json.dumps({'operaciones': operaciones}), content_type='application/json'
+        )
+
+    def test_lote_con_clave_repetida_y_valor_no_valido(self):
+        respuesta = self._post([
+            self._op('a', self.series[0], peso_real=100, repeticiones_reales=5),
+            self._op('b', self.series[1], peso_real='17.1'),
+            self._op('c', self.series[2], peso_real=60, repeticiones_reales=10),
+        ])
+        estados = [r['estado'] for r in respuesta.json()['resultados']]
+        self.assertEqual(estados, ['aplicada', 'error', 'aplicada'])
+        self.assertEqual(SerieEjercicio.objects.filter(peso_real__isnull=False).count(), 2)
+        self.assertTrue(MarcaPersonal.objects.filter(atleta=self.atleta, repeticiones=5, peso=Decimal('100')).exists())
+
+        # Reenvío tras un corte: la misma clave no se vuelve a aplicar
+        repetida = self._post([self._op('a', self.series[0], peso_real=120)]).json()['resultados'][0]
+        self.assertEqual(repetida['estado'], 'repetida')
+        self.assertEqual(repetida['serie']['peso_real'], '100')
+        self.assertEqual(SerieEjercicio.objects.get(pk=self.series[0].pk).peso_real, Decimal('100'))
+
+    def test_conflicto_por_version_sin_comparar_relojes(self):
+        serie = self.series[3]
+        # Versión que el atleta vio en la página antes de quedarse sin conexión
+        pagina = self.client.get(reverse('detalle_rutina', kwargs={'pk': self.entreno.pk})).content.decode()
+        vista = re.search(rf'data-serie-id="{serie.pk}" data-version="([^"]+)"', pagina).group(1)
+
+        servidor = self._post([self._op('servidor', serie, peso_real=90, version=vista)]).json()['resultados'][0]
+        self.assertEqual(servidor['estado'], 'aplicada')
+        self.assertNotEqual(servidor['serie']['version'], vista)
+
+        # El reloj del móvil va adelantado: aun así gana el cambio que ya tenía el servidor
+        adelantado = timezone.now() + timedelta(days=1)
+        resultado = self._post([
+            self._op('offline', serie, peso_real=70, version=vista, registrado_en=adelantado)
+        ]).json()['resultados'][0]
+        self.assertEqual(resultado['estado'], 'conflicto')
+        self.assertEqual(resultado['serie']['peso_real'], '90.00')
+        self.assertEqual(resultado['serie']['version'], servidor['serie']['version'])
+        self.assertEqual(SerieEjercicio.objects.get(pk=serie.pk).peso_real, Decimal('90'))
+
+        # El conflicto no consume la clave: con la versión nueva se aplica
+        resuelto = self._post([
+            self._op('offline', serie, peso_real=70, version=resultado['serie']['version'])
+        ]).json()['resultados'][0]
+        self.assertEqual(resuelto['estado'], 'aplicada')
+        self.assertEqual(SerieEjercicio.objects.get(pk=serie.pk).peso_real, Decimal('70'))
+
+    def test_varias_operaciones_de_una_serie_en_el_mismo_lote(self):
+        serie = self.series[4]
+        antes = timezone.now() - timedelta(minutes=5)
+        estados = [r['estado'] for r in self._post([
+            self._op('segunda', serie, peso_real=65),
+            self._op('primera', serie, peso_real=60, registrado_en=antes),
+        ]).json()['resultados']]
+        self.assertEqual(estados, ['aplicada', 'aplicada'])
+        self.assertEqual(SerieEjercicio.objects.get(pk=serie.pk).peso_real, Decimal('65'))
+
+    def test_otro_atleta_no_puede_sincronizar_series_ajenas(self):
+        otro = crear_perfil('otro', 'atleta')
+        self.client.force_login(otro.user)
+        resultado = self._post([self._op('x', self.series[0], peso_real=50)]).json()['resultados'][0]
+        self.assertEqual(resultado['estado'], 'error')
+        self.assertIsNone(SerieEjercicio.objects.get(pk=self.series[0].pk).peso_real)
+
+    def test_operacion_sin_zona_horaria_o_sin_version_se_rechaza(self):
+        op = self._op('z', self.series[0], peso_real=50)
+        self.assertEqual(self._post([{**op, 'registrado_en': '2026-01-01T10:00:00'}]).status_code, 400)
+        self.assertEqual(self._post([{k: v for k, v in op.items() if k != 'version'}]).status_code, 400)
+        self.assertEqual(self._post([{**op, 'id': True}]).status_code, 400)
+
+    def test_consultas_no_dependen_del_tamano_del_lote(self):
+        def consultas(series, prefijo):
+            operaciones = [
+                self._op(f'{prefijo}{n}', serie, peso_real=50 + n, repeticiones_reales=5)
+                for n, serie in enumerate(series)
+            ]
+            respuesta, consultas = self.capturar_consultas(self._post, operaciones)
+            self.assertEqual(respuesta.status_code, 200)
+            return len(consultas)
+
+        # El primer registro de la sesión lee además sus series (pasan a contar como completadas)
+        consultas(self.series[:1], 'r')
+        self.assertEqual(consultas(self.series[1:4], 'p'), consultas(self.series[4:], 'g'))
+
+
+class ObjetoPorPeticionTests(EntrenadorAtletaTestCase):
+    """
+    Las vistas de detalle cargan su objeto (con atleta, entrenador y mesociclo)
+    en una sola consulta por petición, aunque lo pidan varios métodos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.entreno = Entrenamiento.objects.create(
+            entrenador=cls.entrenador, atleta=cls.atleta, nombre='Sesión', semana=1, dia_orden=1
+        )
+        detalle = DetalleEntrenamiento.objects.create(
+            entrenamiento=cls.entreno, ejercicio=Ejercicio.objects.create(nombre='Press'), orden=1
+        )
+        SerieEjercicio.objects.create(detalle_entrenamiento=detalle, numero_serie=1, repeticiones_o_rango='5')
+
+    def _consultas_a(self, consultas, tabla):
+        return [sql for sql in consultas if sql.startswith('SELECT') and f'FROM "{tabla}"' in sql]
+
+    def test_registro_del_atleta_carga_el_entrenamiento_una_vez(self):
+        self.client.force_login(self.atleta.user)
+        url = reverse('detalle_rutina', kwargs={'pk': self.entreno.pk})
+        _, consultas = self.capturar_consultas(self.client.post, url, {
+            'series-TOTAL_FORMS': 0, 'series-INITIAL_FORMS': 0,
+            'series-MIN_NUM_FORMS': 0, 'series-MAX_NUM_FORMS': 1000,
+        })
+        self.assertEqual(len(self._consultas_a(consultas, 'core_entrenamiento')), 1)
+
+    def test_borrado_carga_el_entrenamiento_una_vez(self):
+        self.client.force_login(self.entrenador.user)
+        url = reverse('entrenamiento_delete', kwargs={'pk': self.entreno.pk})
+        respuesta, consultas = self.capturar_consultas(self.client.post, url)
+        self.assertEqual(respuesta.status_code, 302)
+        consultas = self._consultas_a(consultas, 'core_entrenamiento')
+        self.assertEqual(len(consultas), 1)
+        self.assertIn('INNER JOIN "core_perfilusuario"', consultas[0])
+
+    def test_records_del_atleta_cargan_el_perfil_una_vez(self):
+        self.client.force_login(self.entrenador.user)
+        url = reverse('atleta_record_detail', kwargs={'pk': self.atleta.pk})
+        respuesta, consultas = self.capturar_consultas(self.client.get, url)
+        self.assertEqual(respuesta.status_code, 200)
+        # Solo la del atleta: el perfil del usuario con sesión llega con el usuario (PerfilMiddleware)
+        consultas = self._consultas_a(consultas, 'core_perfilusuario')
+        self.assertEqual(len(consultas), 1)
+
+
+class PerfilMiddlewareTests(EntrenadorAtletaTestCase):
+    """
+    El usuario de la sesión y su perfil se cargan en una sola consulta y los
+    mixins de rol lo comprueban sin consultas adicionales.
+    """
+
+    def test_usuario_y_perfil_en_una_consulta(self):
+        self.client.force_login(self.entrenador.user)
+        respuesta, consultas = self.capturar_consultas(self.client.get, reverse('lista_atletas'))
+        self.assertEqual(respuesta.status_code, 200)
+
+        usuario = [sql for sql in consultas if 'FROM "auth_user"' in sql]
+        self.assertEqual(len(usuario), 1)
+        self.assertIn('JOIN "core_perfilusuario"', usuario[0])
+        # Ninguna consulta busca el perfil por usuario
+        self.assertFalse([sql for sql in consultas if 'WHERE "core_perfilusuario"."user_id" =' in sql])
+
+    def test_rol_incorrecto(self):
+        self.client.force_login(self.atleta.user)
+        self.assertRedirects(self.client.get(reverse('lista_atletas')), reverse('dashboard'), fetch_redirect_response=False)
+        # Las vistas JSON responden 403 en vez de redirigir
+        respuesta = self.client.post(reverse('actualizar_orden_ejercicios'), '{}', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 403)
+        # Las vistas de función usan el decorador equivalente
+        url = reverse('mesociclo_clonar', kwargs={'pk': 1})
+        self.assertRedirects(self.client.post(url), reverse('dashboard'), fetch_redirect_response=False)
+        self.client.logout()
+        self.assertTrue(self.client.post(url)['Location'].startswith(settings.LOGIN_URL))
+
+    def test_usuario_sin_perfil(self):
+        self.client.force_login(User.objects.create_user(username='admin', password='x'))
+        self.assertRedirects(self.client.get(reverse('lista_atletas')), reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_sesion_con_el_backend_anterior_sigue_abierta(self):
+        self.client.force_login(self.entrenador.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('lista_atletas')).status_code, 200)
+
+
+class ConteosEntrenamientoTests(EntrenadorAtletaTestCase):
+    """
+    Las páginas de rutinas y de mesociclo muestran ejercicios y series de cada
+    entrenamiento con un número fijo de consultas (anotaciones, sin COUNT por fila).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ejercicios = [Ejercicio.objects.create(nombre=f'Ejercicio {n}') for n in range(4)]
+        cls.pequeno = cls._mesociclo('Pequeño', semanas=1, dias=1)
+        cls.grande = cls._mesociclo('Grande', semanas=12, dias=5)
+
+    @classmethod
+    def _mesociclo(cls, nombre, semanas, dias):
+        mesociclo = Mesociclo.objects.create(nombre=nombre, entrenador=cls.entrenador, atleta=cls.atleta)
+        entrenos = Entrenamiento.objects.bulk_create([
+            Entrenamiento(
+                entrenador=cls.entrenador, atleta=cls.atleta, mesociclo=mesociclo,
+                nombre=f'S{semana} D{dia}', semana=semana, dia_orden=dia
+            )
+            for semana in range(1, semanas + 1) for dia in range(1, dias + 1)
+        ])
+        detalles = DetalleEntrenamiento.objects.bulk_create([
+            DetalleEntrenamiento(entrenamiento=entreno, ejercicio=ejercicio, orden=orden)
+            for entreno in entrenos for orden, ejercicio in enumerate(cls.ejercicios, start=1)
+        ])
+        # 3 series por ejercicio; la primera, completada
+        SerieEjercicio.objects.bulk_create([
+            SerieEjercicio(
+                detalle_entrenamiento=detalle, numero_serie=n, repeticiones_o_rango='5',
+                repeticiones_reales=5 if n == 1 else None, peso_real=Decimal('60') if n == 1 else None
+            )
+            for detalle in detalles for n in range(1, 4)
+        ])
+        return mesociclo
+
+    def _consultas(self, url):
+        respuesta, consultas = self.capturar_consultas(self.client.get, url)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, len(consultas)
+
+    def test_detalle_de_mesociclo_con_consultas_fijas(self):
+        self.client.force_login(self.entrenador.user)
+        _, pocas = self._consultas(reverse('mesociclo_detalle', kwargs={'pk': self.pequeno.pk}))
+        respuesta, muchas = self._consultas(reverse('mesociclo_detalle', kwargs={'pk': self.grande.pk}))
+
+        self.assertEqual(pocas, muchas)
+        self.assertContains(respuesta, '4 ejercicios · 4/12 series', count=60)
+
+    def test_mis_rutinas_con_consultas_fijas(self):
+        self.client.force_login(self.atleta.user)
+        respuesta, consultas = self._consultas(reverse('mis_rutinas'))
+
+        self.assertEqual(len(respuesta.context['rutinas']), TAMANO_PAGINA_RUTINAS)
+        rutina = respuesta.context['rutinas'][0]
+        self.assertEqual((rutina.num_ejercicios, rutina.num_series, rutina.num_series_completadas), (4, 12, 4))
+        # Sesión + usuario con perfil + entrenamientos con conteos + mesociclos del filtro
+        self.assertLessEqual(consultas, 4)
+
+
+class PaginacionRutinasTests(EntrenadorAtletaTestCase):
+    """
+    Listado de rutinas del atleta por cursor (created_at, id): sin huecos ni
+    repeticiones entre páginas, con filtros y con el mismo coste en cualquier página.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.mesociclo = Mesociclo.objects.create(nombre='Bloque', entrenador=cls.entrenador, atleta=cls.atleta)
+        ejercicio = Ejercicio.objects.create(nombre='Press')
+        cls.rutinas = Entrenamiento.objects.bulk_create([
+            Entrenamiento(
+                entrenador=cls.entrenador, atleta=cls.atleta, nombre=f'R{n}', semana=n % 4 + 1, dia_orden=1,
+                mesociclo=cls.mesociclo if n % 2 else None,
+            )
+            for n in range(30)
+        ])
+        # Fechas repetidas de tres en tres: el id desempata
+        base = timezone.now()
+        for n, rutina in enumerate(cls.rutinas):
+            Entrenamiento.objects.filter(pk=rutina.pk).update(created_at=base - timedelta(days=n // 3))
+        detalles = DetalleEntrenamiento.objects.bulk_create([
+            DetalleEntrenamiento(entrenamiento=rutina, ejercicio=ejercicio, orden=1) for rutina in cls.rutinas
+        ])
+        # Las 10 primeras rutinas, completadas
+        SerieEjercicio.objects.bulk_create([
+            SerieEjercicio(
+                detalle_entrenamiento=detalle, numero_serie=1, repeticiones_o_rango='5',
+                repeticiones_reales=5 if n < 10 else None
+            )
+            for n, detalle in enumerate(detalles)
+        ])
+
+    def _recorrer(self, tamano=7, **filtros):
+        vistas, cursor = [], None
+        while True:
+            pagina, cursor = pagina_rutinas(self.atleta, cursor=cursor, tamano=tamano, **filtros)
+            vistas.extend(rutina.pk for rutina in pagina)
+            if cursor is None:
+                return vistas
+
+    def test_recorre_todas_sin_repetir(self):
+        esperado = list(
+            Entrenamiento.objects.filter(atleta=self.atleta).order_by('-created_at', '-pk').values_list('pk', flat=True)
+        )
+        self.assertEqual(self._recorrer(), esperado)
+
+    def test_filtros(self):
+        self.assertEqual(len(self._recorrer(estado='completada')), 10)
+        self.assertEqual(len(self._recorrer(estado='pendiente')), 20)
+        self.assertEqual(len(self._recorrer(mesociclo=self.mesociclo.pk)), 15)
+        self.assertEqual(
+            set(self._recorrer(semana=2, estado='completada')),
+            {rutina.pk for n, rutina in enumerate(self.rutinas) if n < 10 and n % 4 == 1}
+        )
+
+    def test_conteos_solo_de_la_pagina(self):
+        (pagina, _), consultas = self.capturar_consultas(pagina_rutinas, self.atleta, tamano=5, estado='pendiente')
+        self.assertEqual([(r.num_series, r.num_series_completadas) for r in pagina], [(1, 0)] * 5)
+        # Una consulta: el GROUP BY de los conteos va después de limitar los ids de la página
+        sql, = consultas
+        self.assertLess(sql.index('LIMIT 6'), sql.index('GROUP BY'))
+        self.assertNotIn('LIMIT', sql[sql.index('GROUP BY'):])
+
+    def test_api_pagina_profunda_cuesta_lo_mismo(self):
+        self.client.force_login(self.atleta.user)
+        url = reverse('mis_rutinas_api')
+
+        respuesta, primera = self.capturar_consultas(self.client.get, url, {'estado': 'pendiente'})
+        datos = respuesta.json()
+        self.assertEqual(len(datos['rutinas']), 20)
+        self.assertIsNone(datos['siguiente'])
+
+        _, cursor = pagina_rutinas(self.atleta, tamano=25)
+        respuesta, profunda = self.capturar_consultas(self.client.get, url, {'cursor': cursor})
+        datos = respuesta.json()
+        self.assertEqual(len(datos['rutinas']), 5)
+        self.assertEqual(len(primera), len(profunda))
+
+    def test_cursor_no_valido(self):
+        self.client.force_login(self.atleta.user)
+        self.assertEqual(self.client.get(reverse('mis_rutinas_api'), {'cursor': 'basura'}).status_code, 400)
+        # La página HTML vuelve a la primera página
+        respuesta = self.client.get(reverse('mis_rutinas'), {'cursor': 'basura'})
+        self.assertEqual(len(respuesta.context['rutinas']), 24)
+        self.assertIsNotNone(respuesta.context['siguiente_cursor'])
+
+
+class DashboardCacheTests(EntrenadorAtletaTestCase):
+    """
+    Los fragmentos del dashboard se cachean por versión del perfil: las visitas
+    repetidas no consultan mesociclos ni entrenamientos, y guardar uno de ellos
+    (también en bloque) invalida el dashboard de su entrenador y de su atleta.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.mesociclo = Mesociclo.objects.create(nombre='Bloque Fuerza', entrenador=cls.entrenador, atleta=cls.atleta)
+
+    def setUp(self):
+        cache.clear()
+
+    def _visita(self, perfil):
+        self.client.force_login(perfil.user)
+        respuesta, consultas = self.capturar_consultas(self.client.get, reverse('dashboard'))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, [sql for sql in consultas if 'FROM "core_mesociclo"' in sql or 'FROM "core_entrenamiento"' in sql]
+
+    def test_visita_repetida_sin_consultar_programas(self):
+        for perfil in (self.entrenador, self.atleta):
+            respuesta, consultas = self._visita(perfil)
+            self.assertContains(respuesta, 'Bloque Fuerza')
+            self.assertEqual(len(consultas), 2)
+
+            respuesta, consultas = self._visita(perfil)
+            self.assertContains(respuesta, 'Bloque Fuerza')
+            self.assertEqual(consultas, [])
+
+    def test_guardar_mesociclo_invalida_entrenador_y_atleta(self):
+        self._visita(self.entrenador)
+        self._visita(self.atleta)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mesociclo.nombre = 'Bloque Potencia'
+            self.mesociclo.save()
+
+        for perfil in (self.entrenador, self.atleta):
+            respuesta, consultas = self._visita(perfil)
+            self.assertContains(respuesta, 'Bloque Potencia')
+            self.assertTrue(consultas)
+
+    def test_bulk_create_invalida(self):
+        self._visita(self.entrenador)
+        with self.captureOnCommitCallbacks(execute=True):
+            Entrenamiento.objects.bulk_create([
+                Entrenamiento(entrenador=self.entrenador, atleta=self.atleta, nombre='Rutina suelta')
+            ])
+        respuesta, _ = self._visita(self.entrenador)
+        self.assertContains(respuesta, 'Rutina suelta')
+        # El borrado desde el fragmento cacheado recibe el token CSRF fuera de la caché
+        self.assertContains(respuesta, 'data-csrf')
+        self.assertContains(respuesta, 'csrfmiddlewaretoken')
+
+    def test_invalida_al_confirmar_la_transaccion(self):
+        self._visita(self.entrenador)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.mesociclo.save()
+        # Hasta el commit se sigue sirviendo el fragmento cacheado
+        self.assertEqual(self._visita(self.entrenador)[1], [])
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self._visita(self.entrenador)[1])
+
+
+class CacheCompartidaTests(SimpleTestCase):
+    """Las versiones de caché solo sirven entre procesos con una caché compartida."""
+
+    @override_settings(DEBUG=False, CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_avisa_con_cache_por_proceso(self):
+        self.assertEqual([aviso.id for aviso in comprobar_cache_compartida(None)], ['core.W001'])
+
+    @override_settings(DEBUG=False)
+    def test_cache_por_defecto(self):
+        self.assertEqual(comprobar_cache_compartida(None), [])
+
+
+class ResumenActividadAtletasTests(EntrenadorAtletaTestCase):
+    """
+    Lista de atletas del entrenador: actividad reciente y mesociclo en curso
+    anotados en la misma consulta, sin una consulta extra por atleta.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ejercicio = Ejercicio.objects.create(nombre='Sentadilla')
+        cls.mesociclo = Mesociclo.objects.create(
+            nombre='Bloque Fuerza', entrenador=cls.entrenador, atleta=cls.atleta,
+            fecha_inicio=timezone.localdate() - timedelta(days=10)
+        )
+
+    def _sesion(self, atleta, series=3):
+        entreno = Entrenamiento.objects.create(
+            entrenador=self.entrenador, atleta=atleta, mesociclo=self.mesociclo if atleta == self.atleta else None,
+            nombre='Sesión', semana=2, dia_orden=1
+        )
+        detalle = DetalleEntrenamiento.objects.create(entrenamiento=entreno, ejercicio=self.ejercicio, orden=1)
+        return entreno, SerieEjercicio.objects.bulk_create([
+            SerieEjercicio(detalle_entrenamiento=detalle, numero_serie=n, repeticiones_o_rango='5')
+            for n in range(1, series + 1)
+        ])
+
+    def test_registrado_en_solo_al_registrar(self):
+        entreno, series = self._sesion(self.atleta)
+        entreno.refresh_from_db()
+        self.assertIsNone(entreno.registrado_en)
+
+        # Cambiar la prescripción no es un registro del atleta
+        series[0].repeticiones_o_rango = '3'
+        series[0].save()
+        entreno.refresh_from_db()
+        self.assertIsNone(entreno.registrado_en)
+
+        registrar_series(entreno, [{'id': series[0].pk, 'peso_real': '100', 'repeticiones_reales': 5}])
+        entreno.refresh_from_db()
+        self.assertIsNotNone(entreno.registrado_en)
+
+    def test_metricas(self):
+        entreno, series = self._sesion(self.atleta)
+        registrar_series(entreno, [
+            {'id': series[0].pk, 'peso_real': '100', 'repeticiones_reales': 5},
+            {'id': series[1].pk, 'peso_real': '90', 'repeticiones_reales': 5},
+        ])
+        # Sesión de hace más de una semana: cuenta para la última sesión, no para las métricas
+        antiguo, series = self._sesion(self.atleta)
+        registrar_series(antiguo, [{'id': series[0].pk, 'peso_real': '200', 'repeticiones_reales': 1}])
+        Entrenamiento.objects.filter(pk=antiguo.pk).update(registrado_en=timezone.now() - timedelta(days=30))
+        # Que el entrenador edite después la prescripción no la vuelve a contar
+        editada = SerieEjercicio.objects.get(pk=series[0].pk)
+        editada.repeticiones_o_rango = '1-2'
+        editada.save()
+        inactivo = crear_perfil('inactivo', 'atleta', entrenador=self.entrenador)
+
+        resumen = {a.pk: a for a in resumen_actividad_atletas(PerfilUsuario.objects.filter(tipo='atleta'))}
+        atleta = resumen[self.atleta.pk]
+        self.assertEqual(atleta.ultima_sesion, Entrenamiento.objects.get(pk=entreno.pk).registrado_en)
+        self.assertEqual(atleta.sesiones_semana, 1)
+        self.assertEqual(atleta.tonelaje_7_dias, Decimal('950'))
+        self.assertEqual(atleta.mesociclo_actual, 'Bloque Fuerza')
+        self.assertEqual(semana_mesociclo(atleta.mesociclo_inicio), 2)
+
+        inactivo = resumen[inactivo.pk]
+        self.assertIsNone(inactivo.ultima_sesion)
+        self.assertEqual((inactivo.sesiones_semana, inactivo.tonelaje_7_dias), (0, Decimal('0')))
+        self.assertIsNone(inactivo.mesociclo_actual)
+
+    def _visita(self):
+        self.client.force_login(self.entrenador.user)
+        respuesta, consultas = self.capturar_consultas(self.client.get, reverse('lista_atletas'))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, len(consultas)
+
+    def test_consultas_constantes(self):
+        entreno, series = self._sesion(self.atleta)
+        registrar_series(entreno, [{'id': series[0].pk, 'peso_real': '100', 'repeticiones_reales': 5}])
+        respuesta, pocas = self._visita()
+        self.assertContains(respuesta, 'Bloque Fuerza · semana 2')
+        self.assertContains(respuesta, '500 kg en 7 días')
+
+        for n in range(5):
+            atleta = crear_perfil(f'atleta{n}', 'atleta', entrenador=self.entrenador)
+            entreno, series = self._sesion(atleta)
+            registrar_series(entreno, [{'id': series[0].pk, 'peso_real': '60', 'repeticiones_reales': 8}])
+        respuesta, muchas = self._visita()
+        self.assertEqual(pocas, muchas)
+        self.assertContains(respuesta, '480 kg en 7 días', count=5)
+
+
+class LoginIdentificadorTests(TestCase):
+    """
+    Login con username, email o nombre de perfil: el identificador se resuelve a
+    un único usuario y la contraseña se comprueba una sola vez (un hash).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username='ana@test.com', email='ana@test.com', password='secreta-123')
+        PerfilUsuario.objects.create(user=cls.usuario, tipo='atleta', nombre='Ana García', email='ana@test.com')
+        # Dos perfiles con el mismo nombre: el nombre no identifica a ninguno
+        for n in (1, 2):
+            usuario = User.objects.create_user(username=f'luis{n}@test.com', password='secreta-123')
+            PerfilUsuario.objects.create(user=usuario, tipo='atleta', nombre='Luis', email=f'luis{n}@test.com')
+
+    def _login(self, identificador, password):
+        encode = PBKDF2PasswordHasher.encode
+        with mock.patch.object(PBKDF2PasswordHasher, 'encode', autospec=True, side_effect=encode) as hashes:
+            form = EmailOrUsernameLoginForm(data={'username': identificador, 'password': password})
+            valido = form.is_valid()
+        return form, valido, hashes.call_count
+
+    def test_identificadores_validos(self):
+        for identificador in ('ana@test.com', 'ANA@test.com', 'ana garcía', 'ANA garcía'):
+            with self.subTest(identificador=identificador):
+                form, valido, hashes = self._login(identificador, 'secreta-123')
+                self.assertTrue(valido)
+                self.assertEqual(form.get_user(), self.usuario)
+                self.assertEqual(hashes, 1)
+
+    def test_un_solo_hash_al_fallar(self):
+        for identificador in ('Ana García', 'nadie', 'luis'):
+            with self.subTest(identificador=identificador):
+                _, valido, hashes = self._login(identificador, 'secreta-123' if identificador == 'luis' else 'otra')
+                self.assertFalse(valido)
+                self.assertEqual(hashes, 1)
+
+    def test_usuario_inactivo(self):
+        User.objects.filter(pk=self.usuario.pk).update(is_active=False)
+        _, valido, _ = self._login('Ana García', 'secreta-123')
+        self.assertFalse(valido)
+
+    def test_vista_login(self):
+        respuesta = self.client.post(reverse('login'), {'username': 'ana garcía', 'password': 'secreta-123'})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.usuario.pk)
+
+
+class ColaTareasTests(TestCase):
+    """
+    Cola de tareas en la base de datos: reclamo exclusivo, reintentos con espera
+    exponencial y fallo definitivo al agotar los intentos.
+    """
+
+    def setUp(self):
+        self.llamadas = []
+
+        @tarea('prueba')
+        def prueba(falla=False):
+            self.llamadas.append(falla)
+            if falla:
+                raise RuntimeError("fallo de prueba")
+            return {'ok': True}
+
+        self.addCleanup(MANEJADORES.pop, 'prueba')
+
+    def test_reclamo_exclusivo_y_completada(self):
+        pendiente = encolar('prueba')
+        reclamada = reclamar('trabajador-1')
+        self.assertEqual(reclamada.pk, pendiente.pk)
+        self.assertIsNone(reclamar('trabajador-2'))
+
+        self.assertTrue(ejecutar(reclamada))
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, Tarea.COMPLETADA)
+        self.assertEqual(pendiente.resultado, {'ok': True})
+        self.assertEqual(pendiente.intentos, 1)
+
+    def test_completada_sin_parametros_y_purga_de_terminadas(self):
+        hecha = encolar('prueba', {'falla': False})
+        self.assertTrue(ejecutar(reclamar('trabajador')))
+        hecha.refresh_from_db()
+        self.assertEqual(hecha.parametros, {})
+
+        antigua = encolar('prueba')
+        Tarea.objects.filter(pk=antigua.pk).update(
+            estado=Tarea.FALLIDA, terminada_en=timezone.now() - timedelta(days=30)
+        )
+        pendiente = encolar('prueba')
+        Tarea.objects.filter(pk=pendiente.pk).update(disponible_en=timezone.now() + timedelta(days=1))
+
+        # El trabajador purga al quedarse sin tareas: solo las terminadas hace tiempo
+        trabajar('trabajador', una_vez=True)
+        self.assertEqual(set(Tarea.objects.values_list('pk', flat=True)), {hecha.pk, pendiente.pk})
+
+    def test_correo_de_recuperacion_sin_cola(self):
+        usuario = User.objects.create_user('ana', email='ana@test.com', password='x')
+        PerfilUsuario.objects.create(user=usuario, nombre='Ana', email='ana@test.com', tipo='atleta')
+        respuesta = self.client.post(reverse('password_reset'), {'email': 'ana@test.com'})
+        self.assertEqual(respuesta.status_code, 302)
+        # Se envía en la petición y el enlace de un solo uso no se guarda en ninguna tarea
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(Tarea.objects.exists())
+
+        # Si el envío falla, el error queda en el log con su traza y se propaga
+        with mock.patch('core.forms.enviar_correo', side_effect=RuntimeError('brevo caído')), \
+                self.assertLogs('core.forms', 'ERROR') as logs, self.assertRaises(RuntimeError):
+            self.client.post(reverse('password_reset'), {'email': 'ana@test.com'})
+        self.assertIn('brevo caído', logs.output[0])
+
+    def test_reintentos_con_espera_y_fallo_definitivo(self):
+        pendiente = encolar('prueba', {'falla': True}, max_intentos=2)
+        self.assertFalse(ejecutar(reclamar('trabajador')))
+
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, Tarea.PENDIENTE)
+        self.assertGreater(pendiente.disponible_en, timezone.now())
+        # Hasta que pase la espera no vuelve a estar disponible
+        self.assertIsNone(reclamar('trabajador'))
+
+        Tarea.objects.filter(pk=pendiente.pk).update(disponible_en=timezone.now())
+        self.assertFalse(ejecutar(reclamar('trabajador')))
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, Tarea.FALLIDA)
+        self.assertIn("fallo de prueba", pendiente.error)
+        self.assertEqual(self.llamadas, [True, True])
+
+    def test_huerfanas_con_latido_e_intentos_agotados(self):
+        hace_rato = timezone.now() - timedelta(hours=1)
+        otras = []
+
+        @tarea('larga')
+        def larga():
+            # Lleva más de TIEMPO_MAXIMO en curso, pero informa de progreso: nadie más la toma
+            Tarea.objects.filter(estado=Tarea.EN_CURSO).update(bloqueada_en=hace_rato)
+            informar_progreso(1, 2)
+            otras.append(reclamar('trabajador-2'))
+            return {'ok': True}
+
+        self.addCleanup(MANEJADORES.pop, 'larga')
+        encolar('larga')
+        self.assertTrue(ejecutar(reclamar('trabajador-1')))
+        self.assertEqual(otras, [None])
+
+        # Sin latido se vuelve a reclamar mientras le queden intentos...
+        huerfana = encolar('prueba', max_intentos=2)
+        reclamar('trabajador-1')
+        Tarea.objects.filter(pk=huerfana.pk).update(bloqueada_en=hace_rato)
+        self.assertEqual(reclamar('trabajador-2').intentos, 2)
+
+        # ...y con los intentos agotados pasa a fallida en lugar de reintentarse siempre
+        Tarea.objects.filter(pk=huerfana.pk).update(bloqueada_en=hace_rato)
+        self.assertIsNone(reclamar('trabajador-3'))
+        huerfana.refresh_from_db()
+        self.assertEqual((huerfana.estado, huerfana.intentos), (Tarea.FALLIDA, 2))
+
+    def test_tarea_desconocida(self):
+        with self.assertRaises(ValueError):
+            encolar('no_existe')
+
+    def test_progreso_visible_y_reintento_desde_el_ultimo_lote(self):
+        procesados = []
+
+        @tarea('por_lotes')
+        def por_lotes(total, falla_en=None):
+            for hecho in range(progreso_anterior() + 1, total + 1):
+                if hecho == falla_en and not procesados.count(hecho):
+                    procesados.append(hecho)
+                    raise RuntimeError("fallo de prueba")
+                procesados.append(hecho)
+                informar_progreso(hecho, total)
+            return {'ok': True}
+
+        self.addCleanup(MANEJADORES.pop, 'por_lotes')
+        usuario = User.objects.create_user('coach', password='x')
+        pendiente = encolar('por_lotes', {'total': 5, 'falla_en': 4}, creado_por=usuario)
+
+        self.assertFalse(ejecutar(reclamar('trabajador')))
+        self.client.force_login(usuario)
+        estado = self.client.get(reverse('tarea_estado', kwargs={'pk': pendiente.pk})).json()
+        self.assertEqual((estado['estado'], estado['hechos'], estado['total']), (Tarea.PENDIENTE, 3, 5))
+
+        # El reintento sigue tras lo ya hecho
+        Tarea.objects.filter(pk=pendiente.pk).update(disponible_en=timezone.now())
+        self.assertTrue(ejecutar(reclamar('trabajador')))
+        self.assertEqual(procesados, [1, 2, 3, 4, 4, 5])
+        estado = self.client.get(reverse('tarea_estado', kwargs={'pk': pendiente.pk})).json()
+        self.assertEqual((estado['estado'], estado['hechos'], estado['total']), (Tarea.COMPLETADA, 5, 5))
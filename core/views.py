@@ -1,41 +1,73 @@
 # core/views.py
 
 import logging
+import re
+from collections import defaultdict
 from django import forms
-from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
 from django.db.models import Max
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import DeleteView, FormView
-from django.db.models import Subquery, OuterRef, DecimalField
+from django.db.models import Subquery, OuterRef, DecimalField, F
 from django.contrib.auth import login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db import transaction  
+from django.db import DatabaseError, transaction  
 from django.shortcuts import redirect, render, get_object_or_404
 from django.urls import reverse_lazy, reverse
 from django.forms import inlineformset_factory,modelformset_factory
 from decimal import Decimal
 from django.views.generic import CreateView, UpdateView, DetailView, ListView, TemplateView
 
-from .models import PerfilUsuario, Entrenamiento, Ejercicio, SerieEjercicio, DetalleEntrenamiento, Mesociclo
+from .models import (
+    PerfilUsuario, Entrenamiento, Ejercicio, SerieEjercicio, DetalleEntrenamiento, Mesociclo, PlantillaMesociclo, Tarea,
+    serie_completada,
+)
 from .forms import (
     RegistroUsuarioForm, EntrenamientoForm, EjercicioForm,
-    SerieRegistroFormSet,  DetalleEntrenamientoForm,DetalleEntrenamientoFormSet, SerieFormSet, SeriePrescripcionInlineFormSet, MesocicloForm
+    SerieRegistroFormSet,  DetalleEntrenamientoForm,DetalleEntrenamientoFormSet, SerieFormSet, SeriePrescripcionInlineFormSet, MesocicloForm,
+    AsignarProgramaForm
 )
 from django.http import JsonResponse, HttpResponseForbidden, HttpResponseBadRequest
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_protect
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db import transaction
 import json
+from datetime import date
+import numpy as np
 from .serializers import EjercicioSerializer
 from rest_framework import viewsets, permissions
-from .services import replicar_planificacion_semanal
+from .services import (
+    replicar_planificacion_semanal, resumen_marcas_atletas, volumen_semanal_mesociclo,
+    crear_plantilla_desde_mesociclo, registrar_series, sincronizar_series,
+    pagina_rutinas, ESTADOS_RUTINA, resumen_actividad_atletas, semana_mesociclo, series_semana_anterior,
+)
+from .tareas import encolar
+from .caching import cache_por_atleta, marcas_personales_en_cache, version_dashboard
+from .mixins import AtletaRequiredMixin, EntrenadorRequiredMixin, ObjetoPorPeticionMixin, entrenador_requerido
+from .analitica import (
+    FORMULAS_E1RM, HistorialSeries, calcular_progresion, calcular_progresion_semanal, fechas_de_sesiones,
+    filtrar_progresion, lttb,
+)
 from django.views.decorators.http import require_POST
 
 def root_redirect(request):
     return redirect('login')
+
+
+def service_worker_view(request):
+    """
+    Sirve el service worker desde la raíz del sitio: desde /static/ solo podría
+    controlar las URLs bajo /static/ (ver templates/sw.js).
+    """
+    respuesta = render(request, 'sw.js', content_type='application/javascript')
+    respuesta['Cache-Control'] = 'no-cache'
+    return respuesta
+
 # -------------------------------------------------
 # AUTENTICACIÓN DE USUARIOS
 # -------------------------------------------------
@@ -82,32 +114,31 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         usuario = self.request.user
 
-        # Obtenemos el perfil de forma segura
-        try:
-            perfil = getattr(usuario, 'perfil', None)
-        except PerfilUsuario.DoesNotExist:
-            perfil = None
+        # Perfil cargado junto con el usuario (PerfilMiddleware)
+        perfil = self.request.perfil
 
         context["usuario"] = usuario
         context["perfil"] = perfil
         context["tipo_usuario"] = perfil.tipo if perfil else None
 
         # Personaliza el contexto en función del tipo de perfil.
+        # Los querysets son perezosos: solo se consultan si el fragmento de la plantilla
+        # no está en caché (clave con la versión del dashboard del perfil).
         if perfil:
+            context["version_dashboard"] = version_dashboard(perfil.pk)
+
             if perfil.tipo == "entrenador":
                 # 1. Buscamos los MESOCICLOS (Programas)
                 context["mesociclos"] = Mesociclo.objects.filter(
                     entrenador=perfil, 
                     activo=True
-                ).order_by('-created_at')
+                ).select_related('atleta').order_by('-created_at')
 
                 # 2. Buscamos entrenamientos SUELTOS (los que NO tienen mesociclo)
                 context["entrenamientos_creados"] = Entrenamiento.objects.filter(
                     entrenador=perfil,
                     mesociclo__isnull=True # <--- Importante: Filtramos para no repetir
-                ).order_by('-created_at')[:5]
-
-                context["total_atletas"] = PerfilUsuario.objects.filter(entrenador=perfil).count()
+                ).select_related('atleta').order_by('-created_at')[:5]
 
             elif perfil.tipo == "atleta":
                 # 1. Mis Mesociclos asignados
@@ -129,7 +160,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 # GESTIÓN DE ENTRENAMIENTOS (CREACIÓN Y EDICIÓN)
 # -------------------------------------------------
 
-class EntrenamientoCreateView(LoginRequiredMixin, CreateView):
+class EntrenamientoCreateView(EntrenadorRequiredMixin, CreateView):
     model = Entrenamiento
     form_class = EntrenamientoForm
     template_name = "core/entrenamientos/crear.html"
@@ -171,7 +202,7 @@ class EntrenamientoCreateView(LoginRequiredMixin, CreateView):
         return context
 
     def form_valid(self, form):
-        form.instance.entrenador = self.request.user.perfil
+        form.instance.entrenador = self.request.perfil
         
         # --- LÓGICA DE VINCULACIÓN AL MESOCICLO ---
         mesociclo_id = self.request.GET.get('mesociclo')
@@ -247,35 +278,12 @@ class EntrenamientoUpdateView(LoginRequiredMixin, UpdateView):
 
         # 3. COACH HELPER: Obtener historial de la semana anterior
         # Solo si pertenece a un mesociclo y no es la primera semana
-        if entrenamiento.mesociclo and entrenamiento.semana > 1:
-            semana_anterior = entrenamiento.semana - 1
-            try:
-                # Buscamos el entrenamiento equivalente (mismo mesociclo, semana previa, mismo día)
-                entreno_previo = Entrenamiento.objects.get(
-                    mesociclo=entrenamiento.mesociclo,
-                    semana=semana_anterior,
-                    dia_orden=entrenamiento.dia_orden
-                )
-                
-                # Mapa para acceso rápido en el template: (ejercicio_id, numero_serie) -> Objeto Serie
-                mapa_historial = {}
-                
-                # Optimizamos la consulta con prefetch
-                detalles_previos = entreno_previo.detalles.prefetch_related('series').all()
-                
-                for det in detalles_previos:
-                    for ser in det.series.all():
-                        # Clave compuesta única
-                        clave = (det.ejercicio_id, ser.numero_serie)
-                        mapa_historial[clave] = ser
-                
-                context['mapa_historial'] = mapa_historial
-                context['entreno_previo'] = entreno_previo
-                
-            except Entrenamiento.DoesNotExist:
-                # Si no existe la semana anterior (ej: se saltó una semana), no mostramos nada
-                pass
-        
+        entreno_previo, mapa_historial = series_semana_anterior(entrenamiento)
+        if entreno_previo is not None:
+            # Mapa para acceso rápido en el template: (ejercicio_id, numero_serie) -> Objeto Serie
+            context['mapa_historial'] = mapa_historial
+            context['entreno_previo'] = entreno_previo
+
         return context
 
     def form_valid(self, form):
@@ -283,41 +291,54 @@ class EntrenamientoUpdateView(LoginRequiredMixin, UpdateView):
         detalle_formset = context["detalle_formset"]
 
         if detalle_formset.is_valid():
-            with transaction.atomic():
-                # 1. Guardar entrenamiento
-                self.object = form.save()
-                
-                
+            # Estado de las instancias del formset antes de guardar. Si se deshace la
+            # transacción, los objetos en memoria no se enteran: los detalles nuevos se
+            # quedan con el pk de un INSERT deshecho y los borrados con pk=None aunque su
+            # fila sigue ahí. Tras el rollback la base de datos vuelve a este estado, así
+            # que se les devuelve el suyo antes de re-renderizar (la plantilla usa instance.pk)
+            estado_previo = [
+                (f.instance, f.instance.pk, f.instance._state.adding) for f in detalle_formset.forms
+            ]
+            try:
+                with transaction.atomic():
+                    # 1. Guardar entrenamiento
+                    self.object = form.save()
 
-# 3. Guardar detalles (ejercicios)
-                detalle_formset.instance = self.object
-                detalle_map = {} 
-                
-                # Creamos un contador para asegurar que el orden sea secuencial (1, 2, 3...)
-                # ignorando los ejercicios que el usuario haya borrado.
-                orden_real = 1
-                
-                for i, form_in_formset in enumerate(detalle_formset.forms):
+                    # 3. Guardar detalles (ejercicios)
+                    detalle_formset.instance = self.object
+                    detalle_map = {} 
                     
-                    if form_in_formset in detalle_formset.deleted_forms:
-                        if form_in_formset.instance.pk:
-                            form_in_formset.instance.delete()
-                        continue
+                    # Creamos un contador para asegurar que el orden sea secuencial (1, 2, 3...)
+                    # ignorando los ejercicios que el usuario haya borrado.
+                    orden_real = 1
                     
-                    if not form_in_formset.is_valid():
-                        continue 
-                    
-                    detalle = form_in_formset.instance
-                    
-                    # ASIGNAMOS EL NUEVO ORDEN SIEMPRE A TODOS LOS EJERCICIOS
-                    detalle.orden = orden_real
-                    orden_real += 1
-                    
-                    detalle.save()
-                    detalle_map[str(i)] = detalle
+                    for i, form_in_formset in enumerate(detalle_formset.forms):
+                        
+                        if form_in_formset in detalle_formset.deleted_forms:
+                            if form_in_formset.instance.pk:
+                                form_in_formset.instance.delete()
+                            continue
                         
-                # 4. Procesar series (Incluyendo RPE)
-                self._procesar_series(self.request.POST, detalle_map)
+                        if not form_in_formset.is_valid():
+                            continue 
+                        
+                        detalle = form_in_formset.instance
+                        
+                        # ASIGNAMOS EL NUEVO ORDEN SIEMPRE A TODOS LOS EJERCICIOS
+                        detalle.orden = orden_real
+                        orden_real += 1
+                        
+                        detalle.save()
+                        detalle_map[str(i)] = detalle
+                            
+                    # 4. Procesar series (Incluyendo RPE); si hay valores no válidos se deshace todo
+                    self._procesar_series(self.request.POST, detalle_map)
+            except ValidationError as e:
+                for instancia, pk, adding in estado_previo:
+                    instancia.pk, instancia._state.adding = pk, adding
+                messages.error(self.request, "⚠️ Revisa las series: " + " ".join(e.messages))
+                context['detalle_formset'] = detalle_formset
+                return self.render_to_response(context)
 
             messages.success(self.request, "✅ Entrenamiento actualizado correctamente")
             return redirect(self.get_success_url())
@@ -328,94 +349,95 @@ class EntrenamientoUpdateView(LoginRequiredMixin, UpdateView):
             context['detalle_formset'] = detalle_formset
             return self.render_to_response(context)
 
+    # Sufijo del POST -> campo de SerieEjercicio que edita el entrenador
+    CAMPOS_SERIE_POST = {'repeticiones': 'repeticiones_o_rango', 'rpe': 'rpe_prescrito'}
+
+    # Formato de las series nuevas: new_serie_form_{form_index}_{counter}_{campo}
+    PATRON_SERIE_NUEVA = re.compile(r'^new_serie_form_(\d+)_(\d+)_(repeticiones|rpe|numero)$')
+
+    @staticmethod
+    def _valor_serie(campo, valor):
+        """Convierte y valida un valor del POST con las reglas del propio campo del modelo."""
+        campo = SerieEjercicio._meta.get_field(campo)
+        valor = valor.strip()
+        if valor == '':
+            return None if campo.null else ''
+        return campo.clean(valor, None)
+
     def _procesar_series(self, post_data, detalle_map):
         """
-        Procesa la creación, edición y borrado de series.
-        Actualizado para incluir el campo 'rpe_prescrito'.
+        Procesa la creación, edición y borrado de series (incluido 'rpe_prescrito').
+
+        Compara lo enviado con las series cargadas y solo escribe las diferencias:
+        un bulk_update para las modificadas, un delete() para las borradas y un
+        bulk_create para las nuevas, tenga la sesión las series que tenga.
+        Si algún valor no es válido lanza ValidationError sin escribir nada.
         """
-        
-        # A. Actualizar o eliminar series existentes
+        errores = []
+
+        # A. Diferencias con las series existentes
         series_existentes = SerieEjercicio.objects.filter(
             detalle_entrenamiento__entrenamiento=self.object
         )
 
+        ids_borrar = []
+        modificadas = []
         for serie in series_existentes:
-            serie_id = serie.id
-            delete_key = f"serie_{serie_id}_delete"
-            reps_key = f"serie_{serie_id}_repeticiones"
-            rpe_key = f"serie_{serie_id}_rpe" # <--- NUEVO
-
             # Borrado
-            if post_data.get(delete_key) == "1":
-                serie.delete()
+            if post_data.get(f"serie_{serie.id}_delete") == "1":
+                ids_borrar.append(serie.id)
                 continue
 
-            # Actualización de valores
+            # Actualización: solo si el valor enviado es distinto del guardado
             cambios = False
-            if reps_key in post_data:
-                serie.repeticiones_o_rango = post_data[reps_key]
-                cambios = True
-            
-            if rpe_key in post_data: # <--- NUEVO
-                # Convertimos a float o None si viene vacío
-                rpe_val = post_data[rpe_key]
-                serie.rpe_prescrito = rpe_val if rpe_val else None
-                cambios = True
-            
-            if cambios:
-                serie.save()
+            for sufijo, campo in self.CAMPOS_SERIE_POST.items():
+                clave = f"serie_{serie.id}_{sufijo}"
+                if clave not in post_data:
+                    continue
+                try:
+                    valor = self._valor_serie(campo, post_data[clave])
+                except ValidationError as e:
+                    errores.append(f"Serie {serie.numero_serie} ({sufijo}): {' '.join(e.messages)}")
+                    continue
+                if valor != getattr(serie, campo):
+                    setattr(serie, campo, valor)
+                    cambios = True
 
-        # B. Crear nuevas series usando el 'detalle_map'
-        new_series_data = {} 
+            if cambios:
+                modificadas.append(serie)
 
-        # Parsear los datos del POST para agruparlos por serie nueva
+        # B. Series nuevas, agrupadas por (form_index, counter)
+        new_series_data = {}
         for key, value in post_data.items():
-            if not key.startswith("new_serie_form_"):
-                continue
-            
-            try:
-                # Formato esperado: new_serie_form_{form_index}_{counter}_{campo}
-                parts = key.split("_")
-                form_index = parts[3] 
-                counter = parts[4]    
-                data_type = parts[5]  
-
-                serie_key = (form_index, counter)
-                
-                if serie_key not in new_series_data:
-                    new_series_data[serie_key] = {}
-                
-                new_series_data[serie_key][data_type] = value
-                
-            except (IndexError, ValueError):
-                continue
-        
-        # Crear los objetos SerieEjercicio
+            coincidencia = self.PATRON_SERIE_NUEVA.match(key)
+            if coincidencia:
+                form_index, counter, data_type = coincidencia.groups()
+                new_series_data.setdefault((form_index, counter), {})[data_type] = value
+
         series_para_crear = []
         for (form_index, counter), data in new_series_data.items():
-            
             detalle = detalle_map.get(form_index)
-            
             if not detalle:
-                continue 
-                
-            reps = data.get("repeticiones", "")
-            rpe = data.get("rpe", None) # <--- NUEVO
-            numero = data.get("numero", 1)
-            
-            # Limpieza básica del RPE si viene vacío
-            if rpe == "": 
-                rpe = None
+                continue
 
-            series_para_crear.append(
-                SerieEjercicio(
+            try:
+                series_para_crear.append(SerieEjercicio(
                     detalle_entrenamiento=detalle,
-                    repeticiones_o_rango=reps,
-                    rpe_prescrito=rpe, # <--- NUEVO
-                    numero_serie=int(numero)
-                )
-            )
-
+                    repeticiones_o_rango=self._valor_serie('repeticiones_o_rango', data.get("repeticiones", "")),
+                    rpe_prescrito=self._valor_serie('rpe_prescrito', data.get("rpe", "")),
+                    numero_serie=self._valor_serie('numero_serie', data.get("numero", "")) or 1,
+                ))
+            except ValidationError as e:
+                errores.append(f"Nueva serie de {detalle.ejercicio}: {' '.join(e.messages)}")
+
+        if errores:
+            raise ValidationError(errores)
+
+        # C. Escritura: como mucho tres consultas de series
+        if ids_borrar:
+            SerieEjercicio.objects.filter(pk__in=ids_borrar).delete()
+        if modificadas:
+            SerieEjercicio.objects.bulk_update(modificadas, list(self.CAMPOS_SERIE_POST.values()))
         if series_para_crear:
             SerieEjercicio.objects.bulk_create(series_para_crear)
 
@@ -470,16 +492,13 @@ class EntrenamientoDetailView(LoginRequiredMixin, DetailView):
 # CONFIGURACIÓN DE SERIES (PRESCRIPCIÓN)
 # -------------------------------------------------
 
-class ConfigurarSeriesView(LoginRequiredMixin, UserPassesTestMixin, FormView):
+class ConfigurarSeriesView(EntrenadorRequiredMixin, UserPassesTestMixin, FormView):
     form_class = forms.Form 
     template_name = "core/includes/serie_ejercicio_form.html" 
 
     def test_func(self):
         """Asegura que solo el entrenador dueño pueda configurar series."""
-        try:
-            return self.request.user.perfil == self.entrenamiento.entrenador
-        except AttributeError:
-            return False
+        return self.entrenamiento.entrenador_id == self.request.perfil.pk
 
     def setup(self, request, *args, **kwargs):
         super().setup(request, *args, **kwargs)
@@ -494,92 +513,106 @@ class ConfigurarSeriesView(LoginRequiredMixin, UserPassesTestMixin, FormView):
             return reverse('mesociclo_detalle', kwargs={'pk': self.entrenamiento.mesociclo.pk})
         return reverse('dashboard')
 
+    def get_formsets(self, data=None):
+        """
+        Un formset por ejercicio (mismos prefijos 'series-<detalle>' que usa la plantilla),
+        montados con dos consultas en total: los detalles y todas las series de la sesión.
+        """
+        detalles = list(self.entrenamiento.detalles.select_related('ejercicio').order_by('orden'))
+        series_por_detalle = defaultdict(list)
+        for serie in SerieEjercicio.objects.filter(
+            detalle_entrenamiento__entrenamiento=self.entrenamiento
+        ).order_by('numero_serie', 'pk'):
+            series_por_detalle[serie.detalle_entrenamiento_id].append(serie)
+
+        # Valores cargados, para saber al guardar qué series han cambiado de verdad
+        self.valores_originales = {
+            serie.pk: (serie.numero_serie, serie.repeticiones_o_rango, serie.rpe_prescrito)
+            for series in series_por_detalle.values() for serie in series
+        }
+
+        return [
+            (detalle, SeriePrescripcionInlineFormSet(
+                data,
+                instance=detalle,
+                prefix=f'series-{detalle.pk}',
+                series=series_por_detalle[detalle.pk]
+            ))
+            for detalle in detalles
+        ]
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        detalles = self.entrenamiento.detalles.all().select_related('ejercicio')
-        
-        detalles_with_formsets = []
-        for detalle in detalles:
-            prefix = f'series-{detalle.pk}' 
-            if self.request.POST:
-                serie_formset = SeriePrescripcionInlineFormSet(
-                    self.request.POST, 
-                    instance=detalle, 
-                    prefix=prefix
-                )
-            else:
-                serie_formset = SeriePrescripcionInlineFormSet(
-                    instance=detalle, 
-                    prefix=prefix
-                )
-            detalles_with_formsets.append((detalle, serie_formset))
-            
         context['entrenamiento'] = self.entrenamiento
-        context['detalles_with_formsets'] = detalles_with_formsets
+        context['detalles_with_formsets'] = kwargs.get('detalles_with_formsets') or self.get_formsets()
         return context
 
     def post(self, request, *args, **kwargs):
-        detalles = self.entrenamiento.detalles.all()
-        formsets = []
-        is_valid = True
+        detalles_with_formsets = self.get_formsets(request.POST)
 
-        print("--- INICIANDO VALIDACIÓN DE FORMSETS ---")
+        # 1. Se valida toda la sesión como una unidad (sin cortar en el primer error)
+        is_valid = all([formset.is_valid() for _, formset in detalles_with_formsets])
+        if not is_valid:
+            messages.error(request, "⚠️ Hay errores en el formulario.")
+            return self.render_to_response(self.get_context_data(detalles_with_formsets=detalles_with_formsets))
 
-        # 0. Hacemos una copia mutable del POST para inyectar datos si faltan
-        post_data = request.POST.copy()
-        
-        # Inyectamos 'numero_serie' temporalmente para que pase la validación de Django
-        for key in list(post_data.keys()):
-            if key.endswith('-repeticiones_o_rango'): # Buscamos una fila de serie que exista
-                base_prefix = key.replace('-repeticiones_o_rango', '')
-                num_key = f"{base_prefix}-numero_serie"
-                
-                # Si no viene el número de serie, o viene vacío, le ponemos un valor temporal (1)
-                if not post_data.get(num_key):
-                    post_data[num_key] = 1
-
-        # 1. Reconstruir y validar todos los formsets usando nuestra copia (post_data)
-        for detalle in detalles:
-            prefix = f'series-{detalle.pk}'
-            serie_formset = SeriePrescripcionInlineFormSet(
-                post_data, # <--- USAMOS LA COPIA MODIFICADA AQUÍ
-                instance=detalle, 
-                prefix=prefix
-            )
-            
-            formsets.append(serie_formset)
-            
-            if not serie_formset.is_valid():
-                is_valid = False
-                print(f"❌ Formset Inválido para Detalle {detalle.pk} ({prefix})")
-                print(f"Errores: {serie_formset.errors}")
+        # 2. Si todo es válido, guardamos en bloque
+        try:
+            self._guardar_series(detalles_with_formsets)
+        except DatabaseError as e:
+            logger.exception("Error al guardar las series del entrenamiento %s", self.entrenamiento.pk)
+            messages.error(request, f"Error al guardar en la base de datos: {e}")
+            return self.render_to_response(self.get_context_data())
 
-        # 2. Si todo es válido, guardamos
-        if is_valid:
-            try:
-                with transaction.atomic():
-                    for formset in formsets:
-                        instances = formset.save(commit=False)
-                        
-                        # Aquí sobrescribimos el número temporal por el ORDEN REAL (1, 2, 3...)
-                        for i, instance in enumerate(instances):
-                            instance.numero_serie = i + 1
-                            instance.save()
-                            
-                        # Procesar la papelera
-                        for obj in formset.deleted_objects:
-                            obj.delete()
+        messages.success(request, "✅ Series configuradas correctamente.")
+        return redirect(self.get_success_url())
+
+    def _guardar_series(self, detalles_with_formsets):
+        """
+        Persiste la prescripción de toda la sesión con tres consultas como mucho:
+        un delete() para las series borradas, un bulk_update para las modificadas
+        (incluida la renumeración 1, 2, 3... de cada ejercicio) y un bulk_create
+        para las nuevas.
+        """
+        borrar, actualizar, crear = [], [], []
+
+        for detalle, formset in detalles_with_formsets:
+            numero = 1
+            for form in formset.forms:
+                serie = form.instance
+
+                # Procesar la papelera
+                if form.cleaned_data.get('DELETE'):
+                    if serie.pk:
+                        borrar.append(serie.pk)
+                    continue
+
+                # Filas añadidas y dejadas en blanco
+                if serie.pk is None and not form.has_changed():
+                    continue
+
+                # Sobrescribimos el número enviado por el ORDEN REAL en pantalla
+                serie.numero_serie = numero
+                numero += 1
+
+                if serie.pk is None:
+                    crear.append(serie)
+                elif self.valores_originales[serie.pk] != (
+                    serie.numero_serie, serie.repeticiones_o_rango, serie.rpe_prescrito
+                ):
+                    actualizar.append(serie)
+
+        with transaction.atomic():
+            if borrar:
+                SerieEjercicio.objects.filter(pk__in=borrar).delete()
+            if actualizar:
+                SerieEjercicio.objects.bulk_update(
+                    actualizar, ['numero_serie', 'repeticiones_o_rango', 'rpe_prescrito']
+                )
+            if crear:
+                SerieEjercicio.objects.bulk_create(crear)
 
-                messages.success(request, "✅ Series configuradas correctamente.")
-                return redirect(self.get_success_url())
 
-            except Exception as e:
-                print(f"❌ ERROR EN BASE DE DATOS: {e}")
-                messages.error(request, f"Error al guardar en la base de datos: {e}")
-                return self.render_to_response(self.get_context_data())
-        else:
-            messages.error(request, "⚠️ Hay errores en el formulario.")
-            return self.render_to_response(self.get_context_data())
 # -------------------------------------------------
 # GESTIÓN DE EJERCICIOS
 # -------------------------------------------------
@@ -605,37 +638,106 @@ class EjercicioReactListView(LoginRequiredMixin, TemplateView):
 # VISTAS DESTINADAS AL ATLETA
 # -------------------------------------------------
 
-class MisRutinasListView(LoginRequiredMixin, ListView):
+def filtros_rutinas(params):
+    """Filtros del listado de rutinas a partir de la query string (se ignoran los no válidos)."""
+    filtros = {}
+    for campo in ('mesociclo', 'semana'):
+        valor = params.get(campo, '')
+        if valor.isdigit():
+            filtros[campo] = int(valor)
+    if params.get('estado') in ESTADOS_RUTINA:
+        filtros['estado'] = params['estado']
+    return filtros
+
+
+class MisRutinasListView(AtletaRequiredMixin, ListView):
     """
-    Vista que muestra al atleta todas las rutinas asignadas por su entrenador.
+    Vista que muestra al atleta las rutinas asignadas por su entrenador, de la más
+    reciente a la más antigua, por páginas (cursor en ?cursor=) y con filtros por
+    mesociclo, semana y estado.
     """
     model = Entrenamiento
     template_name = "core/atleta/mis_rutinas.html"
     context_object_name = "rutinas"
 
     def get_queryset(self):
-        return Entrenamiento.objects.filter(atleta=self.request.user.perfil)
+        self.filtros = filtros_rutinas(self.request.GET)
+        try:
+            # Conteos y entrenador en la misma consulta (sin un COUNT por tarjeta)
+            rutinas, self.siguiente_cursor = pagina_rutinas(
+                self.request.perfil, cursor=self.request.GET.get('cursor'), **self.filtros
+            )
+        except ValueError:
+            # Cursor manipulado o caducado: se vuelve a la primera página
+            rutinas, self.siguiente_cursor = pagina_rutinas(self.request.perfil, **self.filtros)
+        return rutinas
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['siguiente_cursor'] = self.siguiente_cursor
+        context['filtros'] = self.filtros
+        context['estados'] = ESTADOS_RUTINA
+        context['mesociclos'] = self.request.perfil.mesociclos.order_by('-fecha_inicio')
+        return context
+
+
+class MisRutinasAPIView(AtletaRequiredMixin, View):
+    """
+    Rutinas del atleta en JSON para el scroll infinito: mismos filtros y cursor que
+    MisRutinasListView. GET ?cursor=&mesociclo=&semana=&estado=
+    Responde {"rutinas": [...], "siguiente": <cursor o null>}.
+    """
+    mensaje_acceso_denegado = "Solo los atletas tienen rutinas asignadas."
+
+    def get(self, request, *args, **kwargs):
+        try:
+            rutinas, siguiente = pagina_rutinas(
+                request.perfil, cursor=request.GET.get('cursor'), **filtros_rutinas(request.GET)
+            )
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        return JsonResponse({
+            'rutinas': [
+                {
+                    'id': rutina.pk,
+                    'nombre': rutina.nombre,
+                    'mesociclo': rutina.mesociclo_id,
+                    'semana': rutina.semana,
+                    'dia_orden': rutina.dia_orden,
+                    'entrenador': rutina.entrenador.nombre,
+                    'asignada': rutina.created_at.isoformat(),
+                    'num_ejercicios': rutina.num_ejercicios,
+                    'num_series': rutina.num_series,
+                    'num_series_completadas': rutina.num_series_completadas,
+                    'url': reverse('detalle_rutina', kwargs={'pk': rutina.pk}),
+                }
+                for rutina in rutinas
+            ],
+            'siguiente': siguiente,
+        })
 
 
 logger = logging.getLogger(__name__)
 
 
-class RutinaEditarRegistroView(LoginRequiredMixin, UpdateView):
+class RutinaEditarRegistroView(LoginRequiredMixin, ObjetoPorPeticionMixin, UpdateView):
     """
     Vista exclusiva para ATLETAS: 
     Permite registrar el peso real y las repeticiones realizadas 
     en las Series de un Entrenamiento.
     """
     model = Entrenamiento
+    relaciones_objeto = ('atleta', 'entrenador', 'mesociclo')
     template_name = "core/atleta/detalle_rutina.html"
     fields = []
     
    
     def dispatch(self, request, *args, **kwargs):
         entrenamiento = self.get_object()
-        perfil = request.user.perfil
+        perfil = request.perfil
         
-        if perfil.tipo != 'atleta' or entrenamiento.atleta != perfil:
+        if perfil is None or perfil.tipo != 'atleta' or entrenamiento.atleta != perfil:
             messages.error(request, "Acceso denegado. Solo el atleta asignado puede registrar este entrenamiento.")
             return redirect('dashboard')
             
@@ -649,7 +751,7 @@ class RutinaEditarRegistroView(LoginRequiredMixin, UpdateView):
         # Ordenamos por el 'orden' del detalle, y luego por 'numero_serie'
         queryset_series = SerieEjercicio.objects.filter(
             detalle_entrenamiento__entrenamiento=entrenamiento
-        ).order_by('detalle_entrenamiento__orden', 'numero_serie')
+        ).select_related('detalle_entrenamiento').order_by('detalle_entrenamiento__orden', 'numero_serie')
 
         if self.request.method == 'POST':
             return SerieRegistroFormSet(
@@ -673,6 +775,15 @@ class RutinaEditarRegistroView(LoginRequiredMixin, UpdateView):
         #Añadimos .order_by('orden') para respetar el nuevo campo
         context['detalles'] = entrenamiento.detalles.order_by('orden').prefetch_related('series') 
         context['series_formset'] = self.get_formset()
+
+        # Lo logrado la semana anterior, como placeholder de las series aún sin registrar
+        _, referencias = series_semana_anterior(entrenamiento)
+        if referencias:
+            for form in context['series_formset'].forms:
+                serie = form.instance
+                if serie.pk is None:
+                    continue
+                form.mostrar_referencia(referencias.get((serie.detalle_entrenamiento.ejercicio_id, serie.numero_serie)))
         
         return context
 
@@ -697,42 +808,290 @@ class RutinaEditarRegistroView(LoginRequiredMixin, UpdateView):
         """Define a dónde redirigir tras un POST exitoso."""
         return reverse_lazy('detalle_rutina', kwargs={'pk': self.object.pk})
 
-# -------------------------------------------------
-# CONSULTAS Y VISUALIZACIÓN DE PROGRESOS
-# -------------------------------------------------
 
-class MarcasPersonalesListView(LoginRequiredMixin, TemplateView):
+def _es_id(valor):
+    """True si 'valor' (de un JSON) es un id entero; true/false no cuentan como 1/0."""
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+class RegistroSeriesAPIView(AtletaRequiredMixin, View):
     """
-    Vista que muestra las marcas personales registradas por el atleta.
+    Autoguardado del registro del atleta, serie a serie (JSON).
+
+    PATCH/POST {"series": [{"id": <serie>, "peso_real": ..., "repeticiones_reales": ...,
+    "rpe_real": ...}, ...], "clave": "<idempotencia>"}
+    La clave también puede ir en la cabecera 'Idempotency-Key'. Solo se escriben
+    los campos enviados de las series que cambian; responde con los valores guardados.
+    """
+    MAX_SERIES = 200
+    mensaje_acceso_denegado = "Solo el atleta asignado puede registrar este entrenamiento."
+
+    def patch(self, request, pk, *args, **kwargs):
+        entrenamiento = get_object_or_404(Entrenamiento.objects.only('pk', 'atleta_id'), pk=pk)
+        if entrenamiento.atleta_id != request.perfil.pk:
+            return HttpResponseForbidden(self.mensaje_acceso_denegado)
+
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return HttpResponseBadRequest("Formato JSON inválido.")
+
+        cambios = data.get('series') if isinstance(data, dict) else None
+        if (
+            not isinstance(cambios, list) or not 0 < len(cambios) <= self.MAX_SERIES
+            or not all(isinstance(c, dict) and _es_id(c.get('id')) for c in cambios)
+        ):
+            return HttpResponseBadRequest("Datos inválidos.")
+
+        clave = request.headers.get('Idempotency-Key') or data.get('clave')
+        if clave is not None and (not isinstance(clave, str) or len(clave) > 64):
+            return HttpResponseBadRequest("Clave de idempotencia no válida.")
+
+        try:
+            respuesta, repetida = registrar_series(entrenamiento, cambios, clave)
+        except ValidationError as e:
+            return JsonResponse({'errores': e.message_dict}, status=400)
+
+        return JsonResponse({**respuesta, 'repetida': repetida})
+
+    post = patch
+
+
+@method_decorator(csrf_protect, name='dispatch')
+class SincronizarSeriesAPIView(AtletaRequiredMixin, View):
+    """
+    Sincronización en bloque de la cola offline del atleta (ver frontend/registroOffline.js).
+
+    POST {"operaciones": [{"clave": "<idempotencia>", "id": <serie>,
+    "version": "<updated_at de la serie, ISO 8601>", "registrado_en": "<ISO 8601 con zona>",
+    "peso_real": ..., "repeticiones_reales": ..., "rpe_real": ...}, ...]}
+    Responde con un resultado por operación (aplicada, conflicto, repetida o error).
     """
-    template_name = "core/atleta/marcas_personales.html"
+    MAX_OPERACIONES = 1000
+    mensaje_acceso_denegado = "Solo los atletas pueden sincronizar su registro."
 
+    def post(self, request, *args, **kwargs):
 
-class ProgresionEjercicioDetailView(LoginRequiredMixin, DetailView):
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return HttpResponseBadRequest("Formato JSON inválido.")
+
+        operaciones = data.get('operaciones') if isinstance(data, dict) else None
+        if not isinstance(operaciones, list) or not 0 < len(operaciones) <= self.MAX_OPERACIONES:
+            return HttpResponseBadRequest("Datos inválidos.")
+
+        for op in operaciones:
+            if not isinstance(op, dict):
+                return HttpResponseBadRequest("Datos inválidos.")
+            fechas = {campo: self._fecha_con_zona(op.get(campo)) for campo in ('version', 'registrado_en')}
+            if (
+                not _es_id(op.get('id'))
+                or not isinstance(op.get('clave'), str) or not 0 < len(op['clave']) <= 64
+                or None in fechas.values()
+            ):
+                return HttpResponseBadRequest("Operación inválida.")
+            op.update(fechas)
+
+        return JsonResponse({'resultados': sincronizar_series(request.perfil, operaciones)})
+
+    @staticmethod
+    def _fecha_con_zona(valor):
+        """Fecha ISO 8601 con zona horaria, o None si no lo es."""
+        try:
+            fecha = parse_datetime(valor)
+        except (TypeError, ValueError):
+            return None
+        return fecha if fecha is not None and timezone.is_aware(fecha) else None
+
+
+# -------------------------------------------------
+# CONSULTAS Y VISUALIZACIÓN DE PROGRESOS
+# -------------------------------------------------
+
+class ProgresionEjercicioDetailView(AtletaRequiredMixin, DetailView):
     """
     Vista detallada de la progresión de un ejercicio específico a lo largo del tiempo.
     """
     model = Ejercicio
     template_name = "core/atleta/progresion_ejercicio.html"
 
+    NOMBRES_FORMULAS = {'epley': 'Epley', 'brzycki': 'Brzycki', 'rpe': 'Tabla RPE'}
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        perfil = self.request.perfil
+        ejercicio = self.object
+        formula = self.request.GET.get('formula', 'epley')
+        if formula not in FORMULAS_E1RM:
+            formula = 'epley'
+
+        # Mejor e1RM por semana calculado con el motor vectorizado (cacheado por versión de datos)
+        context['formula'] = formula
+        context['formulas'] = self.NOMBRES_FORMULAS.items()
+        context['e1rm_semanal'] = cache_por_atleta(
+            perfil.pk,
+            f'e1rm_semanal:{ejercicio.pk}:{formula}',
+            lambda: HistorialSeries.cargar(perfil, ejercicio).mejor_e1rm_por_semana(formula)
+        )
+        return context
+
+
+def _atleta_solicitado(request):
+    """
+    Atleta cuyos datos se consultan: el propio usuario si es atleta, o el indicado
+    en '?atleta=<id>' si es su entrenador. Devuelve None si no tiene permiso.
+    """
+    perfil = request.perfil
+    if perfil is None:
+        return None
+    if perfil.tipo == 'atleta':
+        return perfil
+
+    try:
+        atleta_id = int(request.GET.get('atleta', ''))
+    except ValueError:
+        return None
+    return PerfilUsuario.objects.filter(pk=atleta_id, tipo='atleta', entrenador=perfil).first()
+
+
+class ProgresionDatosView(LoginRequiredMixin, View):
+    """
+    Endpoint JSON con la progresión de un atleta en un ejercicio: por cada sesión
+    (o semana), el peso de la mejor serie, el e1RM y el tonelaje.
+
+    Parámetros GET:
+        atleta: id del atleta (solo para entrenadores).
+        desde / hasta: rango de fechas 'AAAA-MM-DD' (inclusive).
+        puntos: número máximo de puntos (reducción con LTTB sobre el e1RM).
+        resolucion: 'sesion', 'semana' o 'auto' (semanal si hay más sesiones que puntos).
+        formula: fórmula de e1RM ('epley', 'brzycki' o 'rpe').
+    """
+    PUNTOS_POR_DEFECTO = 200
+    PUNTOS_MAXIMOS = 2000
+
+    def get(self, request, pk, *args, **kwargs):
+        ejercicio = get_object_or_404(Ejercicio, pk=pk)
+        atleta = _atleta_solicitado(request)
+        if atleta is None:
+            return HttpResponseForbidden("No tienes permiso para ver la progresión de este atleta.")
+
+        try:
+            desde = date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else None
+            hasta = date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else None
+            puntos = int(request.GET.get('puntos', self.PUNTOS_POR_DEFECTO))
+        except ValueError:
+            return HttpResponseBadRequest("Parámetros 'desde', 'hasta' o 'puntos' inválidos.")
+
+        puntos = max(2, min(puntos, self.PUNTOS_MAXIMOS))
+        resolucion = request.GET.get('resolucion', 'auto')
+        formula = request.GET.get('formula', 'epley')
+        if resolucion not in ('sesion', 'semana', 'auto') or formula not in FORMULAS_E1RM:
+            return HttpResponseBadRequest("Parámetros 'resolucion' o 'formula' inválidos.")
+
+        if resolucion == 'auto':
+            # Semanal si en el rango hay más sesiones que puntos pedidos
+            sesiones = cache_por_atleta(
+                atleta.pk, f'sesiones:{ejercicio.pk}', lambda: fechas_de_sesiones(atleta, ejercicio)
+            )
+            resolucion = 'semana' if len(filtrar_progresion(sesiones, desde, hasta)['fecha']) > puntos else 'sesion'
+
+        # Progresión precalculada en la caché versionada del atleta. La semanal sale del
+        # resumen de VolumenSemanal: un historial de años no obliga a leer todas las series.
+        if resolucion == 'semana':
+            progresion = cache_por_atleta(
+                atleta.pk,
+                f'progresion:semana:{ejercicio.pk}:{formula}',
+                lambda: calcular_progresion_semanal(atleta, ejercicio, formula)
+            )
+        else:
+            progresion = cache_por_atleta(
+                atleta.pk,
+                f'progresion:sesion:{ejercicio.pk}:{formula}',
+                lambda: calcular_progresion(atleta, ejercicio, formula)
+            )
+
+        datos = filtrar_progresion(progresion, desde, hasta)
+        # NaN o infinito no son JSON válido: esos puntos no se envían
+        datos = {clave: valores[np.isfinite(datos['e1rm'])] for clave, valores in datos.items()}
+
+        total = len(datos['fecha'])
+        indices = lttb(datos['fecha'].astype(np.int64), datos['e1rm'], puntos)
+
+        return JsonResponse({
+            'atleta': atleta.pk,
+            'ejercicio': {'id': ejercicio.pk, 'nombre': ejercicio.nombre},
+            'resolucion': resolucion,
+            'formula': formula,
+            'total': total,
+            # Formato columnar: una lista por métrica, alineadas con 'fechas'
+            'fechas': [str(f) for f in datos['fecha'][indices].astype('datetime64[D]')],
+            'top': np.round(datos['top'][indices], 2).tolist(),
+            'reps': datos['reps'][indices].astype(np.int64).tolist(),
+            'e1rm': np.round(datos['e1rm'][indices], 1).tolist(),
+            'tonelaje': np.round(datos['tonelaje'][indices], 1).tolist(),
+        })
+
 
 class AtletaProgresionMaxView(LoginRequiredMixin, DetailView):
     """
-    Vista que muestra la evolución del levantamiento máximo del atleta en un ejercicio concreto.
+    Vista que muestra las series más pesadas del atleta en un ejercicio concreto.
+    El atleta ve las suyas; el entrenador, las del atleta indicado en '?atleta=<id>'.
+
+    Parámetros GET opcionales:
+        n: número de series a mostrar (por defecto 5, máximo 50).
+        reps_min / reps_max: rango de repeticiones realizadas (inclusive).
     """
     model = Ejercicio
     template_name = "core/atleta/progresion_max.html"
+    pk_url_kwarg = "ejercicio_pk"
+
+    SERIES_POR_DEFECTO = 5
+    SERIES_MAXIMAS = 50
+
+    def get(self, request, *args, **kwargs):
+        self.atleta = _atleta_solicitado(request)
+        if self.atleta is None:
+            return HttpResponseForbidden("No tienes permiso para ver la progresión de este atleta.")
+
+        try:
+            self.n = int(request.GET.get('n', self.SERIES_POR_DEFECTO))
+            self.reps_min = int(request.GET['reps_min']) if request.GET.get('reps_min') else None
+            self.reps_max = int(request.GET['reps_max']) if request.GET.get('reps_max') else None
+        except ValueError:
+            return HttpResponseBadRequest("Parámetros 'n', 'reps_min' o 'reps_max' inválidos.")
+        self.n = max(1, min(self.n, self.SERIES_MAXIMAS))
+
+        return super().get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        ejercicio = self.get_object()
-        context["series"] = SerieEjercicio.objects.filter(
-            detalle_entrenamiento__ejercicio=ejercicio
-        ).order_by("-peso_real")[:5]
+
+        # Solo las series del atleta en este ejercicio: el filtro entra por los índices
+        # (ejercicio, entrenamiento) de DetalleEntrenamiento y (detalle, -peso_real) de
+        # SerieEjercicio, así que el coste depende del historial del atleta, no de la plataforma.
+        series = SerieEjercicio.objects.filter(
+            serie_completada(),
+            detalle_entrenamiento__ejercicio=self.object,
+            detalle_entrenamiento__entrenamiento__atleta=self.atleta,
+            peso_real__isnull=False,
+        )
+        if self.reps_min is not None:
+            series = series.filter(repeticiones_reales__gte=self.reps_min)
+        if self.reps_max is not None:
+            series = series.filter(repeticiones_reales__lte=self.reps_max)
+
+        context["atleta"] = self.atleta
+        context["n"] = self.n
+        context["reps_min"] = self.reps_min
+        context["reps_max"] = self.reps_max
+        context["series"] = series.select_related(
+            "detalle_entrenamiento__entrenamiento"
+        ).order_by("-peso_real", "-repeticiones_reales")[:self.n]
         return context
 
 
-class MarcasPersonalesListView(LoginRequiredMixin, TemplateView):
+class MarcasPersonalesListView(AtletaRequiredMixin, TemplateView):
     """
     Vista que MUESTRA los récords personales (PR) del atleta.
     La lógica de cálculo ha sido movida al modelo PerfilUsuario.
@@ -743,10 +1102,10 @@ class MarcasPersonalesListView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         
         # 1. Obtener el perfil del atleta logueado
-        perfil = self.request.user.perfil
+        perfil = self.request.perfil
         
-        # 2. Llamar al método del modelo que hace todo el trabajo
-        context['marcas'] = perfil.get_marcas_personales()
+        # 2. Llamar al método del modelo que hace todo el trabajo (cacheado por versión de datos)
+        context['marcas'] = marcas_personales_en_cache(perfil)
         
         return context
 
@@ -768,35 +1127,25 @@ def custom_logout_view(request):
 
 
 
-class EntrenamientoDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class EntrenamientoDeleteView(EntrenadorRequiredMixin, UserPassesTestMixin, ObjetoPorPeticionMixin, DeleteView):
     model = Entrenamiento
+    relaciones_objeto = ('atleta', 'entrenador', 'mesociclo')
     template_name = 'core/entrenamientos/entrenamiento_confirm_delete.html' 
     success_url = reverse_lazy('dashboard') 
 
     def test_func(self):
-        entrenamiento = self.get_object()
-        try:
-            perfil_actual = self.request.user.perfil 
-            
-            if perfil_actual.tipo != 'entrenador':
-                 return False
-                 
-            # Comparamos el PerfilUsuario del user logueado con el PerfilUsuario 
-            # guardado en entrenamiento.entrenador (que ya sabemos que es un PerfilUsuario)
-            return perfil_actual == entrenamiento.entrenador 
-            
-        except AttributeError:
-             # Este except ahora captura si el User no tiene un Perfil asociado
-             print(f"Error: El usuario {self.request.user} no tiene un PerfilUsuario asociado.")
-             return False
-        except PerfilUsuario.DoesNotExist: 
-             print(f"Error: No existe PerfilUsuario para el usuario {self.request.user}.")
-             return False
+        # El rol ya lo comprueba EntrenadorRequiredMixin: solo falta que sea SU entrenamiento
+        return self.get_object().entrenador_id == self.request.perfil.pk
 
 
-    def delete(self, request, *args, **kwargs):
-        messages.success(self.request, f"✅ Entrenamiento '{self.get_object().nombre}' eliminado correctamente.")
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        # El borrado en cascada (detalles, series, marcas y volumen) va en segundo plano
+        tarea = encolar('borrar_entrenamiento', {'entrenamiento_id': self.object.pk}, creado_por=self.request.user)
+        messages.success(
+            self.request,
+            f"🗑️ Entrenamiento '{self.object.nombre}' en cola para eliminar (tarea #{tarea.pk})."
+        )
+        return redirect(self.get_success_url())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -807,32 +1156,36 @@ class EntrenamientoDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteVie
 
 
 
-class ListaAtletasView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class ListaAtletasView(EntrenadorRequiredMixin, ListView):
     
     model = PerfilUsuario
     template_name = 'core/entrenador/lista_atletas.html'
     context_object_name = 'atletas'
 
-    def test_func(self):
-        if hasattr(self.request.user, 'perfil'):
-            return self.request.user.perfil.tipo == 'entrenador'
-        return False
-
-    def handle_no_permission(self):
-        return redirect('dashboard')
-
     def get_queryset(self):
-        entrenador_actual = self.request.user.perfil
+        entrenador_actual = self.request.perfil
         
         queryset = super().get_queryset().filter(
             tipo='atleta', 
             
             entrenador=entrenador_actual
-        )
-        return queryset
+        ).select_related('user')
+        # Actividad reciente y mesociclo en curso, anotados en la misma consulta
+        return resumen_actividad_atletas(queryset)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        # Resumen de récords de TODOS los atletas en una sola consulta (subconsulta, sin lista de ids)
+        resumenes = resumen_marcas_atletas(self.object_list.values('pk'))
+        hoy = timezone.localdate()
+        for atleta in context['atletas']:
+            atleta.resumen_marcas = resumenes.get(atleta.pk, [])
+            atleta.semana_actual = semana_mesociclo(atleta.mesociclo_inicio, hoy)
+        return context
 
 
-class AtletaRecordDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+class AtletaRecordDetailView(EntrenadorRequiredMixin, UserPassesTestMixin, ObjetoPorPeticionMixin, DetailView):
     """
     Vista de Detalle que permite a un entrenador ver los récords
     de un atleta específico.
@@ -845,29 +1198,18 @@ class AtletaRecordDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         atleta = self.get_object()
-        context['marcas'] = atleta.get_marcas_personales()
+        context['marcas'] = marcas_personales_en_cache(atleta)
         return context
 
     def test_func(self):
         """
         Función de seguridad crucial:
-        Asegura que el usuario logueado no solo sea entrenador,
-        sino que sea EL entrenador del atleta que intenta ver.
+        Asegura que el usuario logueado no solo sea entrenador
+        (EntrenadorRequiredMixin), sino que sea EL entrenador del atleta que intenta ver.
         """
-        if not hasattr(self.request.user, 'perfil'):
-            return False
-
-        perfil_entrenador = self.request.user.perfil
-        
-        # 1. ¿El usuario es un entrenador?
-        if perfil_entrenador.tipo != 'entrenador':
-            return False
-            
-        # 2. ¿El atleta que intenta ver (self.get_object()) 
-        #    es realmente un atleta DE ESTE entrenador?
         atleta_a_ver = self.get_object()
         
-        return atleta_a_ver.entrenador == perfil_entrenador
+        return atleta_a_ver.entrenador_id == self.request.perfil.pk
 
     def handle_no_permission(self):
         # Si falla el test_func, lo sacamos de aquí.
@@ -875,75 +1217,86 @@ class AtletaRecordDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView
     
 
 @method_decorator(csrf_protect, name='dispatch') 
-class ActualizarOrdenEjerciciosView(LoginRequiredMixin, View):
+class ActualizarOrdenEjerciciosView(EntrenadorRequiredMixin, View):
     """
     Vista AJAX que recibe el nuevo orden de los ejercicios (DetalleEntrenamiento)
     y actualiza sus campos 'orden' en la base de datos.
+
+    Acepta una sesión {"orden": [id, ...]} o varias a la vez
+    {"ordenes": [[id, ...], [id, ...]]}, para que el editor pueda agrupar
+    los cambios. Cada lista es el orden completo de un entrenamiento.
+    Los detalles se cargan y autorizan con una sola consulta y todos los
+    cambios se escriben con un único bulk_update.
     """
 
+    mensaje_acceso_denegado = "Acceso denegado. No eres entrenador."
+
     def post(self, request, *args, **kwargs):
-        # 1. Validar que el usuario sea un entrenador
-        if not request.user.perfil or request.user.perfil.tipo != 'entrenador':
-            return HttpResponseForbidden("Acceso denegado. No eres entrenador.")
+        # 1. El rol de entrenador lo valida EntrenadorRequiredMixin
+        perfil = request.perfil
 
         # 2. Cargar los datos enviados por AJAX
         try:
             data = json.loads(request.body)
-            detalle_ids = data.get('orden') 
-            if not isinstance(detalle_ids, list):
-                return HttpResponseBadRequest("Datos inválidos.")
         except json.JSONDecodeError:
             return HttpResponseBadRequest("Formato JSON inválido.")
-        
-        try:
-            # 3. Seguridad y Verificación de Datos
-            
-            # Obtenemos todos los detalles de una vez
-            detalles = list(DetalleEntrenamiento.objects.filter(pk__in=detalle_ids))
-            
-            if not detalles:
-                return HttpResponseBadRequest("No se encontraron ejercicios.")
-            
-            # Obtenemos el 'entrenamiento' del primer ejercicio
-            entrenamiento_base = detalles[0].entrenamiento
-            
-            # Asumimos que la propiedad del Entrenamiento viene dada por
-            # el 'entrenador' del 'atleta' asignado.
-            if entrenamiento_base.atleta.entrenador != request.user.perfil:
-                return HttpResponseForbidden("No tienes permiso para editar este entrenamiento.")
-
-            # Chequeo de integridad: ¿pertenecen todos los IDs al mismo entrenamiento?
-            if any(d.entrenamiento_id != entrenamiento_base.id for d in detalles):
-                return HttpResponseBadRequest("Los ejercicios pertenecen a entrenamientos diferentes.")
-
-            # 4. Actualizar la base de datos 
-            with transaction.atomic():
-                # Creamos un mapa de {id: instancia} 
-                detalle_map = {d.id: d for d in detalles}
-                
-                # Recorremos la lista de IDs que envió el frontend
-                for (index, detalle_id) in enumerate(detalle_ids):
-
-                    nuevo_orden = index + 1
-                    
-                    detalle = detalle_map.get(int(detalle_id))
-                    
-                    if detalle and detalle.orden != nuevo_orden:
-                        detalle.orden = nuevo_orden
-                        detalle.save(update_fields=['orden']) 
 
-            # 5. Enviar respuesta de éxito
-            return JsonResponse({"status": "ok", "message": "¡Orden actualizado!"})
-        
-        except DetalleEntrenamiento.DoesNotExist:
+        if not isinstance(data, dict):
+            return HttpResponseBadRequest("Datos inválidos.")
+        ordenes = data['ordenes'] if 'ordenes' in data else [data.get('orden')]
+        if not isinstance(ordenes, list) or not all(isinstance(orden, list) for orden in ordenes):
+            return HttpResponseBadRequest("Datos inválidos.")
+        try:
+            ordenes = [[int(pk) for pk in orden] for orden in ordenes]
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest("Datos inválidos.")
+
+        todos = [pk for orden in ordenes for pk in orden]
+        if not todos:
+            return HttpResponseBadRequest("Datos inválidos.")
+        if len(set(todos)) != len(todos):
+            return HttpResponseBadRequest("Hay ejercicios repetidos.")
+
+        # 3. Seguridad y Verificación de Datos: una sola consulta con el entrenador
+        # del atleta de cada entrenamiento (la propiedad viene dada por él)
+        detalle_map = {
+            d.pk: d for d in DetalleEntrenamiento.objects.filter(pk__in=todos).only(
+                'pk', 'orden', 'entrenamiento_id', 'ejercicio_id'
+            ).annotate(entrenador_id=F('entrenamiento__atleta__entrenador_id'))
+        }
+        if len(detalle_map) != len(todos):
             return HttpResponseBadRequest("Un ejercicio no existe.")
-        except Exception as e:
-            # Captura de error genérico
-            return JsonResponse({"status": "error", "message": str(e)}, status=500)
-        
-
-
-
+        if any(d.entrenador_id != perfil.pk for d in detalle_map.values()):
+            return HttpResponseForbidden("No tienes permiso para editar este entrenamiento.")
+
+        # Chequeo de integridad: cada lista es un único entrenamiento, distinto en cada lista
+        entrenamientos = []
+        for orden in ordenes:
+            ids = {detalle_map[pk].entrenamiento_id for pk in orden}
+            if len(ids) != 1:
+                return HttpResponseBadRequest("Los ejercicios pertenecen a entrenamientos diferentes.")
+            entrenamientos.append(ids.pop())
+        if len(set(entrenamientos)) != len(entrenamientos):
+            return HttpResponseBadRequest("Un entrenamiento aparece más de una vez.")
+
+        # 4. Actualizar la base de datos: solo los que cambian, en una sola consulta
+        cambiados = []
+        for orden in ordenes:
+            for nuevo_orden, pk in enumerate(orden, start=1):
+                detalle = detalle_map[pk]
+                if detalle.orden != nuevo_orden:
+                    detalle.orden = nuevo_orden
+                    cambiados.append(detalle)
+
+        if cambiados:
+            DetalleEntrenamiento.objects.bulk_update(cambiados, ['orden'])
+
+        # 5. Enviar respuesta de éxito
+        return JsonResponse({
+            "status": "ok",
+            "message": "¡Orden actualizado!",
+            "actualizados": len(cambiados),
+        })
 
 
 class EjercicioViewSet(viewsets.ModelViewSet):
@@ -968,7 +1321,7 @@ class EjercicioViewSet(viewsets.ModelViewSet):
 # GESTIÓN DE MESOCICLOS (PROGRAMAS)
 # -------------------------------------------------
 
-class MesocicloCreateView(LoginRequiredMixin, CreateView):
+class MesocicloCreateView(EntrenadorRequiredMixin, CreateView):
     model = Mesociclo
     form_class = MesocicloForm
     template_name = "core/mesociclos/crear.html" # Crearemos este template luego
@@ -979,7 +1332,7 @@ class MesocicloCreateView(LoginRequiredMixin, CreateView):
         return kwargs
 
     def form_valid(self, form):
-        form.instance.entrenador = self.request.user.perfil
+        form.instance.entrenador = self.request.perfil
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -997,7 +1350,7 @@ class MesocicloDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         # Organizar entrenamientos por semana para fácil visualización
         # Estructura: { 1: [EntrenoA, EntrenoB], 2: [...] }
-        entrenamientos = self.object.entrenamientos.order_by('-semana', 'dia_orden')
+        entrenamientos = self.object.entrenamientos.con_conteos().order_by('-semana', 'dia_orden')
         semanas = {}
         for entreno in entrenamientos:
             if entreno.semana not in semanas:
@@ -1005,10 +1358,21 @@ class MesocicloDetailView(LoginRequiredMixin, DetailView):
             semanas[entreno.semana].append(entreno)
         
         context['semanas_dict'] = semanas
+
+        # Volumen semana a semana, desde la tabla precalculada (sin recorrer las series)
+        volumen = volumen_semanal_mesociclo(self.object)
+        tonelaje_maximo = max((v['tonelaje'] for v in volumen.values()), default=0)
+        for datos in volumen.values():
+            datos['porcentaje'] = int(datos['tonelaje'] * 100 / tonelaje_maximo) if tonelaje_maximo else 0
+        context['volumen_semanal'] = volumen
+
+        # Formulario para copiar el programa a otros atletas (solo su entrenador)
+        if self.request.perfil is not None and self.object.entrenador_id == self.request.perfil.pk:
+            context['form_asignar'] = AsignarProgramaForm(user=self.request.user)
         return context
 
 @require_POST
-@login_required
+@entrenador_requerido
 def clonar_semana_view(request, pk):
     """
     MODIFICADO: Ahora solo clona la semana actual a la INMEDIATAMENTE siguiente.
@@ -1017,7 +1381,7 @@ def clonar_semana_view(request, pk):
     entrenamiento = get_object_or_404(Entrenamiento, pk=pk)
     
     # Seguridad
-    if entrenamiento.entrenador != request.user.perfil:
+    if entrenamiento.entrenador_id != request.perfil.pk:
         messages.error(request, "No tienes permiso.")
         return redirect('dashboard')
 
@@ -1045,4 +1409,172 @@ def clonar_semana_view(request, pk):
     except Exception as e:
         messages.error(request, f"Error al clonar: {e}")
 
-    return redirect('mesociclo_detalle', pk=entrenamiento.mesociclo.pk)
\ No newline at end of file
+    return redirect('mesociclo_detalle', pk=entrenamiento.mesociclo.pk)
+
+# -------------------------------------------------
+# CLONADO DE MESOCICLOS Y PLANTILLAS
+# -------------------------------------------------
+
+@require_POST
+@entrenador_requerido
+def clonar_mesociclo_view(request, pk):
+    """
+    Encola la copia del mesociclo completo (semanas, sesiones, ejercicios y series
+    prescritas) para los atletas seleccionados.
+    """
+    mesociclo = get_object_or_404(Mesociclo, pk=pk)
+
+    # Seguridad
+    if mesociclo.entrenador_id != request.perfil.pk:
+        messages.error(request, "No tienes permiso.")
+        return redirect('dashboard')
+
+    form = AsignarProgramaForm(request.POST, user=request.user)
+    if not form.is_valid():
+        messages.error(request, "Selecciona al menos un atleta válido.")
+        return redirect('mesociclo_detalle', pk=mesociclo.pk)
+
+    # La copia se hace en segundo plano (ver core/tareas.py)
+    tarea = encolar('asignar_programa', {
+        'mesociclo_id': mesociclo.pk,
+        'atleta_ids': [atleta.pk for atleta in form.cleaned_data['atletas']],
+        'fecha_inicio': form.cleaned_data['fecha_inicio'] and form.cleaned_data['fecha_inicio'].isoformat(),
+    }, creado_por=request.user)
+    messages.success(
+        request,
+        f"⏳ Copia del programa en cola para {len(form.cleaned_data['atletas'])} atleta(s) (tarea #{tarea.pk})."
+    )
+    return redirect('mesociclo_detalle', pk=mesociclo.pk)
+
+
+@method_decorator(csrf_protect, name='dispatch')
+class AsignarProgramaAPIView(EntrenadorRequiredMixin, View):
+    """
+    Endpoint JSON para asignar un programa a muchos atletas de una sola vez.
+
+    POST {"mesociclo": <id>, "atletas": [<id>, ...], "fecha_inicio": "AAAA-MM-DD" (opcional)}
+    Encola la tarea 'asignar_programa' (copias con inserciones en bloque, una
+    transacción por lote de atletas) y responde 202 con el id de la tarea y la URL de
+    su estado, que informa del avance lote a lote. El resultado incluye los mesociclos
+    creados (también los de intentos anteriores si la tarea se reintentó) y los atletas
+    ignorados.
+    """
+
+    mensaje_acceso_denegado = "Acceso denegado. No eres entrenador."
+
+    def post(self, request, *args, **kwargs):
+        perfil = request.perfil
+
+        try:
+            data = json.loads(request.body)
+            atleta_ids = [int(pk) for pk in data.get('atletas', [])]
+            fecha_inicio = date.fromisoformat(data['fecha_inicio']) if data.get('fecha_inicio') else None
+            mesociclo = Mesociclo.objects.filter(pk=int(data.get('mesociclo', 0)), entrenador=perfil).first()
+        except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+            return HttpResponseBadRequest("Formato JSON inválido.")
+
+        if mesociclo is None:
+            return HttpResponseForbidden("No tienes permiso sobre este mesociclo.")
+        if not atleta_ids:
+            return HttpResponseBadRequest("Indica al menos un atleta.")
+
+        # Se responde enseguida; el progreso y el resultado se consultan en 'estado'
+        tarea = encolar('asignar_programa', {
+            'mesociclo_id': mesociclo.pk,
+            'atleta_ids': atleta_ids,
+            'fecha_inicio': fecha_inicio and fecha_inicio.isoformat(),
+        }, creado_por=request.user)
+        return JsonResponse({
+            'tarea': tarea.pk,
+            'estado': reverse('tarea_estado', kwargs={'pk': tarea.pk}),
+        }, status=202)
+
+
+@require_POST
+@entrenador_requerido
+def guardar_plantilla_view(request, pk):
+    """
+    Guarda la estructura del mesociclo como plantilla reutilizable del entrenador.
+    """
+    mesociclo = get_object_or_404(Mesociclo, pk=pk)
+
+    # Seguridad
+    if mesociclo.entrenador_id != request.perfil.pk:
+        messages.error(request, "No tienes permiso.")
+        return redirect('dashboard')
+
+    plantilla = crear_plantilla_desde_mesociclo(mesociclo, request.POST.get('nombre', '').strip() or None)
+    messages.success(request, f"✅ Plantilla '{plantilla.nombre}' guardada.")
+    return redirect('plantilla_lista')
+
+
+class PlantillaListView(EntrenadorRequiredMixin, ListView):
+    """
+    Plantillas de programa del entrenador, con el formulario para asignarlas
+    a varios atletas a la vez.
+    """
+    model = PlantillaMesociclo
+    template_name = 'core/plantillas/lista.html'
+    context_object_name = 'plantillas'
+
+    def get_queryset(self):
+        return PlantillaMesociclo.objects.filter(entrenador=self.request.perfil)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['form_asignar'] = AsignarProgramaForm(user=self.request.user)
+        return context
+
+
+@require_POST
+@entrenador_requerido
+def instanciar_plantilla_view(request, pk):
+    """
+    Encola la creación de un mesociclo a partir de la plantilla para cada atleta
+    seleccionado (inserciones en bloque, una transacción por lote de atletas).
+    """
+    plantilla = get_object_or_404(PlantillaMesociclo, pk=pk)
+
+    # Seguridad
+    if plantilla.entrenador_id != request.perfil.pk:
+        messages.error(request, "No tienes permiso.")
+        return redirect('dashboard')
+
+    form = AsignarProgramaForm(request.POST, user=request.user)
+    if not form.is_valid():
+        messages.error(request, "Selecciona al menos un atleta válido.")
+        return redirect('plantilla_lista')
+
+    tarea = encolar('instanciar_plantilla', {
+        'plantilla_id': plantilla.pk,
+        'atleta_ids': [atleta.pk for atleta in form.cleaned_data['atletas']],
+        'fecha_inicio': form.cleaned_data['fecha_inicio'] and form.cleaned_data['fecha_inicio'].isoformat(),
+    }, creado_por=request.user)
+    messages.success(
+        request,
+        f"⏳ '{plantilla.nombre}' en cola para {len(form.cleaned_data['atletas'])} atleta(s) (tarea #{tarea.pk})."
+    )
+    return redirect('plantilla_lista')
+
+
+class TareaEstadoView(LoginRequiredMixin, View):
+    """
+    Estado en JSON de una tarea en segundo plano encolada por el usuario.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        tarea = get_object_or_404(Tarea, pk=pk, creado_por=request.user)
+        return JsonResponse({
+            'id': tarea.pk,
+            'tipo': tarea.tipo,
+            'estado': tarea.estado,
+            'intentos': tarea.intentos,
+            # Avance de las tareas por lotes (None hasta terminar el primer lote)
+            'hechos': tarea.hechos,
+            'total': tarea.total,
+            'resultado': tarea.resultado,
+            # Solo la última línea de la traza: el detalle queda en el admin
+            'error': tarea.error.strip().splitlines()[-1] if tarea.error else None,
+            'creada': tarea.created_at.isoformat(),
+            'terminada': tarea.terminada_en.isoformat() if tarea.terminada_en else None,
+        })
@@ -0,0 +1,66 @@
+// frontend/colaRegistro.js
+// Cola persistente (IndexedDB) de las series registradas por el atleta que aún no
+// se han enviado al servidor. Sobrevive a recargas y a cierres del navegador.
+// Cada operación: {clave, atleta, id, version, registrado_en, peso_real?, repeticiones_reales?, rpe_real?}
+// Las que el servidor no aplicó se guardan además con {estado, serie, errores}.
+
+const BASE_DATOS = 'notegym-registro';
+const ALMACEN = 'operaciones';
+
+// Sin IndexedDB (modo privado en algunos navegadores) la cola vive solo en memoria
+const memoria = new Map();
+const hayIndexedDB = typeof indexedDB !== 'undefined';
+
+function abrir() {
+    return new Promise((resolve, reject) => {
+        const peticion = indexedDB.open(BASE_DATOS, 1);
+        peticion.onupgradeneeded = () => {
+            peticion.result.createObjectStore(ALMACEN, { keyPath: 'clave' });
+        };
+        peticion.onsuccess = () => resolve(peticion.result);
+        peticion.onerror = () => reject(peticion.error);
+    });
+}
+
+function transaccion(modo, operacion) {
+    return abrir().then(db => new Promise((resolve, reject) => {
+        const tx = db.transaction(ALMACEN, modo);
+        const peticion = operacion(tx.objectStore(ALMACEN));
+        tx.oncomplete = () => {
+            db.close();
+            resolve(peticion ? peticion.result : undefined);
+        };
+        tx.onerror = tx.onabort = () => {
+            db.close();
+            reject(tx.error);
+        };
+    }));
+}
+
+export function guardar(operacion) {
+    if (!hayIndexedDB) {
+        memoria.set(operacion.clave, operacion);
+        return Promise.resolve();
+    }
+    return transaccion('readwrite', almacen => almacen.put(operacion));
+}
+
+export function pendientes(atleta) {
+    const todas = hayIndexedDB
+        ? transaccion('readonly', almacen => almacen.getAll())
+        : Promise.resolve([...memoria.values()]);
+    // Solo las del atleta con sesión iniciada (el dispositivo puede ser compartido)
+    return todas.then(operaciones => operaciones
+        .filter(op => op.atleta === atleta)
+        .sort((a, b) => a.registrado_en.localeCompare(b.registrado_en)));
+}
+
+export function quitar(claves) {
+    if (!hayIndexedDB) {
+        claves.forEach(clave => memoria.delete(clave));
+        return Promise.resolve();
+    }
+    return transaccion('readwrite', almacen => {
+        claves.forEach(clave => almacen.delete(clave));
+    });
+}
@@ -0,0 +1,209 @@
+// frontend/registroOffline.js
+// Registro de series del atleta con modo sin conexión (templates/core/atleta/detalle_rutina.html).
+//
+// 1. Cada serie se guarda en la cola local (IndexedDB) en cuanto el atleta la completa.
+// 2. La cola se envía en lotes al endpoint de sincronización cuando hay conexión; el
+//    servidor aplica cada lote en una transacción. Cada operación lleva la versión de
+//    la serie que vio el atleta (data-version): si ya no coincide, gana el servidor.
+//    Las operaciones en conflicto o con error se quedan en la cola, marcadas con su
+//    estado y sin reenviarse, hasta que el atleta vuelve a registrar esa serie.
+// 3. El service worker (/sw.js) guarda la página para poder abrirla sin conexión.
+import { guardar, pendientes, quitar } from './colaRegistro.js';
+
+const CAMPOS = ['peso_real', 'repeticiones_reales', 'rpe_real'];
+const TAMANO_LOTE = 500;
+const ESPERA_MAXIMA = 30000;
+
+const form = document.getElementById('registro-entrenamiento-form');
+if (form) {
+    iniciar(form);
+}
+
+function nuevaClave() {
+    // randomUUID solo existe en contextos seguros (https o localhost)
+    return crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+function iniciar(form) {
+    const url = form.dataset.sincronizarUrl;
+    const atleta = form.dataset.atleta;
+    const csrf = form.querySelector('[name=csrfmiddlewaretoken]').value;
+    const filas = new Map([...form.querySelectorAll('.serie-registro')].map(fila => [Number(fila.dataset.serieId), fila]));
+    const esperas = new Map();
+
+    let enviando = false;
+    let repetir = false;
+    let reintento = null;
+    let intentos = 0;
+
+    function marcar(id, texto, clase, titulo = '') {
+        const fila = filas.get(id);
+        if (!fila) return;
+        const estado = fila.querySelector('.estado-autoguardado');
+        estado.textContent = texto;
+        estado.className = `estado-autoguardado block text-[10px] leading-3 mt-1 ${clase}`;
+        fila.title = titulo;
+    }
+
+    function datosFila(fila) {
+        const datos = {};
+        fila.querySelectorAll('input').forEach(input => {
+            const campo = input.name.split('-').pop();
+            // Vacío = sin cambios, igual que al enviar el formulario completo
+            if (CAMPOS.includes(campo) && input.value !== '') datos[campo] = input.value;
+        });
+        return datos;
+    }
+
+    function mostrarResultado(resultado, id) {
+        if (resultado.estado === 'aplicada' || resultado.estado === 'repetida') {
+            marcar(id, '✓', 'text-green-600');
+        } else if (resultado.estado === 'conflicto') {
+            const serie = resultado.serie;
+            marcar(id, '↺', 'text-amber-600',
+                `Ya había un registro más reciente: ${serie.peso_real ?? '-'} kg x ${serie.repeticiones_reales ?? '-'}. ` +
+                'Vuelve a registrar la serie para guardar tus valores.');
+        } else {
+            marcar(id, '⚠️', 'text-red-600', (resultado.errores || []).join(' '));
+        }
+    }
+
+    function esHecha(resultado) {
+        return resultado.estado === 'aplicada' || resultado.estado === 'repetida';
+    }
+
+    // Versión de la serie que conoce la página; la actualizan las respuestas del servidor
+    function actualizarVersion(id, serie) {
+        const fila = filas.get(id);
+        if (fila && serie && serie.version) fila.dataset.version = serie.version;
+    }
+
+    // Las operaciones aún sin enviar que partían de una versión que acabamos de
+    // reemplazar nosotros mismos pasan a la nueva (no son un conflicto)
+    async function rebasar(cambios, restantes) {
+        const rebasada = op => {
+            const cambio = cambios.get(op.id);
+            return !op.estado && cambio && op.version === cambio.anterior;
+        };
+        restantes.filter(rebasada).forEach(op => { op.version = cambios.get(op.id).nueva; });
+        for (const op of (await pendientes(atleta)).filter(rebasada)) {
+            await guardar({ ...op, version: cambios.get(op.id).nueva });
+        }
+    }
+
+    function programarReintento() {
+        clearTimeout(reintento);
+        reintento = setTimeout(sincronizar, Math.min(ESPERA_MAXIMA, 1000 * 2 ** intentos));
+        intentos += 1;
+    }
+
+    async function sincronizar() {
+        if (enviando) {
+            repetir = true;
+            return;
+        }
+        if (!navigator.onLine) return;
+
+        enviando = true;
+        try {
+            // Las marcadas con conflicto o error esperan a que el atleta vuelva a registrar la serie
+            const operaciones = (await pendientes(atleta)).filter(op => !op.estado);
+            for (let inicio = 0; inicio < operaciones.length; inicio += TAMANO_LOTE) {
+                const lote = operaciones.slice(inicio, inicio + TAMANO_LOTE);
+                const respuesta = await fetch(url, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrf },
+                    body: JSON.stringify({ operaciones: lote.map(({ atleta: _, ...op }) => op) }),
+                });
+                if (!respuesta.ok) throw new Error(respuesta.status);
+
+                const { resultados } = await respuesta.json();
+                const porClave = new Map(lote.map(op => [op.clave, op]));
+                const cambios = new Map();
+                await quitar(resultados.filter(esHecha).map(resultado => resultado.clave));
+                for (const resultado of resultados) {
+                    const op = porClave.get(resultado.clave);
+                    if (resultado.estado === 'aplicada' && resultado.serie.version !== op.version) {
+                        cambios.set(op.id, { anterior: op.version, nueva: resultado.serie.version });
+                    }
+                    if (!esHecha(resultado)) {
+                        await guardar({ ...op, estado: resultado.estado, serie: resultado.serie, errores: resultado.errores });
+                    }
+                    actualizarVersion(op.id, resultado.serie);
+                    mostrarResultado(resultado, op.id);
+                }
+                await rebasar(cambios, operaciones.slice(inicio + TAMANO_LOTE));
+            }
+            intentos = 0;
+        } catch (error) {
+            // Sin conexión o error del servidor: la cola sigue intacta y se reintenta más tarde
+            programarReintento();
+        } finally {
+            enviando = false;
+            if (repetir) {
+                repetir = false;
+                sincronizar();
+            }
+        }
+    }
+
+    // Cada fila se encola al cambiar (agrupando peso, reps y RPE tecleados seguidos)
+    filas.forEach((fila, id) => {
+        fila.addEventListener('change', () => {
+            clearTimeout(esperas.get(id));
+            esperas.set(id, setTimeout(async () => {
+                const datos = datosFila(fila);
+                if (!Object.keys(datos).length) return;
+                // El nuevo registro sustituye a los que quedaron en conflicto o con error
+                const superadas = (await pendientes(atleta)).filter(op => op.id === id && op.estado);
+                await quitar(superadas.map(op => op.clave));
+                await guardar({
+                    clave: nuevaClave(), atleta, id, version: fila.dataset.version,
+                    registrado_en: new Date().toISOString(), ...datos,
+                });
+                marcar(id, navigator.onLine ? '…' : '⏳', 'text-gray-400', 'Pendiente de enviar');
+                sincronizar();
+            }, 400));
+        });
+    });
+
+    // Al abrir la página (también desde la caché sin conexión) se recupera lo pendiente
+    pendientes(atleta).then(operaciones => {
+        operaciones.forEach(op => {
+            const fila = filas.get(op.id);
+            if (!fila) return;
+            fila.querySelectorAll('input').forEach(input => {
+                const campo = input.name.split('-').pop();
+                if (CAMPOS.includes(campo) && op[campo] !== undefined) input.value = op[campo];
+            });
+            if (op.estado) {
+                // La página puede venir de la caché: la versión buena es la que devolvió el servidor
+                actualizarVersion(op.id, op.serie);
+                mostrarResultado(op, op.id);
+            } else {
+                marcar(op.id, '⏳', 'text-gray-400', 'Pendiente de enviar');
+            }
+        });
+        sincronizar();
+    });
+
+    window.addEventListener('online', () => {
+        intentos = 0;
+        sincronizar();
+    });
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') sincronizar();
+    });
+
+    // Sin conexión el envío completo fallaría: las series ya están a salvo en la cola
+    form.addEventListener('submit', event => {
+        if (!navigator.onLine) {
+            event.preventDefault();
+            alert('Sin conexión: tus series están guardadas en el dispositivo y se enviarán al recuperar la conexión.');
+        }
+    });
+
+    if ('serviceWorker' in navigator && form.dataset.serviceWorker) {
+        navigator.serviceWorker.register(form.dataset.serviceWorker, { scope: '/' }).catch(() => {});
+    }
+}
@@ -0,0 +1,54 @@
+// Service worker de NoteGym (servido en /sw.js para controlar todo el sitio).
+// Permite abrir sin conexión las rutinas del atleta ya visitadas. Las series se
+// guardan en IndexedDB desde la propia página (frontend/registroOffline.js) y se
+// sincronizan al recuperar la conexión; aquí solo se cachean páginas y estáticos.
+const CACHE = 'notegym-v1';
+const RUTINA = /^\/rutina\/\d+\/$/;
+const CDN = ['https://cdn.tailwindcss.com'];
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(claves => Promise.all(claves.filter(clave => clave !== CACHE).map(clave => caches.delete(clave))))
+            .then(() => self.clients.claim())
+    );
+});
+
+// Red primero y, si falla, la última copia guardada
+function redPrimero(peticion) {
+    return fetch(peticion).then(respuesta => {
+        // Los scripts del CDN llegan como respuestas opacas (sin CORS)
+        if ((respuesta.ok || respuesta.type === 'opaque') && !respuesta.redirected) {
+            const copia = respuesta.clone();
+            caches.open(CACHE).then(cache => cache.put(peticion, copia));
+        }
+        return respuesta;
+    }).catch(() => caches.match(peticion).then(guardada => guardada || Response.error()));
+}
+
+// Caché primero (estáticos con nombre versionado)
+function cachePrimero(peticion) {
+    return caches.match(peticion).then(guardada => guardada || fetch(peticion).then(respuesta => {
+        if (respuesta.ok || respuesta.type === 'opaque') {
+            const copia = respuesta.clone();
+            caches.open(CACHE).then(cache => cache.put(peticion, copia));
+        }
+        return respuesta;
+    }));
+}
+
+self.addEventListener('fetch', event => {
+    const peticion = event.request;
+    if (peticion.method !== 'GET') return;
+
+    const url = new URL(peticion.url);
+    if (url.origin === self.location.origin && RUTINA.test(url.pathname)) {
+        event.respondWith(redPrimero(peticion));
+    } else if (url.origin === self.location.origin && url.pathname.startsWith('/static/')) {
+        event.respondWith(cachePrimero(peticion));
+    } else if (CDN.some(origen => peticion.url.startsWith(origen))) {
+        event.respondWith(redPrimero(peticion));
+    }
+});
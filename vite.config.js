@@ -15,7 +15,7 @@ export default defineConfig({
     emptyOutDir: true, 
     
     rollupOptions: {
-      input: 'frontend/main.jsx' 
+      input: ['frontend/main.jsx', 'frontend/registroOffline.js']
     }
   },
   